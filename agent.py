@@ -5,7 +5,8 @@ import requests
 import textwrap
 import time
 from datetime import date
-from langchain_ollama import ChatOllama
+
+from llm_steps import compact_history, make_step_llm, stream_step
 
 # ── 1. Open-Meteo weather-code lookup ──────────────────────────────────────
 WEATHER_CODES = {
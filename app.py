@@ -11,13 +11,15 @@ import streamlit as st
 import time
 import json
 import os
-import pandas as pd
 from pathlib import Path
 import sys
 from typing import Optional, Tuple, Dict, Any
-import requests
+from urllib.request import urlopen
 import logging
 
+# pandas is imported where a table is built, not on every page render;
+# the MCP health check uses the standard library instead of requests.
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -144,6 +146,7 @@ def embedded_process_query(user_query: str, office_data: list) -> str:
     classification = embedded_classify_query(user_query)
     query_type = classification["suggested_query"]
     
+    import pandas as pd
     df = pd.DataFrame(office_data)
     
     if query_type == "revenue_stats":
@@ -243,13 +246,14 @@ class MCPManager:
         self.mcp_available = False
         self.mcp_endpoint = "http://127.0.0.1:8000/mcp/"
         self.fallback_endpoint = None  # Could be a remote MCP server
+        self.session = None            # Shared MCPSession, opened on first query
         self.check_connection()
     
     def check_connection(self) -> bool:
         """Check if MCP server is available."""
         try:
-            response = requests.get(self.mcp_endpoint, timeout=2)
-            self.mcp_available = response.status_code == 200
+            with urlopen(self.mcp_endpoint, timeout=2) as response:
+                self.mcp_available = response.status == 200
             return self.mcp_available
         except:
             self.mcp_available = False
@@ -259,13 +263,18 @@ class MCPManager:
         """Process query using MCP server."""
         try:
             # Import here to avoid dependency issues
-            from fastmcp import Client
+            from mcp_session import get_session, run_shared
             
-            async with Client(self.mcp_endpoint) as mcp:
-                # This would use the original classification logic
-                # For now, fall back to embedded version
-                result = embedded_process_query(user_query, SAMPLE_OFFICE_DATA)
-                return result, "mcp_server"
+            # One persistent session on a background loop: Streamlit reruns
+            # (and each asyncio.run) would otherwise reconnect per query.
+            if self.session is None:
+                self.session = get_session(self.mcp_endpoint)
+            await run_shared(self.session.list_tools())   # cached after the first query
+
+            # This would use the original classification logic
+            # For now, fall back to embedded version
+            result = embedded_process_query(user_query, SAMPLE_OFFICE_DATA)
+            return result, "mcp_server"
                 
         except Exception as e:
             logger.warning(f"MCP processing failed: {e}")
@@ -362,6 +371,7 @@ def main():
 
         st.header("Office Data")
         with st.expander("View Sample Data"):
+            import pandas as pd
             df = pd.DataFrame(get_office_data())
             st.dataframe(df, use_container_width=True)
         
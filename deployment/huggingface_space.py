@@ -17,7 +17,6 @@ import time
 import signal
 import subprocess
 import threading
-import requests
 from pathlib import Path
 
 # Configuration
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+llm_steps.py
+────────────────────────────────────────────────────────────────────
+Shared helpers for generating one Thought / Action / Args step of a
+TAO agent loop with Ollama.  Used by agent.py, mcp_agent.py and
+rag_agent.py.
+
+Step limits
+-----------
+Left alone, llama3.2 keeps writing after its Action — usually an
+invented ``Observation:`` line and a whole extra step that the agents'
+regexes then throw away.  Clients built with :func:`make_step_llm` stop
+at ``\nObservation:`` and are capped at STEP_MAX_TOKENS per step.
+``num_ctx`` and ``keep_alive`` can be pinned (OLLAMA_NUM_CTX /
+OLLAMA_KEEP_ALIVE) so every client shares one loaded model instance.
+
+Prefix reuse
+------------
+Ollama only skips re-evaluating a prompt prefix that is byte-identical
+to the previous request's, and only while the model stays loaded.  So
+the agents keep one step client per session (kept alive for
+KEEP_ALIVE), a constant system prompt first, and a history that is
+only appended to.  Once a history grows past HISTORY_MAX_CHARS,
+:func:`compact_history` folds the oldest steps into one running summary
+message — a single, deliberate prefix break instead of a slow prompt
+on every step.  With TAO_TIMINGS=1 every step prints its prompt-eval
+and generation times; a warm prefix shows up as a prompt-eval time far
+below the first step's.
+
+Streaming
+---------
+Instead of waiting for the whole completion with ``llm.invoke()``, a
+step is streamed with ``ChatOllama.stream`` / ``astream``:
+
+* tokens are echoed as they arrive, so a ``Final:`` answer appears
+  token-by-token and the first output shows up almost immediately;
+* the text is watched for ``Args: {...}`` and the step is cut off
+  the moment the JSON's closing brace arrives: nothing the model
+  writes after its action is echoed or kept.  A ``DONE`` step is not
+  cut, since it may carry a ``Final:`` summary after its Args.
+* the stream is closed at the cut, so the tool is dispatched while
+  the model would still be writing; the step is timed on the client
+  clock.  Only with TAO_TIMINGS=1 is the rest of the stream read
+  silently up to Ollama's final chunk (the ``\nObservation:`` stop and
+  STEP_MAX_TOKENS end it server-side), so the printed timings carry the
+  server's own prompt-eval counters — a warm prefix shows up as a drop
+  in ``prompt_eval_count``, not just as a faster first token.
+
+Lazy clients
+------------
+:func:`make_llm` returns a :class:`LazyChatOllama`: langchain_ollama is
+only imported, and the client built, when it is first used — so the
+agents' module-level clients don't slow down their start.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from langchain_ollama import ChatOllama
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Client configuration                                         ║
+# ╚════════════════════════════════════════════════════════════════╝
+STOP_SEQUENCES  = ["\nObservation:"]     # the model must wait for the real one
+STEP_MAX_TOKENS = int(os.getenv("TAO_STEP_MAX_TOKENS", "256"))
+NUM_CTX         = os.getenv("OLLAMA_NUM_CTX")      # e.g. "4096"; None = model default
+KEEP_ALIVE      = os.getenv("OLLAMA_KEEP_ALIVE", "30m")   # keep the session's model (and KV cache) warm
+SHOW_TIMINGS    = os.getenv("TAO_TIMINGS", "0") == "1"     # print per-step prompt-eval / eval times
+
+# History compaction (0 = never compact)
+HISTORY_MAX_CHARS = int(os.getenv("TAO_HISTORY_MAX_CHARS", "0"))
+KEEP_RECENT_STEPS = 2                  # steps always kept verbatim
+SUMMARY_OBS_CHARS = 160                # per-observation budget inside the summary
+SUMMARY_HEADER    = "Summary of earlier steps:"
+
+# Start of the Args JSON object / action name (same keywords as the agents' regexes)
+ARGS_START_RE = re.compile(r"Args:\s*\{", re.IGNORECASE)
+ACTION_RE     = re.compile(r"Action:\s*(\w+)", re.IGNORECASE)
+
+
+class LazyChatOllama:
+    """
+    Stand-in for a ``ChatOllama`` that is only built on first use.
+
+    Importing langchain_ollama takes longer than starting the rest of an
+    agent, so module-level clients (``llm = make_step_llm(...)``) cost
+    nothing until the first question — ``--help`` and REPL start stay
+    instant.  Attribute access is forwarded to the real client, which is
+    built once even if several threads reach it at the same time.
+    """
+
+    def __init__(self, model: str, options: dict[str, Any]) -> None:
+        self.model = model
+        self.options = options
+        self._client: ChatOllama | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ChatOllama:
+        """The real client (imported and built on the first call)."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from langchain_ollama import ChatOllama
+                    self._client = ChatOllama(model=self.model, **self.options)
+        return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+
+def make_llm(model: str = "llama3.2", **overrides: Any) -> LazyChatOllama:
+    """
+    Build a deterministic ChatOllama client with the shared num_ctx /
+    keep_alive pins applied.  `overrides` are passed straight through
+    (e.g. ``num_predict=16`` for a one-word answer).  The client itself
+    is created on first use (see :class:`LazyChatOllama`).
+    """
+    options: dict[str, Any] = {"temperature": 0.0}
+    if NUM_CTX:
+        options["num_ctx"] = int(NUM_CTX)
+    if KEEP_ALIVE:
+        options["keep_alive"] = int(KEEP_ALIVE) if KEEP_ALIVE.lstrip("-").isdigit() else KEEP_ALIVE
+    options.update(overrides)
+    return LazyChatOllama(model, options)
+
+
+def make_step_llm(model: str = "llama3.2", max_tokens: int = STEP_MAX_TOKENS) -> LazyChatOllama:
+    """ChatOllama client for TAO steps: stops at ``\nObservation:``, capped at `max_tokens`."""
+    return make_llm(model, stop=STOP_SEQUENCES, num_predict=max_tokens)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Incremental Args parsing                                     ║
+# ╚════════════════════════════════════════════════════════════════╝
+def args_end(text: str) -> int:
+    """
+    Return the index just past the closing brace of the ``Args:`` JSON
+    object in `text`, or -1 if the object is not complete yet.
+
+    Braces inside JSON strings (and escaped quotes) are ignored, so
+    ``{"name": "a}b"}`` is matched correctly.
+    """
+    match = ARGS_START_RE.search(text)
+    if not match:
+        return -1
+
+    depth, in_string, escaped = 0, False, False
+    for i in range(match.end() - 1, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+
+def step_end(text: str) -> int:
+    """
+    Where a streamed step can be cut off: just past its Args object, or
+    -1 to keep going (Args incomplete, or a DONE step that may still be
+    followed by a ``Final:`` summary).
+    """
+    end = args_end(text)
+    if end == -1:
+        return -1
+    action = ACTION_RE.search(text)
+    if action and action.group(1).lower() == "done":
+        return -1
+    return end
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Step timings                                                 ║
+# ╚════════════════════════════════════════════════════════════════╝
+@dataclass
+class StepTiming:
+    """
+    Prompt-eval and generation time of one step.
+
+    ``source`` is ``"ollama"`` when the server's final chunk carried its
+    own counters, or ``"client"`` when it was not read (the step was cut
+    off without TAO_TIMINGS=1, or the stream broke off) or the backend
+    reports none; then prompt-eval is the time to the first token
+    (including HTTP overhead) and tokens are counted as chunks.
+    """
+
+    prompt_tokens: int | None
+    prompt_eval_ms: float
+    eval_tokens: int
+    eval_ms: float
+    source: str
+
+    def __str__(self) -> str:
+        prompt = f"{self.prompt_tokens} tok / " if self.prompt_tokens is not None else ""
+        return (f"⏱  prompt-eval {prompt}{self.prompt_eval_ms:.0f} ms · "
+                f"eval {self.eval_tokens} tok / {self.eval_ms:.0f} ms ({self.source})")
+
+
+class _StepReader:
+    """Accumulates a streamed step, echoes it and records its timing."""
+
+    def __init__(self, echo: bool) -> None:
+        self.echo = echo
+        self.text = ""
+        self.chunks = 0
+        self.meta: dict[str, Any] = {}
+        self.started = time.perf_counter()
+        self.first_token: float | None = None
+        self.cut = False                 # step text complete; only waiting for the counters
+        self.drain = SHOW_TIMINGS        # read on to the final chunk for its counters
+
+    def feed(self, chunk: Any) -> bool:
+        """Add one chunk; return True once nothing more is needed from the stream."""
+        if self.cut:
+            # Past the Args object: keep only the final chunk's counters
+            self.meta.update(getattr(chunk, "response_metadata", None) or {})
+            return bool(self.meta.get("done")) or "eval_duration" in self.meta
+        if chunk.content:
+            self.chunks += 1
+            if self.first_token is None:
+                self.first_token = time.perf_counter()
+        self.meta.update(getattr(chunk, "response_metadata", None) or {})
+        self.text += chunk.content
+        end = step_end(self.text)
+        if self.echo:
+            # Never print past the Args object, even within a chunk
+            printed = len(self.text) - len(chunk.content)
+            print(self.text[printed:end if end != -1 else None], end="", flush=True)
+        if end != -1:
+            self.text = self.text[:end]
+            self.cut = True
+            return not self.drain
+        return False
+
+    def finish(self, timings: list[StepTiming] | None) -> str:
+        finished = time.perf_counter()
+        if "eval_duration" in self.meta:
+            timing = StepTiming(
+                prompt_tokens=self.meta.get("prompt_eval_count"),
+                prompt_eval_ms=self.meta.get("prompt_eval_duration", 0) / 1e6,
+                eval_tokens=self.meta.get("eval_count", self.chunks),
+                eval_ms=self.meta["eval_duration"] / 1e6,
+                source="ollama",
+            )
+        else:
+            first = self.first_token or finished
+            timing = StepTiming(
+                prompt_tokens=None,
+                prompt_eval_ms=(first - self.started) * 1000,
+                eval_tokens=self.chunks,
+                eval_ms=(finished - first) * 1000,
+                source="client",
+            )
+        if timings is not None:
+            timings.append(timing)
+        if self.echo:
+            print()
+            if SHOW_TIMINGS:
+                print(timing)
+        return self.text
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Step generation (sync + async)                               ║
+# ╚════════════════════════════════════════════════════════════════╝
+def stream_step(llm: Any, messages: list, echo: bool = True,
+                timings: list[StepTiming] | None = None) -> str:
+    """
+    Stream one TAO step from `llm` and return its text.
+
+    The step ends as soon as the ``Args`` JSON is complete (except for
+    DONE steps): the returned text ends at that closing brace and the
+    stream is closed there (with TAO_TIMINGS=1, the rest is first read
+    for Ollama's final counters).
+    With `echo`, tokens are printed as they arrive.  If `timings` is
+    given, the step's :class:`StepTiming` is appended to it.
+    """
+    reader = _StepReader(echo)
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            if reader.feed(chunk):
+                break
+    finally:
+        stream.close()            # at the cut, after the done chunk, or on an error
+    return reader.finish(timings)
+
+
+async def astream_step(llm: Any, messages: list, echo: bool = True,
+                       timings: list[StepTiming] | None = None) -> str:
+    """Async twin of :func:`stream_step` built on ``llm.astream``."""
+    reader = _StepReader(echo)
+    stream = llm.astream(messages)
+    try:
+        async for chunk in stream:
+            if reader.feed(chunk):
+                break
+    finally:
+        await stream.aclose()
+    return reader.finish(timings)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 5.  History compaction                                           ║
+# ╚════════════════════════════════════════════════════════════════╝
+def compact_history(messages: list[dict], max_chars: int = HISTORY_MAX_CHARS,
+                    keep_recent: int = KEEP_RECENT_STEPS) -> bool:
+    """
+    Fold old Action / Observation pairs into one summary message.
+
+    `messages` is ``[system, question, (summary), assistant, observation,
+    …]``.  When its total size exceeds `max_chars`, every pair but the
+    last `keep_recent` is reduced to a ``- tool → observation`` line in a
+    running summary placed right after the question, and dropped.  The
+    system prompt and question are never touched, so their cached prefix
+    survives.  Works in place; returns True if anything was compacted.
+    """
+    if max_chars <= 0 or sum(len(m["content"]) for m in messages) <= max_chars:
+        return False
+    start = next((i for i, m in enumerate(messages) if m["role"] == "assistant"), None)
+    if start is None:
+        return False
+    steps = messages[start:]
+    n_old = len(steps) - 2 * keep_recent
+    if n_old < 2:
+        return False
+
+    lines = []
+    for step, obs in zip(steps[:n_old:2], steps[1:n_old:2]):
+        action = ACTION_RE.search(step["content"])
+        text = obs["content"].removeprefix("Observation:").strip()
+        if len(text) > SUMMARY_OBS_CHARS:
+            text = text[:SUMMARY_OBS_CHARS] + "…"
+        lines.append(f"- {action.group(1) if action else 'step'} → {text}")
+
+    head = messages[:start]
+    if head[-1]["content"].startswith(SUMMARY_HEADER):
+        head[-1] = {"role": "user", "content": head[-1]["content"] + "\n" + "\n".join(lines)}
+    else:
+        head.append({"role": "user", "content": SUMMARY_HEADER + "\n" + "\n".join(lines)})
+    messages[:] = head + steps[n_old:]
+    return True
@@ -15,9 +15,10 @@ import re
 import textwrap
 from typing import Optional, Dict, Any
 
-from fastmcp import Client
 from fastmcp.exceptions import ToolError
-from langchain_ollama import ChatOllama
+
+from llm_steps import astream_step, compact_history, make_llm, make_step_llm
+from mcp_session import MCPSession
 
 # Instead of hardcoding tool definitions, we discover them from the
 # MCP server at runtime and inject them into this template.
@@ -62,7 +63,7 @@ def unwrap(obj):
 # ╚══════════════════════════════════════════════════════════════════╝
 # Uses a separate LLM call to extract city names from natural language.
 # This handles inputs like "What's the weather in Paris?" → "Paris"
-extract_llm = ChatOllama(model="llama3.2", temperature=0.0)
+extract_llm = make_llm("llama3.2", num_predict=16)   # a city name is a few tokens
 
 def extract_city(prompt: str) -> Optional[str]:
     """Extract city name from natural language using LLM."""
@@ -77,9 +78,14 @@ def extract_city(prompt: str) -> Optional[str]:
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║ 4.  Dynamic TAO loop with LLM-controlled tool selection          ║
 # ╚══════════════════════════════════════════════════════════════════╝
-    llm = ChatOllama(model="llama3.2", temperature=0.0)
+# One step client for the whole REPL session, so the model — and the
+# cached system-prompt prefix — stays warm between questions.
+llm = make_step_llm("llama3.2")
+
+# One MCP connection (and cached tool catalog) for the whole session
+session = MCPSession("http://127.0.0.1:8000/mcp/")
 
-    async with Client("http://127.0.0.1:8000/mcp/") as mcp:
+    async with session as mcp:       # reuses the open connection
         # TODO: Discover tools from MCP server using mcp.list_tools()
         #       and build system_prompt from SYSTEM_TEMPLATE
         messages = [
@@ -152,6 +158,13 @@ def extract_city(prompt: str) -> Optional[str]:
             elif action == "get_weather" and isinstance(result, dict):
                 context["temperature_c"] = result.get("temperature")
                 context["conditions"] = result.get("conditions")
+            elif action == "weather_for_place" and isinstance(result, dict):
+                context["latitude"] = result.get("latitude")
+                context["longitude"] = result.get("longitude")
+                context["location_name"] = result.get("name", city)
+                context["temperature_c"] = result.get("temperature_c")
+                context["temperature_f"] = result.get("temperature_f")
+                context["conditions"] = result.get("conditions")
             elif action == "convert_c_to_f":
                 context["temperature_f"] = float(result)           
         # Max steps reached
@@ -164,6 +177,25 @@ def extract_city(prompt: str) -> Optional[str]:
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║ 5.  Interactive REPL                                             ║
 # ╚══════════════════════════════════════════════════════════════════╝
+async def repl() -> None:
+    """Answer questions on one event loop, so the MCP session stays open."""
+    try:
+        while True:
+            raw_prompt = (await asyncio.to_thread(input, "Ask about the weather: ")).strip()
+            if raw_prompt.lower() == "exit":
+                break
+
+            city = await asyncio.to_thread(extract_city, raw_prompt)
+            if not city or len(city) < 3:
+                print("❌ No city detected; please try again.\n")
+                continue
+
+            print(f"\n🔍 Detected city: {city}")
+            await run_dynamic(city)
+            print()
+    finally:
+        await session.close()
+
 if __name__ == "__main__":
     print("="*60)
     print("Dynamic Weather TAO Agent")
@@ -172,16 +204,4 @@ if __name__ == "__main__":
     print("The LLM decides which tools to call and when to stop.\n")
     print("Type 'exit' to quit\n")
 
-    while True:
-        raw_prompt = input("Ask about the weather: ").strip()
-        if raw_prompt.lower() == "exit":
-            break
-
-        city = extract_city(raw_prompt)
-        if not city or len(city) < 3:
-            print("❌ No city detected; please try again.\n")
-            continue
-
-        print(f"\n🔍 Detected city: {city}")
-        asyncio.run(run_dynamic(city))
-        print()
+    asyncio.run(repl())
@@ -9,13 +9,33 @@ Tools Provided
 1. get_weather(lat, lon) → dict with temperature °C, WMO code, conditions
 2. convert_c_to_f(c) → float (temperature in °F)
 3. geocode_location(name) → dict with latitude, longitude, location name
+4. get_cache_stats() → dict with hit/miss counters for the response caches
+5. get_weather_many(coords) → list of get_weather results, one per (lat, lon)
+6. geocode_many(names) → list of geocode_location results, one per name
+7. weather_for_place(name) → dict with coordinates, conditions, °C and °F
 
 Key Features
 ------------
-* **Robust Retry Logic**: All API calls retry up to 3 times with exponential
-  backoff (1.5s, 2.25s) on transient errors (429, 5xx)
-* **Fresh Connections**: Each retry creates a new session to avoid connection
-  pool issues that can cause persistent failures
+* **Robust Retry Logic**: All API calls retry up to 3 times with jittered
+  exponential backoff on transient errors (429, 5xx), limited by a shared
+  retry budget so an outage can't turn into a retry storm
+* **Circuit Breaker**: After repeated failures a host's breaker opens and
+  calls fail fast (serving stale cached weather when there is any) until
+  a half-open probe shows the host has recovered
+* **Async, Pooled Connections**: Tools are async and share one long-lived,
+  bounded keep-alive connection pool per upstream host, so a slow call
+  never blocks other clients and TLS handshakes are reused across calls
+* **Weather Cache**: get_weather answers are cached per ~1 km grid cell
+  for a few minutes (bounded LRU), and concurrent misses for the same
+  cell collapse into a single upstream request
+* **Persistent Geocode Store**: geocode_location answers from an on-disk
+  SQLite table (pre-seeded with the office cities) and only goes to the
+  network for true misses, so the weather labs keep working offline
+* **Batch Tools**: get_weather_many / geocode_many answer a whole list in
+  one MCP round-trip (multi-location query for weather, bounded
+  concurrent fan-out for geocoding) with per-item results and errors
+* **Fused Lookup**: weather_for_place runs geocode → weather → °F on the
+  server, saving agents two tool hops (and two LLM steps) per city
 * **Graceful Error Handling**: Returns error dict instead of raising exceptions,
   allowing clients to continue processing
 * **HTTP Transport**: Runs on localhost:8000/mcp/ using FastAPI + Uvicorn
@@ -29,11 +49,20 @@ clean separation between agents (orchestration) and API access (this server).
 from __future__ import annotations
 
 # ── stdlib ──────────────────────────────────────────────────────────
+import asyncio
+import csv
+import os
+import random
+import re
+import sqlite3
 import time
-from typing import Final
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Final, Hashable
+from urllib.parse import urlsplit
 
 # ── 3rd-party ───────────────────────────────────────────────────────
-import requests
+import httpx
 from fastmcp import FastMCP
 
 # ╔══════════════════════════════════════════════════════════════════╗
@@ -63,11 +92,398 @@ WEATHER_CODES: Final[dict[int, str]] = {
 # ╚══════════════════════════════════════════════════════════════════╝
 # Shared retry settings for all external API calls
 MAX_RETRIES    = 3       # Total attempts (1 original + 2 retries)
-BACKOFF_FACTOR = 1.5     # Exponential backoff: 1.5s, 2.25s, 3.375s
+BACKOFF_FACTOR = 1.5     # Back-off cap per retry: up to 1.5s, 2.25s (full jitter)
 TRANSIENT_CODES = {429, 500, 502, 503, 504}  # HTTP codes worth retrying
+REQUEST_TIMEOUT = 15     # Seconds per attempt
+
+# Circuit breaker: after BREAKER_THRESHOLD consecutive failed calls to a
+# host, fail fast for BREAKER_RESET_SEC, then let one probe call through.
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_SEC = 30
+
+# Retry budget: retries spend tokens, successes earn them back, so during
+# an outage retries stop long before they multiply the load upstream.
+RETRY_BUDGET_MAX   = 10     # Token bucket size (retries available in a burst)
+RETRY_BUDGET_RATIO = 0.2    # Tokens earned per successful call
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# ║ 3.  Shared async HTTP connection pools + circuit breakers        ║
+# ╚══════════════════════════════════════════════════════════════════╝
+# One long-lived AsyncClient per upstream host.  Connections are kept
+# alive (HTTP/1.1) between calls, so concurrent tool calls reuse warm
+# TLS sessions instead of handshaking on every request.  The limits
+# bound how many sockets a single host can hold open at once.
+POOL_LIMITS = httpx.Limits(
+    max_connections=100,            # in-flight requests per host
+    max_keepalive_connections=20,   # idle sockets kept warm per host
+    keepalive_expiry=30.0,          # seconds before an idle socket closes
+)
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+class UpstreamError(Exception):
+    """Raised when every attempt against an upstream API has failed."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without contacting the host while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed → open → half-open breaker for one upstream host.
+
+    * **closed**: calls flow; consecutive failures are counted.
+    * **open**: calls fail fast with CircuitOpenError until the reset
+      timeout has passed.
+    * **half-open**: a single probe call is let through; success closes
+      the breaker, failure re-opens it for another timeout.
+    """
+
+    def __init__(self, threshold: int, reset_after: float) -> None:
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError if this call must not reach the host.
+        Returns True if the call is the half-open probe.
+        """
+        if self.state == "open":
+            remaining = self.reset_after - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(f"unavailable (circuit open, retry in {remaining:.0f}s)")
+            self.state = "half-open"
+        if self.state == "half-open":
+            if self._probing:
+                raise CircuitOpenError("unavailable (circuit half-open, probe in flight)")
+            self._probing = True
+            return True
+        return False
+
+    def release_probe(self) -> None:
+        """
+        End a probe that recorded neither outcome (cancelled, or an
+        unexpected error), so the next call can probe the host again.
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half-open" or self.failures >= self.threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Token bucket shared by all upstream calls to cap the retry rate."""
+
+    def __init__(self, max_tokens: float, ratio: float) -> None:
+        self.max_tokens = max_tokens
+        self.ratio = ratio
+        self.tokens = max_tokens
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one token for a retry; False when the budget is empty."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_retry_budget = RetryBudget(RETRY_BUDGET_MAX, RETRY_BUDGET_RATIO)
+
+
+def _client_for(url: str) -> tuple[httpx.AsyncClient, CircuitBreaker]:
+    """Return the shared pooled client and breaker for `url`'s host."""
+    host = urlsplit(url).netloc
+    client = _clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+        _clients[host] = client
+    breaker = _breakers.setdefault(host, CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET_SEC))
+    return client, breaker
+
+
+async def _fetch_json(url: str, params: dict | None = None) -> Any:
+    """
+    GET `url` through the shared pool for its host and return parsed JSON.
+
+    Retry policy
+    ------------
+    * Fails fast with CircuitOpenError while the host's breaker is open.
+    * Up to MAX_RETRIES total attempts over the same pooled connection.
+    * Retries on network errors **or** HTTP 429/5xx; other 4xx are final.
+    * Each retry spends a token from the shared retry budget and waits a
+      random 0…BACKOFF_FACTOR**attempt seconds (full jitter) with
+      ``asyncio.sleep``, so the wait never blocks other tool calls.
+
+    Raises
+    ------
+    UpstreamError
+        With the attempts made and last error once the call has failed.
+    ValueError
+        If the response body is not valid JSON (not retried).
+    """
+    client, breaker = _client_for(url)
+    probe = breaker.before_call()
+    last_error = None
+    attempts = 0
+
+    try:
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                if not _retry_budget.withdraw():
+                    last_error = f"{last_error}; retry budget exhausted"
+                    break
+                await asyncio.sleep(random.uniform(0, BACKOFF_FACTOR ** attempt))
+
+            attempts += 1
+            try:
+                resp = await client.get(url, params=params)
+
+                # Handle rate limiting and server errors with retry
+                if resp.status_code in TRANSIENT_CODES:
+                    last_error = f"HTTP {resp.status_code}"
+                    continue
+
+                # The host is answering: other errors are ours, not an outage
+                breaker.record_success()
+                _retry_budget.deposit()
+                resp.raise_for_status()
+                return resp.json()
+
+            except httpx.HTTPStatusError as e:
+                # HTTP errors (4xx not already caught) - retrying won't help
+                raise UpstreamError(f"failed (HTTP {e.response.status_code})") from e
+
+            except httpx.HTTPError as e:
+                # Network errors (timeout, connection refused, etc.)
+                last_error = f"{type(e).__name__}"
+
+        breaker.record_failure()
+        raise UpstreamError(f"failed after {attempts} attempts (last error: {last_error})")
+    finally:
+        # A cancelled or crashed probe must not leave the breaker half-open forever
+        if probe:
+            breaker.release_probe()
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# ║ 4.  Response cache (TTL + LRU) with single-flight loading        ║
+# ╚══════════════════════════════════════════════════════════════════╝
+# Agents ask about the same handful of office cities all day, so most
+# get_weather calls can be answered without touching Open-Meteo.
+# Coordinates are snapped to a grid so "40.7128" and "40.7130" share
+# one cache entry (0.01° ≈ 1 km).
+CACHE_GRID_DEG  = 0.01   # Grid size used to quantize lat/lon
+CACHE_TTL_SEC   = 600    # How long a cached answer stays fresh
+CACHE_MAX_ITEMS = 1024   # LRU bound on the number of cached cells
+CACHE_STALE_SEC = 6 * 3600  # Expired answers still served while upstream is down
+WEATHER_BATCH_SIZE = 50  # Coordinates per multi-location forecast request
+GEOCODE_FANOUT     = 8   # Concurrent geocoding requests per batch call
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire `ttl` seconds after insertion."""
+
+    def __init__(self, max_items: int, ttl: float) -> None:
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1                 # expired entries stay for get_stale
+            return None
+        self._data.move_to_end(key)          # mark as recently used
+        self.hits += 1
+        return entry[1]
+
+    def get_stale(self, key: Hashable, max_age: float) -> Any | None:
+        """Return the value for `key` even if expired, up to `max_age` seconds old."""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() - entry[0] > max_age:
+            return None
+        self.stale_hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store `value`, evicting the least recently used entry if full."""
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Counters for the get_cache_stats tool."""
+        lookups = self.hits + self.misses
+        return {
+            "size":     len(self._data),
+            "max_size": self.max_items,
+            "ttl_sec":  self.ttl,
+            "hits":       self.hits,
+            "misses":     self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate":   round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_weather_cache = TTLCache(CACHE_MAX_ITEMS, CACHE_TTL_SEC)
+_inflight: dict[Hashable, asyncio.Task] = {}
+
+
+def _grid_cell(lat: float, lon: float) -> tuple[float, float]:
+    """Snap coordinates to the CACHE_GRID_DEG grid (the cache key)."""
+    return (
+        round(round(lat / CACHE_GRID_DEG) * CACHE_GRID_DEG, 6),
+        round(round(lon / CACHE_GRID_DEG) * CACHE_GRID_DEG, 6),
+    )
+
+
+async def _single_flight(key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run `loader()` once per `key` no matter how many callers are waiting.
+
+    The first caller starts the load; concurrent callers for the same key
+    await the same task.  ``asyncio.shield`` keeps one cancelled caller
+    from cancelling the shared request for everybody else.
+    """
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(loader())
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+# ╔══════════════════════════════════════════════════════════════════╗
+# ║ 5.  Persistent geocode store + offline gazetteer                 ║
+# ╚══════════════════════════════════════════════════════════════════╝
+# City coordinates never change, so geocode answers are kept in a small
+# SQLite table that survives restarts.  On startup it is seeded with the
+# office cities from data/offices.csv using the gazetteer below, which
+# lets the weather labs run even when the network is down.
+GEOCODE_DB_PATH = Path(os.getenv("GEOCODE_DB_PATH", "./geocode_cache.db"))
+OFFICE_CSV      = Path("./data/offices.csv")
+
+# Offline coordinates (GeoNames, same source as Open-Meteo's geocoder)
+GAZETTEER: Final[dict[str, tuple[float, float]]] = {
+    "San Francisco": (37.77493, -122.41942),
+    "New York":      (40.71427,  -74.00597),
+    "London":        (51.50853,   -0.12574),
+    "Tokyo":         (35.68950,  139.69171),
+    "Seattle":       (47.60621, -122.33207),
+    "Austin":        (30.26715,  -97.74306),
+    "Berlin":        (52.52437,   13.41053),
+    "Singapore":     ( 1.28967,  103.85007),
+    "Toronto":       (43.70011,  -79.41630),
+    "Sydney":        (-33.86785, 151.20732),
+}
+
+
+def _normalize_place(name: str) -> str:
+    """Canonical lookup key: case-folded, single-spaced, no stray punctuation."""
+    return re.sub(r"\s+", " ", name).strip(" .,;").casefold()
+
+
+class GeocodeStore:
+    """SQLite-backed place name → coordinates table shared across restarts."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS geocode (
+                key       TEXT PRIMARY KEY,
+                latitude  REAL NOT NULL,
+                longitude REAL NOT NULL,
+                name      TEXT NOT NULL,
+                source    TEXT NOT NULL
+            )
+            """
+        )
+
+    def get(self, name: str) -> dict | None:
+        """Return the stored result for `name`, or None on a miss."""
+        row = self._conn.execute(
+            "SELECT latitude, longitude, name FROM geocode WHERE key = ?",
+            (_normalize_place(name),),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"latitude": row[0], "longitude": row[1], "name": row[2]}
+
+    def put(self, name: str, result: dict, source: str = "api") -> None:
+        """Write a successful lookup back to disk (replacing any older row)."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)",
+            (_normalize_place(name), result["latitude"], result["longitude"],
+             result["name"], source),
+        )
+
+    def seed(self, csv_path: Path) -> int:
+        """
+        Pre-load gazetteer coordinates for every city in `csv_path`.
+
+        Existing rows are left alone (INSERT OR IGNORE).  Returns the
+        number of cities that had gazetteer coordinates.
+        """
+        if not csv_path.exists():
+            return 0
+        gazetteer = {_normalize_place(k): (k, v) for k, v in GAZETTEER.items()}
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            cities = {row["city"] for row in csv.DictReader(f) if row.get("city")}
+        rows = [
+            (key, *gazetteer[key][1], gazetteer[key][0], "gazetteer")
+            for key in map(_normalize_place, cities)
+            if key in gazetteer
+        ]
+        self._conn.executemany("INSERT OR IGNORE INTO geocode VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def stats(self) -> dict:
+        """Counters for the get_cache_stats tool."""
+        lookups = self.hits + self.misses
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM geocode").fetchone()
+        return {
+            "size":     size,
+            "path":     str(GEOCODE_DB_PATH),
+            "hits":     self.hits,
+            "misses":   self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_geocode_store = GeocodeStore(GEOCODE_DB_PATH)
+_geocode_store.seed(OFFICE_CSV)
 
 # ╔══════════════════════════════════════════════════════════════════╗
-# ║ 3.  MCP Server initialization and tool definitions               ║
+# ║ 6.  MCP Server initialization and tool definitions               ║
 # ╚══════════════════════════════════════════════════════════════════╝
 mcp = FastMCP("WeatherServer")
 
@@ -78,12 +494,20 @@ mcp = FastMCP("WeatherServer")
     """
     Fetch **current weather** from Open-Meteo and return a concise dict.
 
+    Caching
+    -------
+    * Coordinates are snapped to a CACHE_GRID_DEG grid and successful
+      answers are served from cache for CACHE_TTL_SEC seconds.
+    * Concurrent misses for the same grid cell share one upstream request.
+    * If the upstream call fails, an expired answer up to CACHE_STALE_SEC
+      old is returned instead, flagged with ``"stale": true``.
+
     Retry policy
     ------------
-    * Up to MAX_RETRIES total attempts with fresh connections.
-    * Retries on network errors **or** HTTP 429/5xx.
-    * Exponential back-off (1.5 s, 2.25 s, …).
-    * Each retry uses a new session to avoid connection pool issues.
+    * Handled by `_fetch_json`: up to MAX_RETRIES attempts over the
+      shared connection pool, retrying network errors and HTTP 429/5xx
+      with jittered back-off, a shared retry budget and a per-host
+      circuit breaker that fails fast during upstream outages.
 
     Parameters
     ----------
@@ -94,52 +518,54 @@ mcp = FastMCP("WeatherServer")
     -------
    
 
+    """
+    return await _weather(lat, lon)
 
-    last_error = None
 
-    # Retry loop with fresh connections
-    for attempt in range(MAX_RETRIES):
-        try:
-            # Fresh session per attempt avoids connection pool reuse issues
-            session = requests.Session()
-            resp = session.get(url, timeout=15)
-            session.close()
-
-            # Handle rate limiting and server errors with retry
-            if resp.status_code in TRANSIENT_CODES:
-                last_error = f"HTTP {resp.status_code}"
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(BACKOFF_FACTOR ** attempt)
-                    continue
+async def _weather(lat: float, lon: float) -> dict:
+    """Cached, single-flight weather lookup shared by the weather tools."""
+    cell = _grid_cell(lat, lon)
+    cached = _weather_cache.get(cell)
+    if cached is not None:
+        return dict(cached)
 
-            resp.raise_for_status()
+    result = await _single_flight(("weather", cell), lambda: _fetch_weather(*cell))
+    if "error" not in result:
+        _weather_cache.put(cell, result)
+        return dict(result)
+    return _stale_weather(cell) or result
 
 
+def _stale_weather(cell: tuple[float, float]) -> dict | None:
+    """Expired cached weather for `cell`, flagged as stale, if there is any."""
+    stale = _weather_cache.get_stale(cell, CACHE_STALE_SEC)
+    return {**stale, "stale": True} if stale is not None else None
 
-        except requests.HTTPError as e:
-            # HTTP errors (4xx, 5xx not already caught)
-            last_error = f"HTTP {e.response.status_code}"
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(BACKOFF_FACTOR ** attempt)
-                continue
 
-        except requests.RequestException as e:
-            # Network errors (timeout, connection refused, etc.)
-            last_error = f"{type(e).__name__}"
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(BACKOFF_FACTOR ** attempt)
-                continue
+async def _fetch_weather(lat: float, lon: float) -> dict:
+    """Uncached Open-Meteo lookup behind `get_weather`."""
 
-        except (KeyError, ValueError) as e:
-            # Data format errors - don't retry, immediate failure
-            return {
-                "error": f"Received invalid data from weather service: {type(e).__name__}. Please try again later."
-            }
 
-    # All retries exhausted - return graceful error
-    return {
-        "error": f"Weather service failed after {MAX_RETRIES} attempts (last error: {last_error}). Please try again later."
-    }
+    try:
+        data = await _fetch_json(url)
+        return _current_conditions(data["current_weather"])
+
+    except UpstreamError as e:
+        # All retries exhausted - return graceful error
+        return {
+            "error": f"Weather service {e}. Please try again later."
+        }
+
+    except (KeyError, ValueError) as e:
+        # Data format errors - don't retry, immediate failure
+        return {
+            "error": f"Received invalid data from weather service: {type(e).__name__}. Please try again later."
+        }
+
+
+def _current_conditions(cw: dict) -> dict:
+    """Turn an Open-Meteo ``current_weather`` block into the tool's result dict."""
+
 
 
 # ─── Temperature Conversion Tool ─────────────────────────────────────
@@ -148,19 +574,40 @@ mcp = FastMCP("WeatherServer")
 
 
 
+# ─── Cache Statistics Tool ───────────────────────────────────────────
+
+@mcp.tool
+def get_cache_stats() -> dict:
+    """Report cache hit/miss counters plus circuit-breaker and retry-budget state."""
+    return {
+        "weather": _weather_cache.stats(),
+        "geocode": _geocode_store.stats(),
+        "breakers": {
+            host: {"state": b.state, "failures": b.failures}
+            for host, b in _breakers.items()
+        },
+        "retry_budget": round(_retry_budget.tokens, 2),
+    }
+
+
 # ─── Geocoding Tool ──────────────────────────────────────────────────
 
 @mcp.tool
-def geocode_location(name: str) -> dict:
+async def geocode_location(name: str) -> dict:
     """
     Geocode a location name to latitude/longitude coordinates using Open-Meteo's geocoding API.
 
+    Caching
+    -------
+    * Names are normalized and looked up in the persistent geocode store
+      first; only true misses go to the network and are written back.
+
     Retry policy
     ------------
-    * Up to MAX_RETRIES total attempts with fresh connections.
-    * Retries on network errors **or** HTTP 429/5xx.
-    * Exponential back-off (1.5 s, 2.25 s, …).
-    * Each retry uses a new session to avoid connection pool issues.
+    * Handled by `_fetch_json`: up to MAX_RETRIES attempts over the
+      shared connection pool, retrying network errors and HTTP 429/5xx
+      with jittered back-off, a shared retry budget and a per-host
+      circuit breaker that fails fast during upstream outages.
 
     Parameters
     ----------
@@ -170,66 +617,215 @@ def geocode_location(name: str) -> dict:
     Returns
     -------
 
+    """
+    return await _geocode(name)
 
-    # Retry loop with fresh connections
-    for attempt in range(MAX_RETRIES):
-        try:
-            # Fresh session per attempt avoids connection pool reuse issues
-            session = requests.Session()
-            resp = session.get(url, params={"name": name, "count": 1}, timeout=15)
-            session.close()
-
-            # Handle rate limiting and server errors with retry
-            if resp.status_code in TRANSIENT_CODES:
-                last_error = f"HTTP {resp.status_code}"
-                if attempt < MAX_RETRIES - 1:
-                    time.sleep(BACKOFF_FACTOR ** attempt)
-                    continue
 
-            resp.raise_for_status()
-
-            # Parse and return geocoding results
-            data = resp.json()
-            if data.get("results"):
-                hit = data["results"][0]
-                return {
-                    "latitude": hit["latitude"],
-                    "longitude": hit["longitude"],
-                    "name": hit.get("name", name),
-                }
-            else:
-                # No results found - not an error, just no match
-                return {
-                    "error": f"No location found for '{name}'. Try a different search term."
-                }
-
-        except requests.HTTPError as e:
-            # HTTP errors (4xx, 5xx not already caught)
-            last_error = f"HTTP {e.response.status_code}"
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(BACKOFF_FACTOR ** attempt)
-                continue
-
-        except requests.RequestException as e:
-            # Network errors (timeout, connection refused, etc.)
-            last_error = f"{type(e).__name__}"
-            if attempt < MAX_RETRIES - 1:
-                time.sleep(BACKOFF_FACTOR ** attempt)
-                continue
-
-        except (KeyError, ValueError) as e:
-            # Data format errors - don't retry, immediate failure
+async def _geocode(name: str) -> dict:
+    """Store-backed, single-flight geocode lookup shared by the geocoding tools."""
+    stored = _geocode_store.get(name)
+    if stored is not None:
+        return stored
+
+    key = ("geocode", _normalize_place(name))
+    result = await _single_flight(key, lambda: _fetch_geocode(name))
+    if "error" not in result:
+        _geocode_store.put(name, result)
+    return dict(result)
+
+
+async def _fetch_geocode(name: str) -> dict:
+    """Uncached Open-Meteo geocoding lookup behind `geocode_location`."""
+
+
+    try:
+        data = await _fetch_json(url, params={"name": name, "count": 1})
+
+        # Parse and return geocoding results
+        if data.get("results"):
+            hit = data["results"][0]
+            return {
+                "latitude": hit["latitude"],
+                "longitude": hit["longitude"],
+                "name": hit.get("name", name),
+            }
+        else:
+            # No results found - not an error, just no match
             return {
-                "error": f"Received invalid data from geocoding service: {type(e).__name__}. Please try again later."
+                "error": f"No location found for '{name}'. Try a different search term."
             }
 
-    # All retries exhausted - return graceful error
+    except UpstreamError as e:
+        # All retries exhausted - return graceful error
+        return {
+            "error": f"Geocoding service {e}. Please try again later."
+        }
+
+    except (KeyError, ValueError) as e:
+        # Data format errors - don't retry, immediate failure
+        return {
+            "error": f"Received invalid data from geocoding service: {type(e).__name__}. Please try again later."
+        }
+
+
+# ─── Composite Place-Weather Tool ────────────────────────────────────
+
+@mcp.tool
+async def weather_for_place(name: str) -> dict:
+    """
+    Look up a place by name and return its current weather in °C and °F.
+
+    Fuses geocode_location → get_weather → convert_c_to_f into one call,
+    reusing the same geocode store, weather cache and retry logic.
+
+    Parameters
+    ----------
+    name : str
+        Location name (e.g., "San Francisco", "Paris, France")
+
+    Returns
+    -------
+    dict
+        {
+            "name":          <matched location name>,
+            "latitude":      <float>,
+            "longitude":     <float>,
+            "conditions":    <friendly description>,
+            "code":          <int WMO weathercode>,
+            "temperature_c": <float °C>,
+            "temperature_f": <float °F>,
+            "error":         <error message if a lookup failed>
+        }
+    """
+    place = await _geocode(name)
+    if "error" in place:
+        return place
+
+    weather = await _weather(place["latitude"], place["longitude"])
+    if "error" in weather:
+        return {**place, **weather}
+
     return {
-        "error": f"Geocoding service failed after {MAX_RETRIES} attempts (last error: {last_error}). Please try again later."
+        "name":          place["name"],
+        "latitude":      place["latitude"],
+        "longitude":     place["longitude"],
+        "conditions":    weather["conditions"],
+        "code":          weather["code"],
+        "temperature_c": weather["temperature"],
+        "temperature_f": round(weather["temperature"] * 9 / 5 + 32, 1),
     }
 
+
+# ─── Batch Tools ─────────────────────────────────────────────────────
+
+@mcp.tool
+async def get_weather_many(coords: list[tuple[float, float]]) -> list[dict]:
+    """
+    Fetch current weather for many (lat, lon) pairs in a single call.
+
+    Cached cells are answered locally; the rest go to Open-Meteo as
+    multi-location requests (up to WEATHER_BATCH_SIZE coordinates each).
+
+    Parameters
+    ----------
+    coords : list of [lat, lon]
+        Coordinates in decimal degrees, e.g. [[40.71, -74.01], [51.51, -0.13]].
+
+    Returns
+    -------
+    list[dict]
+        One entry per input pair, in order: ``{"lat", "lon"}`` plus the
+        get_weather fields, or ``{"lat", "lon", "error"}`` for that item.
+    """
+    cells = [_grid_cell(lat, lon) for lat, lon in coords]
+
+    results: dict[tuple[float, float], dict] = {}
+    missing = []
+    for cell in dict.fromkeys(cells):               # de-duplicate, keep order
+        cached = _weather_cache.get(cell)
+        if cached is not None:
+            results[cell] = cached
+        else:
+            missing.append(cell)
+
+    batches = [
+        missing[i:i + WEATHER_BATCH_SIZE]
+        for i in range(0, len(missing), WEATHER_BATCH_SIZE)
+    ]
+    for fetched in await asyncio.gather(*map(_fetch_weather_batch, batches)):
+        results.update(fetched)
+
+    return [
+        {"lat": lat, "lon": lon, **results[cell]}
+        for (lat, lon), cell in zip(coords, cells)
+    ]
+
+
+async def _fetch_weather_batch(cells: list[tuple[float, float]]) -> dict:
+    """One multi-location forecast request; caches and returns per-cell results."""
+    url = "https://api.open-meteo.com/v1/forecast"
+    params = {
+        "latitude":  ",".join(str(lat) for lat, _ in cells),
+        "longitude": ",".join(str(lon) for _, lon in cells),
+        "current_weather": "true",
+    }
+
+    try:
+        data = await _fetch_json(url, params=params)
+    except UpstreamError as e:
+        error = {"error": f"Weather service {e}. Please try again later."}
+        return {cell: _stale_weather(cell) or error for cell in cells}
+    except ValueError as e:
+        error = {
+            "error": f"Received invalid data from weather service: {type(e).__name__}. Please try again later."
+        }
+        return {cell: _stale_weather(cell) or error for cell in cells}
+
+    # A single location comes back as an object, several as a list
+    entries = data if isinstance(data, list) else [data]
+    results = {}
+    for i, cell in enumerate(cells):
+        try:
+            results[cell] = _current_conditions(entries[i]["current_weather"])
+            _weather_cache.put(cell, results[cell])
+        except (IndexError, KeyError, TypeError) as e:
+            results[cell] = {
+                "error": f"Received invalid data from weather service: {type(e).__name__}. Please try again later."
+            }
+    return results
+
+
+@mcp.tool
+async def geocode_many(names: list[str]) -> list[dict]:
+    """
+    Geocode many location names in a single call.
+
+    The geocoding API has no multi-name query, so store misses fan out
+    concurrently (at most GEOCODE_FANOUT requests in flight).
+
+    Parameters
+    ----------
+    names : list[str]
+        Location names, e.g. ["New York", "London", "Tokyo"].
+
+    Returns
+    -------
+    list[dict]
+        One entry per input name, in order: ``{"query"}`` plus the
+        geocode_location fields, or ``{"query", "error"}`` for that item.
+    """
+    limit = asyncio.Semaphore(GEOCODE_FANOUT)
+
+    async def bounded(name: str) -> dict:
+        async with limit:
+            return await _geocode(name)
+
+    unique = list(dict.fromkeys(names))
+    found = dict(zip(unique, await asyncio.gather(*map(bounded, unique))))
+    return [{"query": name, **found[name]} for name in names]
+
 # ╔══════════════════════════════════════════════════════════════════╗
-# ║ 4.  Server startup                                                ║
+# ║ 7.  Server startup                                                ║
 # ╚══════════════════════════════════════════════════════════════════╝
 if __name__ == "__main__":
     # Start HTTP server using FastAPI + Uvicorn
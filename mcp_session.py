@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+mcp_session.py
+────────────────────────────────────────────────────────────────────
+A long-lived MCP client session shared by every query of a process.
+
+Opening a ``fastmcp.Client`` per question costs a TCP/HTTP handshake,
+an MCP ``initialize`` round-trip and a fresh ``tools/list`` — hundreds
+of milliseconds before the agent has done anything.  ``MCPSession``
+pays that once:
+
+* the connection is opened on first use and kept open between queries
+  (``async with session`` only makes sure it is connected — it does not
+  close it; call :meth:`MCPSession.close` when the program ends);
+* a dropped connection is re-opened transparently, and a tool call that
+  failed because of it is retried once;
+* the tool catalog is cached and only re-fetched after the server sends
+  ``notifications/tools/list_changed`` or the connection is re-opened.
+
+Callers that cannot keep one event loop alive themselves (Streamlit
+re-runs its script, and every ``asyncio.run`` makes a new loop) can use
+:func:`run_sync` / :func:`run_shared`, which run coroutines on a single
+background loop that owns the sessions.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Coroutine, TypeVar
+
+from fastmcp import Client
+from fastmcp.client.messages import MessageHandler
+from fastmcp.exceptions import ToolError
+try:
+    from mcp import McpError
+except ImportError:                              # mcp ≥ 2 renamed it
+    from mcp import MCPError as McpError
+
+T = TypeVar("T")
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+MCP_ENDPOINT     = "http://127.0.0.1:8000/mcp/"   # server from Lab 3
+CALL_ATTEMPTS    = 2                              # 1 try + 1 after reconnecting
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Session                                                      ║
+# ╚════════════════════════════════════════════════════════════════╝
+class _CatalogInvalidator(MessageHandler):
+    """Drops the session's cached tool list when the server says it changed."""
+
+    def __init__(self, session: "MCPSession") -> None:
+        super().__init__()
+        self._session = session
+
+    async def on_tool_list_changed(self, message: Any) -> None:
+        self._session.invalidate_tools()
+
+
+class MCPSession:
+    """
+    Persistent ``fastmcp.Client`` with reconnect and a cached tool catalog.
+
+    Exposes the two calls the agents use, ``list_tools()`` and
+    ``call_tool()``, so it can stand in for a ``Client``::
+
+        session = MCPSession()
+        async with session as mcp:          # connects (once)
+            tools = await mcp.list_tools()  # cached after the first call
+    """
+
+    def __init__(self, endpoint: str = MCP_ENDPOINT) -> None:
+        self.endpoint = endpoint
+        self._client: Client | None = None
+        self._tools: list | None = None
+        self._lock: asyncio.Lock | None = None
+
+    # ── connection management ───────────────────────────────────────
+    async def connect(self) -> Client:
+        """Return a connected client, (re)opening it if necessary."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._client is None or not self._client.is_connected():
+                await self._drop()
+                client = Client(self.endpoint, message_handler=_CatalogInvalidator(self))
+                await client.__aenter__()
+                self._client = client
+        return self._client
+
+    async def _drop(self) -> None:
+        """Forget the current connection (and the catalog that came with it)."""
+        client, self._client, self._tools = self._client, None, None
+        if client is not None:
+            try:
+                await client.__aexit__(None, None, None)
+            except Exception:
+                pass                # already broken — nothing left to close
+
+    async def close(self) -> None:
+        """Close the connection; the next call opens a new one."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._drop()
+
+    async def __aenter__(self) -> "MCPSession":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        pass                        # stay connected for the next query
+
+    # ── MCP calls ───────────────────────────────────────────────────
+    def invalidate_tools(self) -> None:
+        """Forget the cached catalog; the next list_tools() re-fetches it."""
+        self._tools = None
+
+    async def list_tools(self) -> list:
+        """Return the server's tools, fetching them only when not cached."""
+        if self._tools is None:
+            client = await self.connect()
+            self._tools = await client.list_tools()
+        return self._tools
+
+    async def call_tool(self, name: str, arguments: dict[str, Any] | None = None) -> Any:
+        """
+        Call a tool, reconnecting and retrying once if the connection failed.
+
+        Errors reported by the tool or the protocol (``ToolError``,
+        ``McpError``) are not connection problems and are raised as-is.
+        """
+        for attempt in range(1, CALL_ATTEMPTS + 1):
+            client = await self.connect()
+            try:
+                return await client.call_tool(name, arguments or {})
+            except (ToolError, McpError):
+                raise
+            except Exception:
+                if attempt == CALL_ATTEMPTS:
+                    raise
+                await self._drop()
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Shared background loop                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+_sessions: dict[str, MCPSession] = {}
+
+
+def _shared_loop() -> asyncio.AbstractEventLoop:
+    """Start (once) a daemon thread running the loop that owns the sessions."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="mcp-session", daemon=True).start()
+    return _loop
+
+
+def get_session(endpoint: str = MCP_ENDPOINT) -> MCPSession:
+    """Process-wide session for `endpoint`; use it via run_sync / run_shared."""
+    with _loop_lock:
+        return _sessions.setdefault(endpoint, MCPSession(endpoint))
+
+
+def run_sync(coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+    """Run `coro` on the shared loop from synchronous code and wait for it."""
+    return asyncio.run_coroutine_threadsafe(coro, _shared_loop()).result(timeout)
+
+
+async def run_shared(coro: Coroutine[Any, Any, T]) -> T:
+    """Await `coro` on the shared loop from code running on another loop."""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, _shared_loop()))
@@ -28,21 +28,27 @@ import asyncio
 import json
 import re
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # ────────────────────────── third-party libs ────────────────────────
-import chromadb
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
-from fastmcp import Client
+# chromadb is imported on first use (see open_collection / embed_fn)
 from fastmcp.exceptions import ToolError
-from langchain_ollama import ChatOllama
+
+from llm_steps import astream_step, compact_history, make_step_llm
+from mcp_session import MCPSession
+from tools.bm25 import BM25Index, rrf_fuse
+from tools.embed_cache import EmbeddingCache
+from tools.registry import CollectionRegistry
+from tools.rerank import RERANK_CANDIDATES, Reranker
+from tools.snapshot import Snapshot
 
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║ 1.  Configuration                                               ║
 # ╚══════════════════════════════════════════════════════════════════╝
 CHROMA_PATH      = Path("./chroma_db")          # Where Lab 4 stored the vector DB
-COLLECTION_NAME  = "codebase"                   # Collection name from Lab 4
+COLLECTION_NAME  = "pdfs"                       # index_pdf.py's collection (Lab 4)
 MCP_ENDPOINT     = "http://127.0.0.1:8000/mcp/" # MCP server from Lab 3
 TOP_K            = 3                            # Number of RAG results to retrieve
 
@@ -104,6 +110,9 @@ Args: {{}}
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║ 5.  TAO agent loop — the LLM decides which tools to call        ║
 # ╚══════════════════════════════════════════════════════════════════╝
+# One MCP connection (and cached tool catalog) for the whole session
+session = MCPSession(MCP_ENDPOINT)
+
 async def run(prompt: str, max_steps: int = 10) -> None:
 # Run the agentic RAG loop where the LLM drives teh workflow.   
 
@@ -119,7 +128,7 @@ async def run(prompt: str, max_steps: int = 10) -> None:
     print("RAG Agent — Thought / Action / Observation")
     print("="*60 + "\n")
 
-    async with Client(MCP_ENDPOINT) as mcp:
+    async with session as mcp:       # reuses the open connection
         for step in range(1, max_steps + 1):
             print(f"[Step {step}]")
 
@@ -176,6 +185,20 @@ async def run(prompt: str, max_steps: int = 10) -> None:
 # ╔══════════════════════════════════════════════════════════════════╗
 # ║ 6.  Interactive loop                                             ║
 # ╚══════════════════════════════════════════════════════════════════╝
+async def repl() -> None:
+    """Answer questions on one event loop, so the MCP session stays open."""
+    try:
+        while True:
+            prompt = (await asyncio.to_thread(input, "User: ")).strip()
+            if prompt.lower() == "exit":
+                print("Goodbye!")
+                break
+            if prompt:
+                await run(prompt)
+                print()
+    finally:
+        await session.close()
+
 if __name__ == "__main__":
     print("="*60)
     print("RAG-Enhanced Office Weather Agent")
@@ -183,11 +206,4 @@ if __name__ == "__main__":
     print("\nAsk about any office (e.g. 'Tell me about HQ')")
     print("Type 'exit' to quit\n")
 
-    while True:
-        prompt = input("User: ").strip()
-        if prompt.lower() == "exit":
-            print("Goodbye!")
-            break
-        if prompt:
-            asyncio.run(run(prompt))
-            print()
+    asyncio.run(repl())
@@ -0,0 +1,80 @@
+"""
+Circuit breaker of the Lab 3 weather server: a half-open probe that ends
+without recording an outcome must not block the host forever.
+"""
+
+import asyncio
+import importlib.util
+import time
+from importlib.machinery import SourceFileLoader
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastmcp")
+httpx = pytest.importorskip("httpx")
+
+SOLUTION = Path(__file__).resolve().parent.parent / "labs" / "common" / "lab3_server_solution.txt"
+URL = "http://upstream.test/v1/forecast"
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """The solution server module, with its geocode cache in a temp dir."""
+    monkeypatch.setenv("GEOCODE_DB_PATH", str(tmp_path / "geocode_cache.db"))
+    loader = SourceFileLoader("lab3_server_solution", str(SOLUTION))
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+
+def _half_open(server):
+    """Shared client and breaker for URL, with the breaker ready to probe."""
+    client, breaker = server._client_for(URL)
+    breaker.state = "open"
+    breaker.failures = breaker.threshold
+    breaker.opened_at = time.monotonic() - breaker.reset_after - 1
+    return client, breaker
+
+
+async def _ok(url, params=None):
+    return httpx.Response(200, json={"ok": True}, request=httpx.Request("GET", url))
+
+
+def test_cancelled_probe_releases_breaker(server, monkeypatch):
+    client, breaker = _half_open(server)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang(url, params=None):
+            started.set()
+            await asyncio.sleep(3600)
+
+        monkeypatch.setattr(client, "get", hang)
+        probe = asyncio.create_task(server._fetch_json(URL))
+        await started.wait()
+        probe.cancel()                           # e.g. the MCP client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        monkeypatch.setattr(client, "get", _ok)
+        return await server._fetch_json(URL)
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert breaker.state == "closed"
+
+
+def test_unexpected_probe_error_releases_breaker(server, monkeypatch):
+    client, breaker = _half_open(server)
+
+    async def closed(url, params=None):
+        raise RuntimeError("Cannot send a request, as the client has been closed.")
+
+    monkeypatch.setattr(client, "get", closed)
+    with pytest.raises(RuntimeError):
+        asyncio.run(server._fetch_json(URL))
+
+    monkeypatch.setattr(client, "get", _ok)
+    assert asyncio.run(server._fetch_json(URL)) == {"ok": True}
+    assert breaker.state == "closed"
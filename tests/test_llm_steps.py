@@ -0,0 +1,124 @@
+"""
+Step cut-off of llm_steps: where a streamed TAO step ends, and that the
+stream is closed there instead of being read to the model's last token.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import llm_steps
+from llm_steps import args_end, astream_step, step_end, stream_step
+
+FINAL = {"done": True, "prompt_eval_count": 42, "prompt_eval_duration": 2e6,
+         "eval_count": 30, "eval_duration": 9e6}
+
+
+# ── args_end / step_end ─────────────────────────────────────────────
+def test_braces_inside_strings_are_ignored():
+    text = 'Action: geocode_location\nArgs: {"name": "a}b{c"}'
+    assert args_end(text) == len(text)
+
+
+def test_escaped_quote_does_not_end_string():
+    text = r'Args: {"q": "say \"}\" twice"}'
+    assert args_end(text) == len(text)
+
+
+def test_nested_object():
+    head = 'Action: search_offices\nArgs: {"q": {"city": "Austin", "tags": {"hq": true}}}'
+    assert args_end(head) == len(head)
+    assert args_end(head[:-1]) == -1
+
+
+def test_text_after_args_is_not_included():
+    step = 'Thought: weather next\nAction: get_weather\nArgs: {"lat": 30.3, "lon": -97.7}'
+    text = step + "\nObservation: sunny\nThought: invented"
+    assert args_end(text) == len(step)
+    assert step_end(text) == len(step)
+
+
+def test_incomplete_or_missing_args():
+    assert args_end('Action: get_weather\nArgs: {"lat": 30.3') == -1
+    assert args_end("Thought: thinking about it") == -1
+
+
+@pytest.mark.parametrize("text", [
+    'Thought: all set\nAction: DONE\nArgs: {}',
+    'Thought: all set\nAction: done\nArgs: {}\nFinal: Austin is sunny, 77 °F.',
+])
+def test_done_steps_are_not_cut(text):
+    assert args_end(text) != -1
+    assert step_end(text) == -1
+
+
+# ── streaming ───────────────────────────────────────────────────────
+class FakeLLM:
+    """Streams `parts` as message chunks, then Ollama's final chunk."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.sent = 0
+        self.closed = False
+
+    def _chunks(self):
+        for part in self.parts:
+            yield SimpleNamespace(content=part, response_metadata={})
+        yield SimpleNamespace(content="", response_metadata=FINAL)
+
+    def stream(self, messages):
+        def gen():
+            try:
+                for chunk in self._chunks():
+                    self.sent += 1
+                    yield chunk
+            finally:
+                self.closed = True
+        return gen()
+
+    def astream(self, messages):
+        async def gen():
+            try:
+                for chunk in self._chunks():
+                    self.sent += 1
+                    yield chunk
+            finally:
+                self.closed = True
+        return gen()
+
+
+ACTION_PARTS = ['Thought: weather\nAction: get_weather\nArgs: {"lat": 30.3,',
+                ' "lon": -97.7}\nObserv', 'ation: sunny\n', 'Thought: invented']
+
+
+def test_stream_is_closed_at_the_cut(capsys):
+    llm, timings = FakeLLM(ACTION_PARTS), []
+    text = stream_step(llm, [], timings=timings)
+    assert text == 'Thought: weather\nAction: get_weather\nArgs: {"lat": 30.3, "lon": -97.7}'
+    assert llm.sent == 2 and llm.closed
+    assert "Observ" not in capsys.readouterr().out
+    assert timings[0].source == "client"
+
+
+def test_async_stream_is_closed_at_the_cut():
+    llm = FakeLLM(ACTION_PARTS)
+    text = asyncio.run(astream_step(llm, [], echo=False))
+    assert text.endswith('"lon": -97.7}')
+    assert llm.sent == 2 and llm.closed
+
+
+def test_timings_read_on_to_the_server_counters(monkeypatch):
+    monkeypatch.setattr(llm_steps, "SHOW_TIMINGS", True)
+    llm, timings = FakeLLM(ACTION_PARTS), []
+    text = stream_step(llm, [], echo=False, timings=timings)
+    assert text.endswith('"lon": -97.7}')
+    assert llm.sent == len(ACTION_PARTS) + 1
+    assert timings[0].source == "ollama" and timings[0].prompt_tokens == 42
+
+
+def test_done_step_streams_to_the_end():
+    llm = FakeLLM(['Thought: all set\nAction: DONE\nArgs: {}', '\nFinal: Austin is sunny.'])
+    text = stream_step(llm, [], echo=False)
+    assert text.endswith("Final: Austin is sunny.")
+    assert llm.sent == 3
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+bm25.py
+────────────────────────────────────────────────────────────────────
+Lexical (BM25) index kept next to the vectors, plus reciprocal rank
+fusion — the keyword half of hybrid search in tools/search.py and the
+Lab 5 RAG agent.
+
+MiniLM vectors capture meaning but are weak on rare exact tokens:
+"Tokyo revenue" or a function name like ``chunk_python_code`` can rank
+below chunks that are merely *about* something similar.  BM25 scores
+exact term overlap, and fusing both rankings with RRF
+
+    score(d) = Σ  1 / (RRF_K + rank_i(d))
+
+rewards chunks that either retriever ranks high, without having to
+calibrate BM25 scores against cosine similarities.
+
+The index is rebuilt from the collection at the end of every
+index_code.py / index_pdf.py run and stored in the collection's state
+directory (``chroma_db/collections/<name>/bm25/``, see registry.py) as
+flat NumPy arrays (CSR-style postings), memory-mapped on load:
+
+* ``terms.bin`` + ``term_offsets.npy`` — sorted vocabulary as one UTF-8
+  blob and its (terms + 1) int64 byte offsets (binary-searched)
+* ``offsets.npy``  — postings of term t are ``[offsets[t], offsets[t+1])``
+* ``postings.npy`` — document numbers (int32), grouped by term
+* ``tfs.npy``      — term frequency per posting (uint16)
+* ``doc_len.npy``  — tokens per document
+* ``ids.bin`` + ``id_offsets.npy`` — document number → Chroma chunk ID,
+  stored the same way
+* ``meta.json``    — document count and average length
+
+Identifiers are indexed whole *and* split into their parts
+(``chunk_python_code`` → ``chunk``, ``python``, ``code``; ``MCPSession``
+→ ``mcp``, ``session``), so both exact names and their words match.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+BM25_DIR_NAME     = "bm25"          # sub-folder of a collection's state directory
+K1                = 1.2             # term-frequency saturation
+B                 = 0.75            # document-length normalisation
+RRF_K             = 60              # rank damping in reciprocal rank fusion
+FUSION_CANDIDATES = 20              # hits fetched from each retriever before fusing
+MAX_TERM_LEN      = 40
+READ_PAGE         = 5000            # chunks per collection.get() while rebuilding
+
+WORD_RE = re.compile(r"\w+")
+PART_RE = re.compile(r"[A-Z0-9]+(?![a-z])|[A-Z]?[a-z0-9]+")   # camelCase / snake_case parts
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words, identifiers additionally split into their parts."""
+    terms: List[str] = []
+    for word in WORD_RE.findall(text):
+        terms.append(word.lower()[:MAX_TERM_LEN])
+        if not word.isascii():
+            continue
+        parts = [p.lower() for piece in word.split("_") for p in PART_RE.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(p[:MAX_TERM_LEN] for p in parts)
+    return terms
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Index                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+class _Strings:
+    """
+    Read-only list of strings kept as one UTF-8 blob plus int64 byte
+    offsets — no padding to the longest string, unlike a ``<U`` array.
+    """
+
+    def __init__(self, blob: Path, offsets: Path) -> None:
+        self.offsets = np.load(offsets, mmap_mode="r")
+        with open(blob, "rb") as fh:
+            size = os.fstat(fh.fileno()).st_size
+            self._blob = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self._blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def find(self, text: str) -> int:
+        """Position of `text` in the (sorted) list, or -1."""
+        lo, hi = 0, len(self)
+        while lo < hi:                               # UTF-8 bytes sort like code points
+            mid = (lo + hi) // 2
+            if self[mid] < text:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self[lo] == text else -1
+
+    @staticmethod
+    def write(strings: Sequence[str], blob: Path, offsets: Path) -> None:
+        encoded = [s.encode("utf-8") for s in strings]
+        ends = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=ends[1:])
+        blob.write_bytes(b"".join(encoded))
+        np.save(offsets, ends)
+
+
+class BM25Index:
+    """Read-only BM25 index over one collection's chunks (see module docstring)."""
+
+    def __init__(self, directory: Path) -> None:
+        def load(name: str) -> np.ndarray:
+            return np.load(directory / f"{name}.npy", mmap_mode="r")
+
+        self.terms = _Strings(directory / "terms.bin", directory / "term_offsets.npy")
+        self.ids = _Strings(directory / "ids.bin", directory / "id_offsets.npy")
+        self.offsets, self.postings = load("offsets"), load("postings")
+        self.tfs, self.doc_len = load("tfs"), load("doc_len")
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        self.n_docs: int = meta["n_docs"]
+        self.avgdl: float = meta["avgdl"] or 1.0
+
+    @classmethod
+    def load(cls, db_path: Path) -> "BM25Index | None":
+        """The index stored under `db_path` (a state directory), or None if none was built."""
+        directory = Path(db_path) / BM25_DIR_NAME
+        # An index in the old all-.npy layout has no terms.bin: rebuilt on the next index run
+        return cls(directory) if (directory / "terms.bin").exists() else None
+
+    def search(self, query: str, k: int = FUSION_CANDIDATES) -> List[Tuple[str, float]]:
+        """Top `k` ``(chunk ID, BM25 score)`` pairs for `query`, best first."""
+        if not self.n_docs:
+            return []
+        pos = [t for t in map(self.terms.find, set(tokenize(query))) if t >= 0]   # drop unknown terms
+
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for t in pos:
+            start, end = int(self.offsets[t]), int(self.offsets[t + 1])
+            docs = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1.0 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = K1 * (1.0 - B + B * self.doc_len[docs] / self.avgdl)
+            scores[docs] += idf * tf * (K1 + 1.0) / (tf + norm)   # a term lists each doc once
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(self.ids[d], float(scores[d])) for d in hits]
+
+
+def build(ids: Sequence[str], documents: Sequence[str], db_path: Path) -> BM25Index:
+    """Index `documents` (with Chroma IDs `ids`) and write it under `db_path`."""
+    vocab: Dict[str, int] = {}
+    term_of: List[int] = []
+    doc_of: List[int] = []
+    tf_of: List[int] = []
+    doc_len = np.zeros(len(documents), dtype=np.int32)
+    for d, text in enumerate(documents):
+        counts = Counter(tokenize(text or ""))
+        doc_len[d] = sum(counts.values())
+        for term, tf in counts.items():
+            term_of.append(vocab.setdefault(term, len(vocab)))
+            doc_of.append(d)
+            tf_of.append(tf)
+
+    # Renumber terms in sorted order, then group postings by term
+    terms = sorted(vocab)
+    rank = np.empty(len(vocab), dtype=np.int64)
+    rank[[vocab[t] for t in terms]] = np.arange(len(vocab))
+    term_arr = rank[np.asarray(term_of, dtype=np.int64)]
+    doc_arr = np.asarray(doc_of, dtype=np.int32)
+    order = np.lexsort((doc_arr, term_arr))
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(term_arr, minlength=len(vocab)), out=offsets[1:])
+
+    arrays = {
+        "offsets": offsets,
+        "postings": doc_arr[order],
+        "tfs": np.minimum(np.asarray(tf_of, dtype=np.int64)[order], 65535).astype(np.uint16),
+        "doc_len": doc_len,
+    }
+    meta = {"n_docs": len(documents), "avgdl": float(doc_len.mean()) if len(documents) else 0.0}
+
+    # Write a new folder, then swap it in — readers never see half an index
+    directory = Path(db_path) / BM25_DIR_NAME
+    tmp = directory.with_name(BM25_DIR_NAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(tmp / f"{name}.npy", array)
+    _Strings.write(terms, tmp / "terms.bin", tmp / "term_offsets.npy")
+    _Strings.write(list(ids), tmp / "ids.bin", tmp / "id_offsets.npy")
+    (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    old = directory.with_name(BM25_DIR_NAME + ".old")
+    if directory.exists():
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return BM25Index(directory)
+
+
+def rebuild_from_collection(collection: Any, db_path: Path) -> BM25Index:
+    """Re-index every chunk currently stored in `collection`."""
+    ids: List[str] = []
+    documents: List[str] = []
+    while True:
+        page = collection.get(include=["documents"], limit=READ_PAGE, offset=len(ids))
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+    return build(ids, documents, db_path)
+
+
+def remove(db_path: Path) -> None:
+    """Delete the index (e.g. when an indexer ran without rebuilding it)."""
+    shutil.rmtree(Path(db_path) / BM25_DIR_NAME, ignore_errors=True)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Reciprocal rank fusion                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Fuse ranked ID lists (best first) into one ``(ID, RRF score)`` ranking."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+"""
+compact_store.py
+────────────────────────────────────────────────────────────────────
+Optional compact vector store for large collections: quantized codes
+in RAM for a fast approximate scan, float vectors on disk for an exact
+re-score of the few best candidates.
+
+Chroma keeps every 384-d MiniLM vector as float32 in its HNSW index —
+1.5 kB per chunk, which is nothing for data/offices.pdf but gigabytes
+for multi-million-chunk corpora.  With ``--compact int8`` or
+``--compact pq`` the indexers also write, next to the collection's BM25
+index (``chroma_db/collections/<name>/compact/``):
+
+* ``codes.npy``   — one code per chunk, memory-mapped:
+    - **int8**: scalar quantization, one byte per dimension
+      (per-dimension range from ``lo.npy`` / ``step.npy``) → 4× smaller
+    - **pq**:   product quantization, PQ_M sub-vectors of 384 / PQ_M
+      dimensions, one byte (centroid number) each, centroids in
+      ``codebooks.npy`` → 384 / PQ_M × 4 smaller (16× for PQ_M = 96).
+      Stored column-major (PQ_M × chunks), so each sub-vector's table
+      look-up reads one contiguous run
+* ``vectors.npy`` — the unit-length float32 vectors, memory-mapped and
+  only read for re-scoring, so they stay on disk
+* ``ids.npy``, ``meta.json`` — row → Chroma chunk ID, mode and shape
+
+A search scans the codes in blocks of SCAN_BLOCK rows (int8: one matrix
+product; pq: table look-ups, "asymmetric distance"), keeps the
+RESCORE_CANDIDATES best rows per query, then reads just those rows of
+``vectors.npy`` and returns their exact cosine similarities.  When a
+collection has a compact store, tools/search.py answers vector queries
+from it and only asks Chroma for the documents of the hits — Chroma's
+HNSW index is not queried.
+
+``python tools/compact_store.py --collection code`` (or
+``--synthetic 200000``) measures memory, latency and recall@k of both
+modes against exact brute-force search.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+COMPACT_DIR_NAME   = "compact"        # sub-folder of a collection's state directory
+MODES              = ("int8", "pq")
+PQ_M               = 96               # PQ sub-vectors (bytes per code), at most
+PQ_CENTROIDS       = 256              # per sub-vector — one uint8
+PQ_TRAIN_SAMPLE    = 10_000           # vectors used to train the codebooks (~40 per centroid)
+PQ_TRAIN_ITERS     = 15               # k-means iterations
+RESCORE_CANDIDATES = {"int8": 100,   # approximate hits re-scored exactly, per query —
+                      "pq": 400}      # PQ ranks coarser, so it needs a deeper pool
+SCAN_BLOCK         = 65_536           # code rows scored per step
+READ_PAGE          = 5000             # chunks per collection.get() while rebuilding
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Quantizers                                                   ║
+# ╚════════════════════════════════════════════════════════════════╝
+def _blocks(n: int, size: int = SCAN_BLOCK) -> Iterator[slice]:
+    for start in range(0, n, size):
+        yield slice(start, min(start + size, n))
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (squared L2) for every row of `x`."""
+    return np.argmin((centroids * centroids).sum(1) - 2.0 * x @ centroids.T, axis=1)
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.stack([np.bincount(assign, weights=x[:, j], minlength=k)
+                         for j in range(x.shape[1])], axis=1)
+        used = counts > 0
+        centroids[used] = sums[used] / counts[used, None]
+        if not used.all():                      # re-seed empty clusters
+            centroids[~used] = x[rng.choice(len(x), int((~used).sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+
+def train_int8(vectors: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-dimension range → 256 levels (one streaming min / max pass)."""
+    lo = np.full(vectors.shape[1], np.inf, dtype=np.float32)
+    hi = np.full(vectors.shape[1], -np.inf, dtype=np.float32)
+    for block in _blocks(len(vectors)):
+        lo = np.minimum(lo, vectors[block].min(0))
+        hi = np.maximum(hi, vectors[block].max(0))
+    return {"lo": lo, "step": np.maximum(hi - lo, 1e-12).astype(np.float32) / 255.0}
+
+
+def encode_int8(vectors: np.ndarray, params: Dict[str, np.ndarray]) -> np.ndarray:
+    levels = np.rint((vectors - params["lo"]) / params["step"])
+    return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+
+def pq_subvectors(dim: int) -> int:
+    """Sub-vectors per code: the largest divisor of `dim` up to PQ_M."""
+    return max(m for m in range(1, PQ_M + 1) if dim % m == 0)
+
+
+def train_pq(vectors: np.ndarray, seed: int = 0) -> Dict[str, np.ndarray]:
+    """k-means codebooks, one per sub-vector, from a sample of `vectors`."""
+    n, dim = vectors.shape
+    m = pq_subvectors(dim)
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, min(n, PQ_TRAIN_SAMPLE), replace=False))])
+    k = min(PQ_CENTROIDS, len(sample))
+    sub = dim // m
+    books = np.stack([_kmeans(sample[:, i * sub:(i + 1) * sub], k, PQ_TRAIN_ITERS, rng)
+                      for i in range(m)])
+    return {"codebooks": books}                  # (m, k, dim / m)
+
+
+def encode_pq(vectors: np.ndarray, params: Dict[str, np.ndarray]) -> np.ndarray:
+    books = params["codebooks"]
+    m, _, sub = books.shape
+    return np.stack([_nearest(vectors[:, i * sub:(i + 1) * sub], books[i]) for i in range(m)],
+                    axis=1).astype(np.uint8)
+
+
+TRAIN = {"int8": train_int8, "pq": train_pq}
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Store                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+class CompactStore:
+    """Read-only compact store of one collection (see module docstring)."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        self.mode: str = meta["mode"]
+        self.n, self.dim = meta["n"], meta["dim"]
+        self.codes = np.load(self.directory / "codes.npy", mmap_mode="r")
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")
+        self.ids = np.load(self.directory / "ids.npy", mmap_mode="r")
+        self.params = {name: np.load(self.directory / f"{name}.npy")
+                       for name in ("lo", "step", "codebooks")
+                       if (self.directory / f"{name}.npy").exists()}
+
+    @classmethod
+    def load(cls, db_path: Path) -> "CompactStore | None":
+        """The store under `db_path` (a state directory), or None if none was built."""
+        directory = Path(db_path) / COMPACT_DIR_NAME
+        return cls(directory) if (directory / "meta.json").exists() else None
+
+    def index_bytes(self) -> int:
+        """Size of what a search keeps in memory: codes + quantizer tables."""
+        return self.codes.nbytes + sum(p.nbytes for p in self.params.values())
+
+    # ── pass 1: approximate scores from the codes ──────────────────
+    def _approx(self, queries: np.ndarray, block: slice) -> np.ndarray:
+        """(rows, queries) approximate inner products for one block of codes."""
+        if self.mode == "int8":
+            # q·x ≈ q·lo + Σ q_d·step_d·(code_d + 128); the first and last
+            # terms are the same for every row, so ranking needs only the middle
+            return self.codes[block].astype(np.float32) @ (queries * self.params["step"]).T
+        books = self.params["codebooks"]
+        m, _, sub = books.shape
+        codes = np.asarray(self.codes[:, block])                    # (m, rows)
+        tables = np.einsum("mkd,qmd->qmk", books, queries.reshape(len(queries), m, sub))
+        scores = np.zeros((len(queries), codes.shape[1]), dtype=np.float32)
+        for row, table in zip(scores, tables):
+            for i in range(m):
+                row += table[i].take(codes[i])
+        return scores.T
+
+    def _candidates(self, queries: np.ndarray, c: int) -> np.ndarray:
+        """The `c` best rows per query by approximate score, as a (queries, c) array."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for block in _blocks(self.n):
+            scores = self._approx(queries, block).T                 # (queries, rows)
+            rows = np.arange(block.start, block.stop)[None, :].repeat(len(queries), 0)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+            if scores.shape[1] > c:
+                keep = np.argpartition(-scores, c - 1, axis=1)[:, :c]
+                scores = np.take_along_axis(scores, keep, 1)
+                rows = np.take_along_axis(rows, keep, 1)
+            best_scores, best_rows = scores, rows
+        return best_rows
+
+    # ── pass 2: exact re-score ──────────────────────────────────────
+    def search(self, query_vecs: np.ndarray, k: int,
+               candidates: int | None = None) -> List[List[Tuple[str, float]]]:
+        """
+        Top `k` ``(chunk ID, cosine similarity)`` per query, best first,
+        re-scored from the best `candidates` (RESCORE_CANDIDATES) codes.
+        """
+        candidates = candidates or RESCORE_CANDIDATES[self.mode]
+        queries = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-10)
+        if not self.n or k <= 0:
+            return [[] for _ in queries]
+        cand = self._candidates(queries, min(max(candidates, k), self.n))
+
+        # One sorted read of every candidate row (page-cache friendly)
+        rows = np.unique(cand)
+        position = {int(row): i for i, row in enumerate(rows)}
+        vectors = np.asarray(self.vectors[rows])
+        results: List[List[Tuple[str, float]]] = []
+        for query, query_rows in zip(queries, cand):
+            sims = vectors[[position[int(r)] for r in query_rows]] @ query
+            top = np.argsort(-sims, kind="stable")[:k]
+            results.append([(str(self.ids[query_rows[i]]), float(sims[i])) for i in top])
+        return results
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Build                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+def _encode_dir(tmp: Path, ids: Sequence[str], vectors: np.ndarray, mode: str,
+                params: Dict[str, np.ndarray] | None) -> None:
+    """Train (unless `params` are reused) and write codes + metadata into `tmp`."""
+    if mode not in MODES:
+        raise ValueError(f"unknown compact mode {mode!r} (choose from {', '.join(MODES)})")
+    n, dim = vectors.shape
+    params = params or TRAIN[mode](vectors)
+    if mode == "pq":
+        codes = open_memmap(tmp / "codes.npy", mode="w+", dtype=np.uint8,
+                            shape=(params["codebooks"].shape[0], n))
+        for block in _blocks(n):
+            codes[:, block] = encode_pq(np.asarray(vectors[block]), params).T
+    else:
+        codes = open_memmap(tmp / "codes.npy", mode="w+", dtype=np.int8, shape=(n, dim))
+        for block in _blocks(n):
+            codes[block] = encode_int8(np.asarray(vectors[block]), params)
+    codes.flush()
+    for name, array in params.items():
+        np.save(tmp / f"{name}.npy", array)
+    np.save(tmp / "ids.npy", np.array(list(ids), dtype=str))
+    (tmp / "meta.json").write_text(json.dumps({"mode": mode, "n": n, "dim": dim}), encoding="utf-8")
+
+
+def _swap(tmp: Path, directory: Path) -> None:
+    """Replace `directory` by `tmp` — readers never see half a store."""
+    old = directory.with_name(COMPACT_DIR_NAME + ".old")
+    if directory.exists():
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def _reusable(db_path: Path, mode: str, dim: int) -> Dict[str, np.ndarray] | None:
+    """PQ codebooks of the current store, if they fit (k-means is the slow part)."""
+    store = CompactStore.load(db_path)
+    if store is None or mode != "pq" or store.mode != "pq" or store.dim != dim:
+        return None
+    if store.params["codebooks"].shape[0] != pq_subvectors(dim):
+        return None
+    return {"codebooks": store.params["codebooks"]}
+
+
+def rebuild_from_collection(collection: Any, db_path: Path, mode: str) -> CompactStore | None:
+    """
+    Write the compact store of every chunk currently in `collection`
+    (None, and no store, if it is empty).
+
+    Vectors are paged out of Chroma straight into the on-disk
+    ``vectors.npy``; a PQ store keeps the codebooks of the previous build
+    (a ``--full`` rebuild trains new ones).
+    """
+    total = collection.count()
+    if not total:
+        remove(db_path)
+        return None
+    directory = Path(db_path) / COMPACT_DIR_NAME
+    tmp = directory.with_name(COMPACT_DIR_NAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    ids: List[str] = []
+    vectors: np.memmap | None = None
+    while len(ids) < total:
+        page = collection.get(include=["embeddings"], limit=READ_PAGE, offset=len(ids))
+        if not page["ids"]:
+            break
+        block = np.asarray(page["embeddings"], dtype=np.float32)[:total - len(ids)]
+        if vectors is None:
+            vectors = open_memmap(tmp / "vectors.npy", mode="w+", dtype=np.float32,
+                                  shape=(total, block.shape[1]))
+        block /= np.linalg.norm(block, axis=1, keepdims=True) + 1e-10
+        vectors[len(ids):len(ids) + len(block)] = block
+        ids.extend(page["ids"][:len(block)])
+    if vectors is None:                          # emptied before the first page
+        shutil.rmtree(tmp, ignore_errors=True)
+        remove(db_path)
+        return None
+    vectors.flush()
+    if len(ids) < total:                         # collection shrank while reading
+        trimmed = tmp / "vectors.trim.npy"       # vectors.npy itself still holds `total` rows
+        np.save(trimmed, vectors[:len(ids)])
+        del vectors
+        os.replace(trimmed, tmp / "vectors.npy")
+        vectors = np.load(tmp / "vectors.npy", mmap_mode="r")
+
+    _encode_dir(tmp, ids, vectors, mode, _reusable(db_path, mode, vectors.shape[1]))
+    del vectors                                  # close the memmap before the rename
+    _swap(tmp, directory)
+    return CompactStore(directory)
+
+
+def build(ids: Sequence[str], vectors: np.ndarray, db_path: Path, mode: str) -> CompactStore:
+    """Write a compact store of `vectors` (rows matching `ids`) under `db_path`."""
+    directory = Path(db_path) / COMPACT_DIR_NAME
+    tmp = directory.with_name(COMPACT_DIR_NAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    unit = open_memmap(tmp / "vectors.npy", mode="w+", dtype=np.float32, shape=vectors.shape)
+    for block in _blocks(len(vectors)):
+        part = np.asarray(vectors[block], dtype=np.float32)
+        unit[block] = part / (np.linalg.norm(part, axis=1, keepdims=True) + 1e-10)
+    unit.flush()
+    _encode_dir(tmp, ids, unit, mode, None)
+    del unit
+    _swap(tmp, directory)
+    return CompactStore(directory)
+
+
+def remove(db_path: Path) -> None:
+    """Delete the store (e.g. when an indexer ran without ``--compact``)."""
+    shutil.rmtree(Path(db_path) / COMPACT_DIR_NAME, ignore_errors=True)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 5.  Recall benchmark                                             ║
+# ╚════════════════════════════════════════════════════════════════╝
+def synthetic_vectors(n: int, dim: int = 384, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit vectors around random topic centres — closer to real embeddings than pure noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(clusters, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(vectors: np.ndarray, workdir: Path, queries: int = 200, k: int = 10) -> None:
+    """
+    Recall@k of both modes against exact search over `vectors`.  Queries
+    are perturbed copies of random rows; the truth is brute-force cosine.
+    """
+    rng = np.random.default_rng(1)
+    unit = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10)
+    picks = rng.choice(len(unit), min(queries, len(unit)), replace=False)
+    q = unit[picks] + 0.05 * rng.standard_normal((len(picks), unit.shape[1])).astype(np.float32)
+    q /= np.linalg.norm(q, axis=1, keepdims=True)
+    truth = [set(np.argsort(-(unit @ query))[:k].tolist()) for query in q]
+    ids = [str(i) for i in range(len(unit))]
+
+    float_bytes = unit.nbytes
+    print(f"{len(unit)} vectors × {unit.shape[1]} dims — float32 index {float_bytes / 2**20:.1f} MiB; "
+          f"{len(picks)} queries, recall@{k}")
+    for mode in MODES:
+        started = time.perf_counter()
+        store = build(ids, unit, workdir / mode, mode)
+        built = time.perf_counter() - started
+        approx = store._candidates(q, k)
+        started = time.perf_counter()
+        hits = store.search(q, k)
+        per_query = (time.perf_counter() - started) / len(q) * 1000
+        recall_approx = np.mean([len(truth[i] & set(approx[i].tolist())) / k for i in range(len(q))])
+        recall = np.mean([len(truth[i] & {int(cid) for cid, _ in row}) / k for i, row in enumerate(hits)])
+        print(f"  {mode:<4}  index {store.index_bytes() / 2**20:7.1f} MiB "
+              f"({float_bytes / store.index_bytes():4.1f}× smaller)  "
+              f"recall {recall_approx:.3f} approx → {recall:.3f} re-scored  "
+              f"{per_query:.2f} ms/query  (built in {built:.1f}s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall / memory benchmark of the compact store")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--collection", help="benchmark the vectors of this collection")
+    source.add_argument("--synthetic", type=int, metavar="N", help="benchmark N synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        data = synthetic_vectors(args.synthetic)
+    else:
+        from chromadb import PersistentClient
+        client = PersistentClient(path="./chroma_db")
+        coll = client.get_collection(args.collection)
+        pages = [np.asarray(coll.get(include=["embeddings"], limit=READ_PAGE, offset=o)["embeddings"],
+                            dtype=np.float32) for o in range(0, coll.count(), READ_PAGE)]
+        data = np.concatenate(pages) if pages else np.empty((0, 384), dtype=np.float32)
+    if not len(data):
+        raise SystemExit("No vectors to benchmark.")
+    work = Path("./.compact_bench")
+    try:
+        benchmark(data, work, queries=args.queries, k=args.k)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+embed_cache.py
+────────────────────────────────────────────────────────────────────
+Persistent embedding cache shared by the indexers, tools/search.py, the
+RAG agents and warmup_models.py.
+
+The same strings get embedded over and over: every PDF line and every
+unchanged code chunk on each re-index, the same queries on each search.
+This cache stores each vector once, on disk, keyed by
+
+    (model name, hash of the normalized text)
+
+so an unchanged corpus re-indexes with **zero** model forward passes and
+a repeated query never reaches the encoder.
+
+Layout (one folder per model under EMBED_CACHE_DIR)
+---------------------------------------------------
+* ``vectors.f32``  — float32 matrix, one row per cached text, appended
+  to and read back through ``numpy.memmap`` (no load step, pages come in
+  from the OS cache as needed);
+* ``index.sqlite`` — text hash → row number, plus the row count and
+  vector dimension.  Appends happen inside one SQLite write
+  transaction, so several processes can share a cache safely.
+
+Queries additionally go through a small in-memory LRU.
+
+Normalization collapses runs of whitespace and strips the ends —
+the MiniLM (BERT word-piece) tokenizer splits on whitespace anyway, so
+this never changes the vector, but it lets re-wrapped text hit.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", "./.embed_cache"))
+QUERY_LRU_SIZE  = 1024              # query vectors kept in memory
+LOOKUP_CHUNK    = 500               # hashes per SQLite IN (...) lookup
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Unicode-NFC, whitespace collapsed to single spaces, ends stripped."""
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text: str) -> bytes:
+    """16-byte BLAKE2 digest of the normalized text."""
+    return hashlib.blake2b(normalize_text(text).encode("utf-8"), digest_size=16).digest()
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Cache                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+class EmbeddingCache:
+    """
+    Disk-backed (model, text-hash) → vector cache in front of an encoder.
+
+    Parameters
+    ----------
+    model_name : str
+        Identifies the vector space; use a different name for a
+        different model *or runtime* (e.g. ONNX vs. sentence-transformers).
+    embed : Callable[[List[str]], Any]
+        Encodes a list of texts to an (n, dim) array-like — e.g. a Chroma
+        embedding function or ``SentenceTransformer.encode``.  Only
+        called for cache misses, once per batch.
+    cache_dir : Path
+        Root folder; the model's files live in a sub-folder.
+    """
+
+    def __init__(self, model_name: str, embed: Callable[[List[str]], Any],
+                 cache_dir: Path = EMBED_CACHE_DIR, lru_size: int = QUERY_LRU_SIZE) -> None:
+        self.model_name = model_name
+        self._embed = embed
+        self.dir = Path(cache_dir) / re.sub(r"[^\w.-]+", "_", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.dir / "vectors.f32"
+
+        self._db = sqlite3.connect(self.dir / "index.sqlite", check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key BLOB PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+        self._lock = threading.Lock()
+        self._matrix: np.memmap | None = None
+        self._lru: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lru_size = lru_size
+        self.hits = self.misses = self.query_hits = 0
+
+    # ── on-disk index ───────────────────────────────────────────────
+    def _meta(self, name: str) -> int | None:
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _lookup(self, keys: Sequence[bytes]) -> Dict[bytes, int]:
+        rows: Dict[bytes, int] = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            part = keys[start:start + LOOKUP_CHUNK]
+            marks = ",".join("?" * len(part))
+            rows.update(self._db.execute(
+                f"SELECT key, row FROM vectors WHERE key IN ({marks})", part
+            ).fetchall())
+        return rows
+
+    def _store(self, keys: List[bytes], vectors: np.ndarray) -> None:
+        """Append rows for `keys` and index them, in one write transaction."""
+        self._db.execute("BEGIN IMMEDIATE")          # serialises writers across processes
+        try:
+            dim = self._meta("dim")
+            if dim is None:
+                dim = vectors.shape[1]
+                self._db.execute("INSERT INTO meta VALUES ('dim', ?)", (dim,))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"{self.model_name}: cached dim {dim} != new dim {vectors.shape[1]}")
+            count = self._meta("rows") or 0
+
+            with open(self._vectors_path, "r+b" if self._vectors_path.exists() else "w+b") as fh:
+                fh.seek(count * dim * 4)
+                fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            self._db.executemany(
+                "INSERT OR IGNORE INTO vectors VALUES (?, ?)",
+                [(key, count + i) for i, key in enumerate(keys)],
+            )
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('rows', ?)", (count + len(keys),))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def _rows_matrix(self, needed: int) -> np.memmap:
+        """Memory-map the vector file, re-mapping once it has grown past `needed` rows."""
+        if self._matrix is None or self._matrix.shape[0] < needed:
+            rows, dim = self._meta("rows") or 0, self._meta("dim") or 0
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, dim))
+        return self._matrix
+
+    # ── public API ──────────────────────────────────────────────────
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Return an (n, dim) float32 array for `texts`, encoding only the
+        texts not cached yet (each distinct one once, in a single call).
+        """
+        if not texts:
+            return np.zeros((0, self._meta("dim") or 0), dtype=np.float32)
+        keys = [text_key(t) for t in texts]
+
+        with self._lock:
+            rows = self._lookup(list(set(keys)))
+            todo: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in rows and key not in todo:
+                    todo[key] = text
+            self.hits += len(keys) - sum(1 for k in keys if k in todo)
+            self.misses += len(todo)
+
+            if todo:
+                vectors = np.asarray(self._embed(list(todo.values())), dtype=np.float32)
+                self._store(list(todo), vectors)
+                rows.update(self._lookup(list(todo)))
+
+            matrix = self._rows_matrix(max(rows.values()) + 1)
+            return np.array(matrix[[rows[k] for k in keys]])
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """One query vector — from the in-memory LRU, the disk cache, or the encoder."""
+        key = text_key(text)
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.query_hits += 1
+                return vector
+        vector = self.embed_documents([text])[0]
+        with self._lock:
+            self._lru[key] = vector
+            if len(self._lru) > self._lru_size:
+                self._lru.popitem(last=False)
+        return vector
+
+    def __call__(self, input: Sequence[str]) -> List[np.ndarray]:
+        """Chroma-style call: list of texts in, list of vectors out."""
+        return list(self.embed_documents(input))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "rows": self._meta("rows") or 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "query_lru_hits": self.query_hits,
+        }
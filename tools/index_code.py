@@ -2,7 +2,7 @@
 """
 index_code.py
 ────────────────────────────────────────────────────────────────────
-Create a new Chroma DB vector index and index local *.py files
+Create (or incrementally update) a Chroma DB vector index of local *.py files
 inside the repository (or whichever directory `ROOT_DIR` points to).
 
 Design goals
@@ -12,38 +12,74 @@ Design goals
    vectors live in the **same semantic space**.
 2. **CPU-friendly** — MiniLM is <100 MB and runs quickly without a GPU
    or Ollama server.
-3. **Line-aware chunking** — never split a line of code; try to break
-   on blank lines; guarantee ≤ 500 GPT-3.5 tokens per chunk.
+3. **Syntax-aware chunking** — one chunk per function, class or method
+   (via `ast`), split further only past 500 GPT-3.5 tokens, and never
+   in the middle of a line.
+4. **Parallel pipeline** — files are chunked on a process pool, embedded
+   in large batches and bulk-written to Chroma, all stages overlapping
+   (see index_pipeline.py).  A chunks/sec + per-stage timing report is
+   printed at the end.
 
 Output
 ------
-• `./chroma_db/` — on-disk Chroma database (overwritten on each run)
-• Collection name `"codebase"`
-• One vector per code chunk, metadata keeps file path + chunk index
+• `./chroma_db/` — on-disk Chroma database, shared with index_pdf.py
+• Collection `"code"` (or `--collection NAME`), listed in
+  `./chroma_db/collections.json` (see registry.py)
+• One vector per code chunk, metadata keeps file path, chunk index,
+  symbol (e.g. `MCPSession.connect`), kind and start / end line
+• `./chroma_db/collections/code/index_manifest.json` — path → content
+  hash → chunk IDs
+• `./chroma_db/collections/code/bm25/` — keyword index for hybrid
+  search (see bm25.py; skip with `--no-bm25`)
+• `./chroma_db/collections/code/compact/` — optional int8 / PQ vector
+  store for large corpora (`--compact`, see compact_store.py)
+• `./chroma_db/collections/code/snapshot/` — optional memory-mapped,
+  read-only export for fast-start search (`--snapshot`, see snapshot.py)
+
+Incremental by default
+----------------------
+Files whose hash matches the manifest are skipped; for changed files
+only chunks with new text are embedded, and chunks of deleted files are
+removed.  The collection is rebuilt from scratch with `--full`, or
+automatically when it was last written by index_pdf.py or with a
+different model / chunk size.  Other collections are never touched.
 """
 
 from __future__ import annotations
 
 # ─── standard library ─────────────────────────────────────────────
+import argparse
+import ast
 import os
-import shutil
+import re
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Dict, List, Tuple
 
 # ─── third-party ---------------------------------------------------
 from tiktoken import encoding_for_model                        # token counter
-from chromadb import PersistentClient                          # Chroma client
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-from chromadb.utils.embedding_functions import (
-    SentenceTransformerEmbeddingFunction,                      # SBERT embeddings
-)
+# chromadb is imported by index_python_sources(): `--help` and the
+# chunking worker processes don't need it
+
+# ─── local ----------------------------------------------------------
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from manifest import IndexManifest, file_hash, prune_removed
+from embed_cache import EmbeddingCache
+from index_pipeline import run_pipeline
+from bm25 import rebuild_from_collection, remove as remove_bm25
+from compact_store import MODES, rebuild_from_collection as rebuild_compact, remove as remove_compact
+from registry import CollectionRegistry
+from snapshot import ensure as ensure_snapshot, remove as remove_snapshot
 
 # ╔════════════════════════════════════════════════════════════════╗
 # 1.  Configuration                                                ║
 # ╚════════════════════════════════════════════════════════════════╝
 ROOT_DIR         = Path(".")                    # directory tree to scan
 CHROMA_PATH      = Path("./chroma_db")          # where vectors are stored
-COLLECTION_NAME  = "codebase"                   # logical collection name
+COLLECTION_NAME  = "code"                       # default collection (registry.py)
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"           # SBERT model
 MAX_TOKENS       = 500                          # ≤500 GPT-3.5 tokens/chunk
 
@@ -58,77 +94,160 @@ SKIP_DIRS = {
 # ╔════════════════════════════════════════════════════════════════╗
 # 2.  Chunking helper (Python-code aware)                          ║
 # ╚════════════════════════════════════════════════════════════════╝
-def chunk_python_code(code: str, max_tokens: int = MAX_TOKENS) -> Iterable[str]:
+# One tokenizer per process — also used by index_pdf.py's chunker.  It is
+# loaded on first use (tiktoken may have to download it), not at import;
+# tiktoken's own registry lock makes concurrent first calls safe.
+@lru_cache(maxsize=None)
+def _encoding() -> Any:
+    return encoding_for_model("gpt-3.5-turbo")
+
+# Source text may contain "<|endoftext|>" & co.; count them as plain text
+_NO_SPECIAL: dict = {"disallowed_special": ()}
+
+DEFS     = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+NEWLINE  = re.compile(r"\r\n|\r|\n")           # the line breaks `ast` counts
+
+def count_tokens(text: str) -> int:
+    """GPT-3.5 token count, the unit all chunk budgets are expressed in."""
+    return len(_encoding().encode(text, **_NO_SPECIAL))
+
+def _line_tokens(lines: List[str]) -> List[int]:
+    """Token count per line, from a single ``encode`` of the whole block."""
+    text = "\n".join(lines)
+    encoding = _encoding()
+    _, offsets = encoding.decode_with_offsets(encoding.encode(text, **_NO_SPECIAL))
+    starts = list(accumulate((len(line) + 1 for line in lines[:-1]), initial=0))
+    counts = [0] * len(lines)
+    for offset in offsets:                        # a token belongs to the line it starts on
+        counts[bisect_right(starts, offset) - 1] += 1
+    return counts
+
+def _segments(nodes: List[ast.stmt], start: int, end: int,
+              prefix: str, outer: str) -> List[Tuple[int, int, ast.stmt | None, str]]:
     """
-    Yield contiguous code blocks (≤ `max_tokens`) **without breaking lines.**
+    Cut lines `start`..`end` (1-based, inclusive) into ``(first, last,
+    node, symbol)`` segments: one per def / class in `nodes`, and one per
+    run of other statements (``node`` None, symbol `outer`).  Comments
+    and blank lines go with the statement that follows them.
+    """
+    segments: List[Tuple[int, int, ast.stmt | None, str]] = []
+    cursor = start
+    for node in nodes:
+        last = node.end_lineno or node.lineno
+        if isinstance(node, DEFS):
+            segments.append((cursor, last, node, prefix + node.name))
+        elif segments and segments[-1][2] is None:
+            segments[-1] = (segments[-1][0], last, None, outer)   # extend the statement run
+        else:
+            segments.append((cursor, last, None, outer))
+        cursor = last + 1
+    if segments and cursor <= end:                # trailing comments
+        first, _, node, symbol = segments[-1]
+        segments[-1] = (first, end, node, symbol)
+    return segments
+
+def chunk_python_code(code: str, max_tokens: int = MAX_TOKENS) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Split a Python file into chunks of whole functions, classes and
+    methods (≤ `max_tokens`), **without breaking lines.**
 
     Strategy
     --------
-    1. Count GPT-3.5 tokens for *every* physical line (`tiktoken`).
-    2. Accumulate lines until:
-         • adding the next line would exceed `max_tokens`, OR
-         • we hit a *blank* line and already have content (makes blocks
-           roughly correspond to logical sections).
-    3. Yield the current chunk, reset counters, and continue.
+    1. Parse the file with `ast`; every top-level function / class is
+       one chunk, runs of other statements (imports, constants, …)
+       form one chunk each.  Comments above a definition stay with it.
+    2. A class over budget is split into its methods (the ``class``
+       line and class-level statements go with the first part).
+    3. Anything still over budget — a huge function, or a file that
+       does not parse — is packed line by line, preferring to break at
+       blank lines.
+    Token counts come from one ``encode`` per block (or per oversized
+    block, for its per-line counts).
 
     Returns
     -------
-    Iterable[str]
-        Each yielded string is a code chunk ready for embedding.
+    List[Tuple[str, Dict[str, Any]]]
+        ``(code, {"symbol", "kind", "start_line", "end_line"})`` per
+        chunk; ``symbol`` is e.g. ``"MCPSession.connect"`` and ``kind``
+        one of ``"function"``, ``"class"``, ``"method"``, ``"module"``.
     """
-    enc = encoding_for_model("gpt-3.5-turbo")
-
-    current_lines: List[str] = []
-    token_count = 0
-
-    for line in code.splitlines():
-        line_tokens = len(enc.encode(line + "\n"))
-
-        # Hard break: next line would overflow token budget
-        if current_lines and token_count + line_tokens > max_tokens:
-            yield "\n".join(current_lines)
-            current_lines, token_count = [], 0
-
-        # Soft break: blank line signals logical separation
-        if not line.strip() and current_lines:
-            yield "\n".join(current_lines)
-            current_lines, token_count = [], 0
-            continue                      # do *not* include the blank line
-
-        current_lines.append(line)
-        token_count += line_tokens
-
-    if current_lines:                     # last chunk (file may not end with \n)
-        yield "\n".join(current_lines)
+    lines = NEWLINE.split(code)
+    chunks: List[Tuple[str, Dict[str, Any]]] = []
+
+    def add(first: int, last: int, symbol: str, kind: str) -> None:
+        # Trim blank edges; an all-blank range yields nothing
+        while first <= last and not lines[first - 1].strip():
+            first += 1
+        while last >= first and not lines[last - 1].strip():
+            last -= 1
+        if first <= last:
+            chunks.append(("\n".join(lines[first - 1:last]),
+                           {"symbol": symbol, "kind": kind, "start_line": first, "end_line": last}))
+
+    def emit(first: int, last: int, symbol: str, kind: str) -> None:
+        block = lines[first - 1:last]
+        if count_tokens("\n".join(block)) <= max_tokens:
+            add(first, last, symbol, kind)
+            return
+        # Over budget: pack whole lines, breaking at a blank line once half full
+        piece, tokens = first, 0
+        for lineno, n in zip(range(first, last + 1), _line_tokens(block)):
+            blank = not lines[lineno - 1].strip()
+            if tokens and (tokens + n > max_tokens or (blank and tokens >= max_tokens // 2)):
+                add(piece, lineno - 1, symbol, kind)
+                piece, tokens = lineno, 0
+            tokens += n
+        add(piece, last, symbol, kind)
+
+    def walk(nodes: List[ast.stmt], start: int, end: int, prefix: str, outer: str,
+             outer_kind: str, def_kind: str) -> None:
+        for first, last, node, symbol in _segments(nodes, start, end, prefix, outer):
+            if node is None:
+                emit(first, last, symbol, outer_kind)
+            elif isinstance(node, ast.ClassDef) and \
+                    count_tokens("\n".join(lines[first - 1:last])) > max_tokens:
+                walk(node.body, first, last, symbol + ".", symbol, "class", "method")
+            else:
+                emit(first, last, symbol,
+                     "class" if isinstance(node, ast.ClassDef) else def_kind)
+
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):             # not Python 3 — plain line packing
+        emit(1, len(lines), "<module>", "module")
+        return chunks
+    walk(tree.body, 1, len(lines), "", "<module>", "module", "function")
+    return chunks
+
+def load_python_file(path: Path) -> List[Tuple[str, Dict[str, Any]]]:
+    """Read one source file and chunk it (runs in the indexing process pool)."""
+    return chunk_python_code(path.read_text(encoding="utf-8", errors="ignore"))
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 3.  Fresh-DB helper                                              ║
+# 3.  Main routine                                                 ║
 # ╚════════════════════════════════════════════════════════════════╝
-def reset_chroma(db_path: Path) -> None:
-    """
-    Delete any existing Chroma folder so we *always* start from scratch.
-    Avoids mixed embeddings if you tweak chunking rules or the model.
+def index_python_sources(full: bool = False, keyword_index: bool = True,
+                         collection_name: str = COLLECTION_NAME,
+                         compact: str | None = None, snapshot: bool = False) -> None:
     """
-    if db_path.exists():
-        shutil.rmtree(db_path)
-    db_path.mkdir(parents=True, exist_ok=True)
-
-# ╔════════════════════════════════════════════════════════════════╗
-# 4.  Main routine                                                 ║
-# ╚════════════════════════════════════════════════════════════════╝
-def index_python_sources() -> None:
-    """
-    Walk the directory tree under `ROOT_DIR`, embed every `.py` file,
-    and store vectors + metadata in a fresh Chroma database.
+    Walk the directory tree under `ROOT_DIR` and bring collection
+    `collection_name` in line with every `.py` file — incrementally, or
+    from scratch if `full` is set (or the manifest can't be trusted).
+    With `keyword_index`, the BM25 index for hybrid search is rebuilt too;
+    with `compact` ("int8" / "pq"), the compact vector store as well.
+    With `snapshot`, a memory-mapped snapshot is exported for fast-start
+    readers (see snapshot.py).
     """
     if not ROOT_DIR.exists():
         print(f"[ERROR] {ROOT_DIR.resolve()} does not exist.")
         return
 
-    # ── 1. Fresh on-disk DB ───────────────────────────────────────
-    reset_chroma(CHROMA_PATH)
-
-    # ── 2. Connect to persistent Chroma client ────────────────────
+    # ── 1. Connect to persistent Chroma client ────────────────────
+    from chromadb import PersistentClient                      # Chroma client
+    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+    from chromadb.utils.embedding_functions import (
+        SentenceTransformerEmbeddingFunction,                  # SBERT embeddings
+    )
     client = PersistentClient(
         path=str(CHROMA_PATH),
         settings=Settings(),                # default Chroma settings
@@ -136,19 +255,40 @@ def index_python_sources() -> None:
         database=DEFAULT_DATABASE,
     )
 
+    # ── 2. Incremental, or fresh collection ───────────────────────
+    registry = CollectionRegistry(CHROMA_PATH)
+    state_dir = registry.state_dir(collection_name)
+    manifest = IndexManifest(
+        state_dir,
+        owner="index_code",
+        config={"model": EMBED_MODEL_NAME, "collection": collection_name,
+                "max_tokens": MAX_TOKENS, "chunker": "ast"},
+    )
+    rebuild = full or not manifest.compatible
+    if rebuild:
+        print(f"Full rebuild of collection '{collection_name}'")
+        registry.reset(client, collection_name)
+        manifest.files.clear()
+
     # Explicit SBERT embedding function — same model/runtime as the
     # PDF pipeline, and keeps Chroma from loading its ONNX default
     # (which is what produced the onnxruntime warning).
     embed_fn = SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_NAME)
 
+    # Vectors are looked up in the shared on-disk cache first; only text
+    # never embedded before goes through the model.
+    embed_cache = EmbeddingCache(EMBED_MODEL_NAME, embed_fn)
+
     collection = client.get_or_create_collection(
-        COLLECTION_NAME,
+        collection_name,
         embedding_function=embed_fn,
     )
 
-    file_counter = 0
+    skipped = 0
+    seen: List[str] = []
+    jobs: List[tuple] = []
 
-    # ── 3. Recursively scan .py files ─────────────────────────────
+    # ── 3. Recursively scan .py files; queue new / changed ones ───
     for root, dirs, files in os.walk(ROOT_DIR):
         # In-place filter to stop os.walk() descending into skip folders
         dirs[:] = [
@@ -161,42 +301,85 @@ def index_python_sources() -> None:
                 continue
 
             file_path = Path(root) / name
+            seen.append(str(file_path))
 
-            # Read file
+            # Unchanged since the last run → nothing to do
             try:
-                code_text = file_path.read_text(encoding="utf-8", errors="ignore")
+                digest = file_hash(file_path)
             except Exception as err:
                 print(f"[WARN] Could not read {file_path}: {err}")
                 continue
-
-            # Chunk the file, then add all chunks in one batched call
-            ids: List[str] = []
-            documents: List[str] = []
-            metadatas: List[dict] = []
-
-            for idx, chunk in enumerate(chunk_python_code(code_text)):
-                ids.append(f"{file_path}-{idx}")
-                documents.append(chunk)
-                metadatas.append({"path": str(file_path), "chunk_index": idx})
-
-            if documents:
-                collection.add(
-                    ids=ids,
-                    documents=documents,
-                    metadatas=metadatas,
-                )
-
-            file_counter += 1
-            print(f"Indexed {file_path}")
-
-    # ── 4. Done ───────────────────────────────────────────────────
+            if manifest.unchanged(str(file_path), digest):
+                skipped += 1
+            else:
+                jobs.append((str(file_path), digest))
+
+    # ── 4. Chunk (process pool) → embed (batched) → bulk write ────
+    try:
+        stats = run_pipeline(
+            jobs, load_python_file, collection, manifest, embed_cache.embed_documents,
+            on_file=lambda path, added, removed: print(
+                f"Indexed {path}  (+{added} / -{removed} chunks)"
+            ),
+        )
+
+        # ── 5. Drop chunks of files that no longer exist ──────────
+        gone = prune_removed(collection, manifest, seen)
+    finally:
+        manifest.save()
+
+    # ── 6. Keyword (BM25) index, compact vector store ─────────────
+    if keyword_index:
+        bm25 = rebuild_from_collection(collection, state_dir)
+        print(f"BM25 index: {bm25.n_docs} chunks, {len(bm25.terms)} terms")
+    else:
+        remove_bm25(state_dir)                # it would no longer match the vectors
+    if compact:
+        store = rebuild_compact(collection, state_dir, compact)
+        if store is not None:
+            print(f"Compact store ({compact}): {store.n} vectors, "
+                  f"{store.index_bytes() / 2**20:.1f} MiB in memory")
+    else:
+        remove_compact(state_dir)
+
+    # ── 7. Publish: readers see the new version ───────────────────
+    info = registry.publish(collection_name, "index_code", collection.count(),
+                            changed=bool(rebuild or stats.files or gone))
+
+    # ── 8. Read-only snapshot ─────────────────────────────────────
+    if snapshot:
+        snap = ensure_snapshot(collection, state_dir, info.version)
+        if snap is not None:
+            print(f"Snapshot: {snap.n} chunks at v{snap.version} → {snap.directory}")
+    else:
+        remove_snapshot(state_dir)            # it would no longer match the vectors
+
+    # ── 9. Done ───────────────────────────────────────────────────
     print(
-        f"Indexing complete: {file_counter} Python files processed.\n"
-        "New vector DB saved to ./chroma_db"
+        f"Indexing complete: {stats.files} Python files (re)indexed, "
+        f"{skipped} unchanged, {gone} removed.\n"
+        f"{stats.report()}\n"
+        f"Embedding cache: {embed_cache.stats()}\n"
+        f"Collection '{collection_name}' v{info.version} ({info.chunks} chunks) "
+        "saved to ./chroma_db"
     )
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 5.  Entry point                                                  ║
+# 4.  Entry point                                                  ║
 # ╚════════════════════════════════════════════════════════════════╝
 if __name__ == "__main__":
-    index_python_sources()
+    parser = argparse.ArgumentParser(description="Index *.py files into ./chroma_db")
+    parser.add_argument("--full", action="store_true",
+                        help="empty the collection and re-embed everything")
+    parser.add_argument("--collection", default=COLLECTION_NAME,
+                        help=f"collection to write (default: {COLLECTION_NAME})")
+    parser.add_argument("--no-bm25", action="store_true",
+                        help="skip the keyword index (search falls back to vectors only)")
+    parser.add_argument("--compact", choices=MODES,
+                        help="also write an int8 / product-quantized vector store for search")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="export a memory-mapped snapshot for fast-start search processes")
+    args = parser.parse_args()
+    index_python_sources(full=args.full, keyword_index=not args.no_bm25,
+                         collection_name=args.collection, compact=args.compact,
+                         snapshot=args.snapshot)
@@ -1,105 +1,369 @@
 #!/usr/bin/env python3
 """
-index_pdfs.py
+index_pdf.py
 ────────────────────────────────────────────────────────────────────
-Create a **fresh** ChromaDB vector-index from the contents of every PDF
-inside `./data/`, embedding **each non-blank line** with the
-*all-MiniLM-L6-v2* Sentence-BERT model.
+Create (or incrementally update) a ChromaDB vector index of every PDF
+inside `./data/`, embedding **layout-aware, token-bounded chunks** with
+the *all-MiniLM-L6-v2* Sentence-BERT model.
+
+    python tools/index_pdf.py                    # update "pdfs" in place
+    python tools/index_pdf.py --full             # rebuild from scratch
+    python tools/index_pdf.py --collection NAME --compact int8 --snapshot
 
 High-level flow
 ---------------
-1. **Reset DB** – delete any existing `./chroma_db/` folder so we never mix
-   embeddings from previous runs.
-2. **Collect PDFs** – scan `./data/*.pdf`.
-3. **Extract lines** – use *pdfplumber* to pull plain text from each page,
-   split on newlines, drop blank lines.
-4. **Embed** – convert each line to a 384-dimensional vector
-   (MiniLM-L6-v2).
-5. **Store** – write `(vector, raw line, metadata)` into a persistent
-   Chroma collection called `"codebase"`.
-
-After it finishes you can query the vectors with any Chroma-compatible
-client or the companion RAG script.
+1. **Connect** – open `./chroma_db/` and load the collection's manifest,
+   `./chroma_db/collections/pdfs/index_manifest.json` (path → content
+   hash → chunk IDs).  The `"pdfs"` collection (or `--collection NAME`)
+   is emptied only with `--full`, or when the manifest was written by
+   index_code.py or with a different model / chunking settings.  Other
+   collections (e.g. index_code.py's `"code"`) are never touched — see
+   registry.py.
+2. **Diff** – hash every `./data/*.pdf`; PDFs whose hash matches the
+   manifest are skipped, new and changed ones are queued.
+3. **Chunk** – use *pdfplumber* to find each page's tables and text
+   lines, one page per task on a process pool.  Extracted pages are
+   cached by (file hash, page) in `./.page_cache/`, so a PDF is only
+   extracted again when it changes.  Every table row becomes one record
+   labelled with its column headers (headers carry over to a table
+   continued on the next page, handed on in page order by the main
+   process); prose lines are grouped into paragraphs
+   and packed into chunks of ≤ PDF_MAX_TOKENS GPT-3.5 tokens.  Chunks
+   never span a page.
+4. **Embed + store** – chunks stream into the embedder as pages finish,
+   batched across pages and files, and are bulk-written to Chroma while
+   the next batch is embedded (see index_pipeline.py).  Only chunks with
+   new text are embedded; vectors of unchanged text come from the
+   embedding cache.  Metadata holds the file path, chunk index within
+   the page, page number and kind (`"text"` / `"table"`).
+5. **Prune** – chunks of PDFs removed from `./data/` are deleted.
+6. **Keyword / compact indexes** – the BM25 index in
+   `./chroma_db/collections/pdfs/bm25/` is rebuilt (see bm25.py;
+   `--no-bm25` skips it), and `--compact int8|pq` also writes a
+   quantized vector store next to it (see compact_store.py).
+7. **Publish** – the collection's version in `./chroma_db/collections.json`
+   is bumped, so running searches pick up the new data.
+8. **Snapshot** – with `--snapshot`, a memory-mapped read-only copy is
+   exported for fast-start search (see snapshot.py).
+
+A chunks/sec + per-stage timing report is printed at the end.  Query
+the vectors with any Chroma-compatible client, tools/search.py or the
+companion RAG script.
 """
 
+from __future__ import annotations
+
 # ───────────────────── standard-library imports ────────────────────
-import shutil
+import argparse
 import re
+import sys
 from pathlib import Path
-from typing import List
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
 
 # ───────────────────── 3rd-party imports ───────────────────────────
 import pdfplumber                               # PDF text extractor
-from chromadb import PersistentClient
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-from chromadb.utils.embedding_functions import (
-    SentenceTransformerEmbeddingFunction,       # SBERT embeddings
-)
+# chromadb is imported by index_pdfs(): `--help` and the page-parsing
+# worker processes don't need it
+
+# ───────────────────── local imports ───────────────────────────────
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from manifest import IndexManifest, file_hash, prune_removed
+from embed_cache import EmbeddingCache
+from index_pipeline import run_pipeline
+from bm25 import rebuild_from_collection, remove as remove_bm25
+from compact_store import MODES, rebuild_from_collection as rebuild_compact, remove as remove_compact
+from page_cache import get_page_cache
+from registry import CollectionRegistry
+from snapshot import ensure as ensure_snapshot, remove as remove_snapshot
+from index_code import count_tokens            # same tiktoken counting as the code chunker
 
 # ╔════════════════════════════════════════════════════════════════╗
 # 1.  Configuration / constants                                    ║
 # ╚════════════════════════════════════════════════════════════════╝
 PDF_DIR          = Path("./data")              # where to look for *.pdf
-CHROMA_PATH      = Path("./chroma_db")         # output folder (wiped each run)
-COLLECTION_NAME  = "codebase"                  # logical collection inside DB
+CHROMA_PATH      = Path("./chroma_db")         # output folder, shared with index_code.py
+COLLECTION_NAME  = "pdfs"                      # default collection (registry.py)
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"          # SBERT model
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 2.  Regex helper: split lines & trim whitespace                  ║
+# 2.  Layout-aware chunking                                        ║
 # ╚════════════════════════════════════════════════════════════════╝
-#   • `\r?\n`  = Windows or Unix newline
-#   • `[^\S\r\n]*` = optional leading/trailing spaces or tabs
-LINE_RE = re.compile(r"[^\S\r\n]*\r?\n[^\S\r\n]*")
+# Prose: whole lines are packed into chunks of ≤ PDF_MAX_TOKENS GPT-3.5
+# tokens, breaking at paragraph and page boundaries.  Tables: one chunk
+# per TABLE_ROWS_PER_CHUNK rows, every cell labelled with its column
+# header — an office row is one self-contained record.
+PDF_MAX_TOKENS       = 200     # token budget per prose chunk
+OVERLAP_TOKENS       = 0       # trailing prose lines repeated in the next chunk
+TABLE_ROWS_PER_CHUNK = 1       # table rows per chunk
+PARA_GAP_RATIO       = 0.8     # vertical gap (× line height) that starts a paragraph
+
+#   • `\s+` = runs of whitespace, incl. newlines inside table cells
+WS_RE = re.compile(r"\s+")
+
+
+def _clean(text: str | None) -> str:
+    return WS_RE.sub(" ", text or "").strip()
+
+
+def _is_header(row: List[str]) -> bool:
+    """Heuristic: a header row has a label in every cell and no numbers."""
+    return all(row) and not any(ch.isdigit() for cell in row for ch in cell)
+
+
+def _paragraphs(lines: List[dict]) -> List[Tuple[float, List[str]]]:
+    """Group pdfplumber text lines into ``(top, lines)`` paragraphs by their vertical gaps."""
+    paras: List[Tuple[float, List[str]]] = []
+    prev = None
+    for line in lines:
+        text = _clean(line["text"])
+        if not text:
+            continue
+        height = line["bottom"] - line["top"]
+        if prev is None or line["top"] - prev["bottom"] > PARA_GAP_RATIO * height:
+            paras.append((line["top"], []))
+        paras[-1][1].append(text)
+        prev = line
+    return paras
+
+
+def _pack_prose(paras: List[List[str]], max_tokens: int, overlap: int) -> List[str]:
+    """
+    Pack paragraphs into chunks of ≤ `max_tokens` without splitting lines.
 
-def extract_lines(path: Path) -> List[str]:
+    A chunk is closed at a paragraph boundary once the next paragraph
+    would not fit, or mid-paragraph (between lines) when one paragraph
+    alone is over budget.  With `overlap`, the last lines of a closed
+    chunk (up to that many tokens) start the next one.
     """
-    Read a PDF and return *every* non-blank line, preserving order.
+    chunks: List[str] = []
+    current: List[Tuple[str, int]] = []
+    tokens = carried = 0
+
+    def flush() -> None:
+        nonlocal current, tokens, carried
+        if len(current) > carried:                # never emit overlap alone
+            chunks.append("\n".join(text for text, _ in current))
+        tail: List[Tuple[str, int]] = []
+        budget = overlap
+        for text, n in reversed(current):
+            if n > budget:
+                break
+            tail.insert(0, (text, n))
+            budget -= n
+        current, tokens, carried = tail, sum(n for _, n in tail), len(tail)
+
+    for para in paras:
+        sized = [(line, count_tokens(line + "\n")) for line in para]
+        if len(current) > carried and tokens + sum(n for _, n in sized) > max_tokens:
+            flush()                               # paragraph boundary
+        for line, n in sized:
+            if len(current) > carried and tokens + n > max_tokens:
+                flush()                           # paragraph too long on its own
+            current.append((line, n))
+            tokens += n
+    if len(current) > carried:
+        chunks.append("\n".join(text for text, _ in current))
+    return chunks
+
+
+def _table_text(rows: List[List[str]], header: List[str] | None) -> str:
+    """Rows as ``Header: value; Header: value`` records, one per line."""
+    return "\n".join(
+        "; ".join(f"{name}: {cell}" if header else cell
+                  for name, cell in zip(header or row, row) if cell)
+        for row in rows
+    )
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Page extraction (one page per task, cached)                  ║
+# ╚════════════════════════════════════════════════════════════════╝
+# Runs in the indexer's worker processes: every page is its own task,
+# and its chunks are embedded as soon as it is done.  Extracted layouts
+# are cached by (file hash, page) — see page_cache.py.
+_open_pdf: Tuple[str, Any] | None = None        # last PDF opened by this worker
+
+
+def _pdf(path: Path) -> Any:
+    """Keep one PDF open per worker, so consecutive pages skip re-parsing it."""
+    global _open_pdf
+    if _open_pdf is None or _open_pdf[0] != str(path):
+        if _open_pdf is not None:
+            _open_pdf[1].close()
+        _open_pdf = (str(path), pdfplumber.open(path))
+    return _open_pdf[1]
+
+
+def _extract_layout(page: Any) -> List[List[Any]]:
+    """
+    ``[kind, payload]`` items of one page, top to bottom: ``["text",
+    lines]`` per paragraph and ``["table", rows]`` per non-empty table.
+    """
+    tables = page.find_tables()
+    bboxes = [t.bbox for t in tables]
+
+    def outside_tables(obj: dict) -> bool:
+        return not any(x0 <= obj["x0"] and obj["x1"] <= x1 and top <= obj["top"] and obj["bottom"] <= bottom
+                       for x0, top, x1, bottom in bboxes)
+
+    items: List[Tuple[float, str, Any]] = []
+    prose = page.filter(outside_tables) if bboxes else page
+    items.extend((top, "text", para) for top, para in _paragraphs(prose.extract_text_lines()))
+    for table in tables:
+        rows = [[_clean(cell) for cell in row] for row in table.extract()]
+        rows = [row for row in rows if any(row)]
+        if rows:
+            items.append((table.bbox[1], "table", rows))
+    items.sort(key=lambda item: item[0])
+    return [[kind, payload] for _, kind, payload in items]
+
+
+def _layout(path: Path, digest: str, page_no: int) -> List[List[Any]]:
+    """Layout of page `page_no` (1-based), from the page cache or pdfplumber."""
+    cache = get_page_cache()
+    layout = cache.get(digest, page_no)
+    if layout is None:
+        page = _pdf(path).pages[page_no - 1]
+        layout = _extract_layout(page)
+        page.close()                              # drop pdfplumber's per-page caches
+        cache.put(digest, page_no, layout)
+    return layout
+
+
+def count_pages(path: Path, digest: str) -> int:
+    """Number of pages of a PDF (cached by its content hash)."""
+    cache = get_page_cache()
+    pages = cache.page_count(digest)
+    if pages is None:
+        pages = len(_pdf(path).pages)
+        cache.set_page_count(digest, pages)
+    return pages
+
+
+@dataclass
+class PageChunks:
+    """
+    One page's chunks as a worker leaves them.  Rows of a table continued
+    from the previous page are kept as rows (its header is on an earlier
+    page) until :func:`link_pages` labels them.
+    """
+
+    chunks: List[Tuple[str | List[List[str]], Dict[str, Any]]]
+    continued_width: int | None          # columns of the continued table, if any
+    tail: List[str] | None               # header of the table the page ends in
+    tail_continued: bool = False         # …which is the continued table itself
+
+
+def load_page(
+    path: Path,
+    digest: str,
+    page_no: int,
+    max_tokens: int = PDF_MAX_TOKENS,
+    overlap: int = OVERLAP_TOKENS,
+) -> PageChunks:
+    """
+    Token-bounded chunks of one PDF page, respecting its layout.
 
     Parameters
     ----------
     path : Path
         Full path to a .pdf file.
+    digest : str
+        The file's content hash (the page-cache key).
+    page_no : int
+        1-based page number.
+    max_tokens : int
+        Token budget of a prose chunk (a single line is never split,
+        so an over-long line becomes a chunk of its own).
+    overlap : int
+        Tokens of trailing prose lines repeated at the start of the
+        next chunk.
 
     Returns
     -------
-    List[str]
-        One entry per non-empty line (page order kept).
+    PageChunks
+        ``(text, {"page": n, "kind": "text" | "table"})`` in reading
+        order, once :func:`link_pages` has labelled continued rows.
     """
-    lines: List[str] = []
-    with pdfplumber.open(path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            for raw_line in LINE_RE.split(text):
-                line = raw_line.strip()
-                if line:                      # skip blanks
-                    lines.append(line)
-    return lines
-
-def reset_chroma(db_path: Path) -> None:
+    items = _layout(path, digest, page_no)
+    meta = {"page": page_no}
+
+    # Tables continued from the previous page repeat no header row: their
+    # rows wait for link_pages, which knows the previous page's header
+    page = PageChunks(chunks=[], continued_width=None, tail=None)
+    header: List[str] | None = None
+    continued = False
+    pending: List[List[str]] = []
+    tables = 0
+    for kind, payload in items:
+        if kind == "text":
+            pending.append(payload)
+            continue
+        tables += 1
+        # A table ends the prose before it
+        page.chunks.extend((text, {**meta, "kind": "text"})
+                           for text in _pack_prose(pending, max_tokens, overlap))
+        pending = []
+
+        rows = payload
+        if _is_header(rows[0]):
+            header, rows, continued = rows[0], rows[1:], False
+        elif tables == 1:                          # may continue the last page's table
+            page.continued_width, continued = len(rows[0]), True
+        elif continued and len(rows[0]) != page.continued_width:
+            continued = False                     # a different table
+        elif header is not None and len(rows[0]) != len(header):
+            header = None                         # a different table
+        page.chunks.extend((rows[start:start + TABLE_ROWS_PER_CHUNK] if continued else
+                            _table_text(rows[start:start + TABLE_ROWS_PER_CHUNK], header),
+                            {**meta, "kind": "table"})
+                           for start in range(0, len(rows), TABLE_ROWS_PER_CHUNK))
+        page.tail, page.tail_continued = header, continued
+    page.chunks.extend((text, {**meta, "kind": "text"})
+                       for text in _pack_prose(pending, max_tokens, overlap))
+    return page
+
+
+def link_pages(previous: List[str] | None,
+               page: PageChunks) -> Tuple[List[Tuple[str, Dict[str, Any]]], List[str] | None]:
     """
-    Delete any existing `db_path` directory so we always start clean.
+    Label a page's continued rows with the header the previous page
+    ended in (`previous`), in page order in the main process.  Returns
+    the page's chunks and the header it hands on to the next page.
     """
-    if db_path.exists():
-        shutil.rmtree(db_path)
-    db_path.mkdir(parents=True, exist_ok=True)
+    header = previous if previous is not None and len(previous) == page.continued_width else None
+    chunks = [(item if isinstance(item, str) else _table_text(item, header), meta)
+              for item, meta in page.chunks]
+    return chunks, header if page.tail_continued else page.tail
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 3.  Main routine                                                 ║
+# 4.  Main routine                                                 ║
 # ╚════════════════════════════════════════════════════════════════╝
-def index_pdfs() -> None:
+def index_pdfs(full: bool = False, keyword_index: bool = True,
+               collection_name: str = COLLECTION_NAME, compact: str | None = None,
+               snapshot: bool = False) -> None:
     """
-    Walk `PDF_DIR`, embed every line of every PDF, and store everything
-    into a *new* ChromaDB at `CHROMA_PATH`.
+    Walk `PDF_DIR`, embed every chunk of every PDF, and store everything
+    in collection `collection_name` of the ChromaDB at `CHROMA_PATH` —
+    incrementally, or into an emptied collection if `full` is set (or
+    the manifest can't be trusted).  With
+    `keyword_index`, the BM25 index for hybrid search is rebuilt too;
+    with `compact` ("int8" / "pq"), the compact vector store as well.
+    With `snapshot`, a memory-mapped snapshot is exported for fast-start
+    readers (see snapshot.py).
     """
     pdf_files = sorted(PDF_DIR.glob("*.pdf"))
     if not pdf_files:
         print(f"No PDF files found in {PDF_DIR.resolve()}")
         return
 
-    # ── 1. Fresh DB on disk ───────────────────────────────────────
-    reset_chroma(CHROMA_PATH)
-
-    # ── 2. Connect to persistent Chroma client ────────────────────
+    # ── 1. Connect to persistent Chroma client ────────────────────
+    from chromadb import PersistentClient
+    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+    from chromadb.utils.embedding_functions import (
+        SentenceTransformerEmbeddingFunction,   # SBERT embeddings
+    )
     client = PersistentClient(
         path=str(CHROMA_PATH),
         settings=Settings(),                  # defaults are fine
@@ -107,41 +371,114 @@ def index_pdfs() -> None:
         database=DEFAULT_DATABASE,
     )
 
+    # ── 2. Incremental, or fresh collection ───────────────────────
+    registry = CollectionRegistry(CHROMA_PATH)
+    state_dir = registry.state_dir(collection_name)
+    manifest = IndexManifest(
+        state_dir,
+        owner="index_pdf",
+        config={
+            "model": EMBED_MODEL_NAME,
+            "collection": collection_name,
+            "max_tokens": PDF_MAX_TOKENS,
+            "overlap": OVERLAP_TOKENS,
+            "table_rows": TABLE_ROWS_PER_CHUNK,
+        },
+    )
+    rebuild = full or not manifest.compatible
+    if rebuild:
+        print(f"Full rebuild of collection '{collection_name}'")
+        registry.reset(client, collection_name)
+        manifest.files.clear()
+
     # Explicit SBERT embedding function — same model/runtime as the
     # code-indexing pipeline, and keeps Chroma from loading its ONNX
     # default (the source of the onnxruntime warning).
     embed_fn = SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_NAME)
 
+    # Unchanged chunks come from the shared on-disk embedding cache
+    embed_cache = EmbeddingCache(EMBED_MODEL_NAME, embed_fn)
+
     coll = client.get_or_create_collection(
-        COLLECTION_NAME,
+        collection_name,
         embedding_function=embed_fn,
     )
 
-    # ── 3. Iterate over every PDF ─────────────────────────────────
+    # ── 3. Hash every PDF; queue new / changed ones ───────────────
+    jobs = []
     for pdf_path in pdf_files:
-        print(f"→ Indexing {pdf_path.name}")
         try:
-            lines = extract_lines(pdf_path)
+            digest = file_hash(pdf_path)
         except Exception as err:
             print(f"[WARN] Could not read {pdf_path}: {err}")
             continue
+        if manifest.unchanged(str(pdf_path), digest):
+            print(f"✓ {pdf_path.name} unchanged")
+        else:
+            jobs.append((str(pdf_path), digest))
+
+    # ── 4. Pages (process pool) → embed (batched) → bulk write ──
+    try:
+        stats = run_pipeline(
+            jobs, load_page, coll, manifest, embed_cache.embed_documents,
+            on_file=lambda path, added, removed: print(
+                f"→ Indexed {Path(path).name}  (+{added} / -{removed} chunks)"
+            ),
+            count_parts=count_pages, link_parts=link_pages,
+        )
+
+        # ── 5. Drop chunks of PDFs that were deleted ───────────────
+        gone = prune_removed(coll, manifest, [str(p) for p in pdf_files])
+    finally:
+        manifest.save()
+
+    # ── 6. Keyword (BM25) index, compact vector store ─────────────
+    if keyword_index:
+        bm25 = rebuild_from_collection(coll, state_dir)
+        print(f"BM25 index: {bm25.n_docs} chunks, {len(bm25.terms)} terms")
+    else:
+        remove_bm25(state_dir)                # it would no longer match the vectors
+    if compact:
+        store = rebuild_compact(coll, state_dir, compact)
+        if store is not None:
+            print(f"Compact store ({compact}): {store.n} vectors, "
+                  f"{store.index_bytes() / 2**20:.1f} MiB in memory")
+    else:
+        remove_compact(state_dir)
 
-        # Batch all lines from this PDF into a single add() call
-        ids       = [f"{pdf_path}-{idx}" for idx in range(len(lines))]
-        metadatas = [{"path": str(pdf_path), "chunk_index": idx}
-                     for idx in range(len(lines))]
+    # ── 7. Publish: readers see the new version ───────────────────
+    info = registry.publish(collection_name, "index_pdf", coll.count(),
+                            changed=bool(rebuild or stats.files or gone))
 
-        if lines:
-            coll.add(
-                ids=ids,
-                documents=lines,
-                metadatas=metadatas,
-            )
+    # ── 8. Read-only snapshot ─────────────────────────────────────
+    if snapshot:
+        snap = ensure_snapshot(coll, state_dir, info.version)
+        if snap is not None:
+            print(f"Snapshot: {snap.n} chunks at v{snap.version} → {snap.directory}")
+    else:
+        remove_snapshot(state_dir)            # it would no longer match the vectors
 
-    print("Indexing complete — new DB stored in ./chroma_db")
+    print(stats.report())
+    print(f"Embedding cache: {embed_cache.stats()}")
+    print(f"Indexing complete — collection '{collection_name}' v{info.version} "
+          f"({info.chunks} chunks) stored in ./chroma_db")
 
 # ╔════════════════════════════════════════════════════════════════╗
-# 4.  Script entry-point                                           ║
+# 5.  Script entry-point                                           ║
 # ╚════════════════════════════════════════════════════════════════╝
 if __name__ == "__main__":
-    index_pdfs()
+    parser = argparse.ArgumentParser(description="Index ./data/*.pdf into ./chroma_db")
+    parser.add_argument("--full", action="store_true",
+                        help="empty the collection and re-embed everything")
+    parser.add_argument("--collection", default=COLLECTION_NAME,
+                        help=f"collection to write (default: {COLLECTION_NAME})")
+    parser.add_argument("--no-bm25", action="store_true",
+                        help="skip the keyword index (search falls back to vectors only)")
+    parser.add_argument("--compact", choices=MODES,
+                        help="also write an int8 / product-quantized vector store for search")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="export a memory-mapped snapshot for fast-start search processes")
+    args = parser.parse_args()
+    index_pdfs(full=args.full, keyword_index=not args.no_bm25,
+               collection_name=args.collection, compact=args.compact,
+               snapshot=args.snapshot)
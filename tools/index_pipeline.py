@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+index_pipeline.py
+────────────────────────────────────────────────────────────────────
+Pipelined, parallel indexing shared by index_code.py and index_pdf.py.
+
+Indexing file-by-file leaves most of the machine idle: one core reads
+and chunks while the embedding model waits, and every small
+``collection.add()`` embeds only a handful of chunks.  Here the work is
+split into stages that run at the same time:
+
+    files ──► [process pool]  read + chunk      (all CPU cores)
+          ──► [main thread]   diff vs manifest, group into batches
+          ──► [embed thread]  embed EMBED_BATCH_SIZE chunks per call
+          ──► [write thread]  bulk delete / update / upsert into Chroma
+
+Stages are joined by bounded queues, so a slow stage applies
+back-pressure instead of piling chunks up in memory.  Only the writer
+touches the collection, and a file is recorded in the manifest only
+after its chunks were written.
+
+Large files can be split into parts (index_pdf.py: one task per PDF
+page).  Parts are spread over the pool and each part's chunks move on
+to the embedder as soon as it is loaded, instead of after the whole
+document.  State that runs from one part into the next (a table header
+continued on the next page) is handed on in the main process, in part
+order, so the pool tasks never wait for — or redo — each other.
+"""
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from manifest import FilePlan, IndexManifest, apply_plans, close_file, plan_file, plan_part
+
+# A chunk is its text, or (text, extra metadata such as the page number)
+Chunk = Union[str, Tuple[str, Dict[str, Any]]]
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+WORKERS          = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 2)))
+EMBED_BATCH_SIZE = int(os.getenv("INDEX_EMBED_BATCH", "512"))   # chunks per embed call
+WRITE_BATCH_SIZE = int(os.getenv("INDEX_WRITE_BATCH", "5000"))  # records per upsert
+QUEUE_DEPTH      = 4                                            # batches buffered per stage
+MAX_IN_FLIGHT    = 4                                            # queued files per worker
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Stats                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+@dataclass
+class PipelineStats:
+    """Counts and per-stage seconds of one pipeline run."""
+
+    files: int = 0
+    embedded: int = 0
+    deleted: int = 0
+    wall: float = 0.0
+    stage: Dict[str, float] = field(
+        default_factory=lambda: {"read+chunk": 0.0, "plan": 0.0, "embed": 0.0, "write": 0.0}
+    )
+
+    def report(self) -> str:
+        rate = self.embedded / self.wall if self.wall else 0.0
+        stages = " · ".join(f"{name} {secs:.1f}s" for name, secs in self.stage.items())
+        return (f"⏱  {self.embedded} chunks embedded in {self.wall:.1f}s "
+                f"→ {rate:.1f} chunks/s  ({self.files} files, {self.deleted} chunks deleted)\n"
+                f"   {stages}  (read+chunk summed over {WORKERS} workers)")
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Stages                                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+def _split_chunks(items: List[Chunk]) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Chunk texts and their extra metadata."""
+    texts = [item if isinstance(item, str) else item[0] for item in items]
+    extra = [{} if isinstance(item, str) else item[1] for item in items]
+    return texts, extra
+
+
+def _load_timed(load: Callable[..., List[Chunk]], path: str,
+                *args: Any) -> Tuple[List[str], List[Dict[str, Any]], float]:
+    """Worker-side wrapper: chunk one file (or part) and report how long it took."""
+    started = time.perf_counter()
+    texts, extra = _split_chunks(load(Path(path), *args))
+    return texts, extra, time.perf_counter() - started
+
+
+def _load_raw_timed(load: Callable[..., Any], path: str, *args: Any) -> Tuple[Any, float]:
+    """Like :func:`_load_timed`, for a part that is linked to its neighbours afterwards."""
+    started = time.perf_counter()
+    return load(Path(path), *args), time.perf_counter() - started
+
+
+def _count_timed(count_parts: Callable[[Path, str], int], path: str,
+                 digest: str) -> Tuple[int, float]:
+    started = time.perf_counter()
+    return count_parts(Path(path), digest), time.perf_counter() - started
+
+
+def _stage(name: str, fn: Callable[[Any], Any], inbox: queue.Queue,
+           outbox: Optional[queue.Queue], stats: PipelineStats,
+           errors: List[BaseException]) -> threading.Thread:
+    """
+    Run `fn` over `inbox` items in a thread, timing it under `name`.
+
+    ``None`` ends the stream and is passed on.  After an error the stage
+    keeps draining its inbox, so upstream producers never block on a
+    full queue.
+    """
+    def run() -> None:
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            if errors:
+                continue
+            try:
+                started = time.perf_counter()
+                result = fn(item)
+                stats.stage[name] += time.perf_counter() - started
+                if outbox is not None:
+                    outbox.put(result)
+            except BaseException as err:          # re-raised by run_pipeline
+                errors.append(err)
+        if outbox is not None:
+            outbox.put(None)
+
+    thread = threading.Thread(target=run, name=f"index-{name}", daemon=True)
+    thread.start()
+    return thread
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Driver                                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+@dataclass
+class _SplitFile:
+    """A file being loaded part by part."""
+
+    digest: str
+    left: int                                            # parts not loaded yet
+    ids: Dict[int, List[str]] = field(default_factory=dict)   # part → chunk IDs
+    written: List[str] = field(default_factory=list)     # IDs of its fresh chunks
+    failed: bool = False
+    loaded: Dict[int, Any] = field(default_factory=dict)  # part → result waiting to be linked
+    next_part: int = 1                                   # next part to link
+    carry: Any = None                                    # handed on by the last linked part
+
+
+def run_pipeline(
+    jobs: Sequence[Tuple[str, str]],
+    load: Callable[..., List[Chunk]],
+    collection: Any,
+    manifest: IndexManifest,
+    embed: Callable[[List[str]], Sequence[Any]],
+    on_file: Optional[Callable[[str, int, int], None]] = None,
+    count_parts: Optional[Callable[[Path, str], int]] = None,
+    link_parts: Optional[Callable[[Any, Any], Tuple[List[Chunk], Any]]] = None,
+) -> PipelineStats:
+    """
+    Chunk, embed and store every ``(path, content hash)`` in `jobs`.
+
+    Parameters
+    ----------
+    jobs : Sequence[Tuple[str, str]]
+        Files that are new or changed (unchanged ones are filtered out
+        by the caller via the manifest).
+    load : Callable[..., List[Chunk]]
+        Module-level (picklable) function that reads and chunks a file,
+        ``load(path)``; runs in the process pool.  Chunks may carry
+        extra metadata as ``(text, {...})`` pairs.
+    collection, manifest
+        Target Chroma collection and the manifest to record files in.
+    embed : Callable[[List[str]], Sequence[Any]]
+        Embeds a batch of documents, e.g. the collection's embedding
+        function.
+    on_file : Callable[[str, int, int], None], optional
+        Progress callback, called once per finished file with its path
+        and the number of chunks added and removed.
+    count_parts : Callable[[Path, str], int], optional
+        Split every file into parts (PDF pages) loaded as separate pool
+        tasks: ``count_parts(path, digest)`` returns the number of parts
+        and `load` is then called as ``load(path, digest, part)`` with
+        ``part`` = 1 … n.  Each part is embedded and written as soon as
+        it is loaded; the file is recorded after its last part.
+    link_parts : Callable[[Any, Any], Tuple[List[Chunk], Any]], optional
+        With `count_parts`: `load` returns a part's raw result, and
+        ``link_parts(carry, raw)`` turns it into ``(chunks, carry)`` in
+        the main process, in part order — `carry` is what the previous
+        part handed on (None for the first).  A part loaded ahead of
+        its predecessors waits for them.
+
+    Returns
+    -------
+    PipelineStats
+    """
+    stats = PipelineStats()
+    errors: List[BaseException] = []
+    started = time.perf_counter()
+
+    embed_q: queue.Queue = queue.Queue(maxsize=QUEUE_DEPTH)
+    write_q: queue.Queue = queue.Queue(maxsize=QUEUE_DEPTH)
+
+    def embed_batch(plans: List[FilePlan]) -> Tuple[List[FilePlan], List[Any]]:
+        docs = [plan.chunks[i] for plan in plans for i in plan.fresh]
+        return plans, list(embed(docs)) if docs else []
+
+    def write_batch(item: Tuple[List[FilePlan], List[Any]]) -> None:
+        plans, vectors = item
+        apply_plans(collection, manifest, plans, embeddings=vectors, write_batch=WRITE_BATCH_SIZE)
+
+    threads = [
+        _stage("embed", embed_batch, embed_q, write_q, stats, errors),
+        _stage("write", write_batch, write_q, None, stats, errors),
+    ]
+
+    # Batches are written in order, so a file's parts always land
+    # before the plan that records (or cleans up) the file
+    batch: List[FilePlan] = []
+    batch_chunks = 0
+
+    def flush() -> None:
+        nonlocal batch, batch_chunks
+        if batch:
+            embed_q.put(batch)                    # blocks while the embedder is behind
+            batch, batch_chunks = [], 0
+
+    def emit(plan: FilePlan) -> None:
+        nonlocal batch_chunks
+        stats.embedded += len(plan.fresh)
+        batch.append(plan)
+        batch_chunks += len(plan.fresh)
+        if batch_chunks >= EMBED_BATCH_SIZE:
+            flush()
+
+    def finish(path: str, plan: FilePlan, added: int) -> None:
+        emit(plan)
+        stats.files += 1
+        stats.deleted += len(plan.stale)
+        if on_file is not None:
+            on_file(path, added, len(plan.stale))
+
+    split: Dict[str, _SplitFile] = {}
+
+    def fail(path: str) -> None:
+        state = split[path]
+        state.failed = True
+        if state.written:                         # parts already upserted → delete them again
+            flush()
+            emit(FilePlan(path=path, digest=state.digest, ids=[], stale=state.written,
+                          complete=False))
+
+    def take_part(path: str, part: int, chunks: List[str], extra: List[Dict[str, Any]]) -> None:
+        state = split[path]
+        t0 = time.perf_counter()
+        plan = plan_part(manifest, path, state.digest, part, chunks, extra)
+        stats.stage["plan"] += time.perf_counter() - t0
+        state.ids[part] = plan.ids
+        state.written.extend(plan.ids[i] for i in plan.fresh)
+        state.left -= 1
+        emit(plan)
+        if state.left == 0:
+            ids = [cid for n in sorted(state.ids) for cid in state.ids[n]]
+            finish(path, close_file(manifest, path, state.digest, ids), len(state.written))
+            del split[path]
+
+    # Tasks: (kind, path, digest, part); pop() from the end keeps file order
+    pending = [("count" if count_parts else "file", path, digest, 0)
+               for path, digest in jobs][::-1]
+    try:
+        with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+            running: Dict[Any, Tuple[str, str, str, int]] = {}
+            while (pending or running) and not errors:
+                # Keep the pool busy, but only a bounded number of tasks ahead
+                while pending and len(running) < WORKERS * MAX_IN_FLIGHT:
+                    task = kind, path, digest, part = pending.pop()
+                    if kind == "part" and split[path].failed:
+                        continue
+                    if kind == "count":
+                        future = pool.submit(_count_timed, count_parts, path, digest)
+                    elif kind == "part":
+                        future = pool.submit(_load_timed if link_parts is None else _load_raw_timed,
+                                             load, path, digest, part)
+                    else:
+                        future = pool.submit(_load_timed, load, path)
+                    running[future] = task
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, path, digest, part = running.pop(future)
+                    if kind == "part" and split[path].failed:
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as err:
+                        print(f"[WARN] Could not read {path}"
+                              f"{f' (part {part})' if kind == 'part' else ''}: {err}")
+                        if kind == "part":
+                            fail(path)
+                        continue
+                    stats.stage["read+chunk"] += result[-1]
+
+                    if kind == "count":
+                        n_parts = result[0]
+                        split[path] = _SplitFile(digest, left=n_parts)
+                        # Parts go next, so a file streams through before the following one
+                        pending.extend(("part", path, digest, n) for n in range(n_parts, 0, -1))
+                        if n_parts == 0:
+                            finish(path, close_file(manifest, path, digest, []), 0)
+                        continue
+
+                    if kind == "file":
+                        t0 = time.perf_counter()
+                        plan = plan_file(manifest, path, digest, *result[:2])
+                        stats.stage["plan"] += time.perf_counter() - t0
+                        finish(path, plan, len(plan.fresh))
+                        continue
+
+                    state = split[path]
+                    if link_parts is None:
+                        take_part(path, part, *result[:2])
+                        continue
+                    state.loaded[part] = result[0]
+                    while state.next_part in state.loaded:
+                        t0 = time.perf_counter()
+                        items, state.carry = link_parts(state.carry, state.loaded.pop(state.next_part))
+                        stats.stage["plan"] += time.perf_counter() - t0
+                        take_part(path, state.next_part, *_split_chunks(items))
+                        state.next_part += 1
+        if not errors:
+            flush()
+    finally:
+        embed_q.put(None)
+        for thread in threads:
+            thread.join()
+        stats.wall = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+    return stats
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+manifest.py
+────────────────────────────────────────────────────────────────────
+Bookkeeping for *incremental* re-indexing, shared by index_code.py and
+index_pdf.py.
+
+Each collection has its own manifest, in its state directory
+(``chroma_db/collections/<name>/index_manifest.json``, see registry.py).
+It records, per source file, the hash of its contents and the IDs of
+the chunks it produced:
+
+    {
+      "owner":  "index_code",
+      "config": {"model": "all-MiniLM-L6-v2", "max_tokens": 500, ...},
+      "files":  {"agent.py": {"hash": "9f2c…", "ids": ["agent.py-1a2b…", …]}}
+    }
+
+Chunk IDs are derived from the chunk's *content* (``<path>-<sha256[:16]>``),
+so a chunk that merely moved inside an edited file keeps its ID and its
+vector — only genuinely new text is embedded again.  Files indexed page
+by page (PDFs) use ``<path>#p<page>-<sha256[:16]>``, so each page can be
+planned and written on its own.
+
+A manifest written by a different indexer (``owner``) or with a
+different embedding model / chunking config is treated as missing, which
+makes the caller fall back to a full rebuild.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+MANIFEST_NAME = "index_manifest.json"
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Hash helpers                                                 ║
+# ╚════════════════════════════════════════════════════════════════╝
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's bytes (read in 1 MiB blocks)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids(path: str, chunks: Iterable[str]) -> List[str]:
+    """
+    Content-derived IDs for the chunks of one file.
+
+    Identical chunks inside the same file get a ``-<n>`` suffix so every
+    ID stays unique.
+    """
+    ids: List[str] = []
+    seen: Dict[str, int] = {}
+    for chunk in chunks:
+        base = f"{path}-{hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:16]}"
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        ids.append(base if n == 0 else f"{base}-{n}")
+    return ids
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Manifest                                                     ║
+# ╚════════════════════════════════════════════════════════════════╝
+class IndexManifest:
+    """path → (content hash, chunk IDs) for everything in one collection."""
+
+    def __init__(self, db_path: Path, owner: str, config: Dict[str, Any]) -> None:
+        self.path = Path(db_path) / MANIFEST_NAME
+        self.owner = owner
+        self.config = config
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.compatible = False
+
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            if data.get("owner") == owner and data.get("config") == config:
+                self.files = data.get("files", {})
+                self.compatible = True
+
+    def unchanged(self, path: str, digest: str) -> bool:
+        """True if `path` was indexed before with exactly this content."""
+        entry = self.files.get(path)
+        return entry is not None and entry["hash"] == digest
+
+    def ids(self, path: str) -> List[str]:
+        entry = self.files.get(path)
+        return list(entry["ids"]) if entry else []
+
+    def record(self, path: str, digest: str, ids: List[str]) -> None:
+        self.files[path] = {"hash": digest, "ids": ids}
+
+    def forget(self, path: str) -> None:
+        self.files.pop(path, None)
+
+    def save(self) -> None:
+        """Write atomically, so an interrupted run never leaves half a manifest."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(
+            json.dumps({"owner": self.owner, "config": self.config, "files": self.files}, indent=1),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Collection sync                                              ║
+# ╚════════════════════════════════════════════════════════════════╝
+@dataclass
+class FilePlan:
+    """What one file needs in the collection — computed without touching it."""
+
+    path: str
+    digest: str
+    ids: List[str]                                   # all chunk IDs, in order
+    stale: List[str] = field(default_factory=list)   # → delete
+    fresh: List[int] = field(default_factory=list)   # chunk positions → embed + upsert
+    moved: List[int] = field(default_factory=list)   # kept chunk positions → metadata update
+    chunks: List[str] = field(default_factory=list)
+    extra: List[Dict[str, Any]] = field(default_factory=list)   # per-chunk metadata (page, …)
+    complete: bool = True                            # False for one page → not recorded
+
+    def metadata(self, idx: int) -> Dict[str, Any]:
+        meta = {"path": self.path, "chunk_index": idx}
+        if self.extra:
+            meta.update(self.extra[idx])
+        return meta
+
+
+def plan_file(manifest: IndexManifest, path: str, digest: str, chunks: List[str],
+              extra: List[Dict[str, Any]] | None = None) -> FilePlan:
+    """
+    Compare `chunks` with what the manifest says is stored for `path`.
+
+    * new chunk text          → ``fresh`` (the only chunks embedded)
+    * chunk that only moved   → ``moved`` (its ``chunk_index`` changes;
+      with `extra`, every kept chunk, since e.g. its line numbers may
+      have changed)
+    * chunk no longer present → ``stale``
+    """
+    old_ids = manifest.ids(path)
+    new_ids = chunk_ids(path, chunks)
+    new_set = set(new_ids)
+
+    plan = _diff(path, digest, old_ids, new_ids, chunks, extra)
+    plan.stale = [cid for cid in old_ids if cid not in new_set]
+    return plan
+
+
+def plan_part(manifest: IndexManifest, path: str, digest: str, part: int, chunks: List[str],
+              extra: List[Dict[str, Any]] | None = None) -> FilePlan:
+    """
+    Like :func:`plan_file`, for one part (PDF page) of a file.
+
+    The plan is not ``complete``: writing it upserts the page's new
+    chunks, but nothing is deleted or recorded until :func:`close_file`
+    has seen every part.  ``chunk_index`` counts within the part.
+    """
+    prefix = f"{path}#p{part}"
+    old_ids = [cid for cid in manifest.ids(path) if cid.startswith(prefix + "-")]
+    plan = _diff(path, digest, old_ids, chunk_ids(prefix, chunks), chunks, extra)
+    plan.complete = False
+    return plan
+
+
+def close_file(manifest: IndexManifest, path: str, digest: str, ids: List[str]) -> FilePlan:
+    """Final plan of a file written part by part: drop old chunks, record `ids`."""
+    new_set = set(ids)
+    return FilePlan(path=path, digest=digest, ids=ids,
+                    stale=[cid for cid in manifest.ids(path) if cid not in new_set])
+
+
+def _diff(path: str, digest: str, old_ids: List[str], new_ids: List[str], chunks: List[str],
+          extra: List[Dict[str, Any]] | None) -> FilePlan:
+    old_pos = {cid: idx for idx, cid in enumerate(old_ids)}
+    return FilePlan(
+        path=path,
+        digest=digest,
+        ids=new_ids,
+        fresh=[i for i, cid in enumerate(new_ids) if cid not in old_pos],
+        moved=[i for i, cid in enumerate(new_ids)
+               if cid in old_pos and (old_pos[cid] != i or extra)],
+        chunks=chunks,
+        extra=extra or [],
+    )
+
+
+def apply_plans(collection: Any, manifest: IndexManifest, plans: List[FilePlan],
+                embeddings: List[Any] | None = None, write_batch: int = 5000) -> None:
+    """
+    Write `plans` to `collection` in bulk and record them in `manifest`.
+
+    `embeddings`, if given, are the vectors of every plan's fresh chunks
+    in order; otherwise Chroma embeds them with the collection's
+    embedding function.  Upserts are sliced to `write_batch` records.
+    """
+    stale = [cid for plan in plans for cid in plan.stale]
+    if stale:
+        collection.delete(ids=stale)
+
+    moved = [(plan.ids[i], plan.metadata(i)) for plan in plans for i in plan.moved]
+    if moved:
+        collection.update(ids=[m[0] for m in moved], metadatas=[m[1] for m in moved])
+
+    fresh = [(plan.ids[i], plan.chunks[i], plan.metadata(i)) for plan in plans for i in plan.fresh]
+    for start in range(0, len(fresh), write_batch):
+        part = fresh[start:start + write_batch]
+        record: Dict[str, Any] = dict(
+            ids=[f[0] for f in part],
+            documents=[f[1] for f in part],
+            metadatas=[f[2] for f in part],
+        )
+        if embeddings is not None:
+            record["embeddings"] = embeddings[start:start + write_batch]
+        collection.upsert(**record)
+
+    for plan in plans:
+        if plan.complete:
+            manifest.record(plan.path, plan.digest, plan.ids)
+
+
+def prune_removed(collection: Any, manifest: IndexManifest, current: Iterable[str]) -> int:
+    """Delete the chunks of every manifest file not in `current`; return how many files."""
+    gone = set(manifest.files) - set(current)
+    for path in sorted(gone):
+        ids = manifest.ids(path)
+        if ids:
+            collection.delete(ids=ids)
+        manifest.forget(path)
+    return len(gone)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+page_cache.py
+────────────────────────────────────────────────────────────────────
+On-disk cache of extracted PDF pages, used by index_pdf.py.
+
+pdfplumber's layout analysis (finding tables and text lines) is by far
+the slowest part of indexing a PDF — far slower than chunking the
+result.  Each page's extracted layout is therefore stored once, keyed by
+
+    (SHA-256 of the PDF's bytes, page number)
+
+so a ``--full`` rebuild, a change of chunking settings or a re-run after
+an interrupted index never re-extracts a page of an unchanged file.
+A changed file has a new hash and is extracted afresh.
+
+Everything lives in one SQLite file (``pages.sqlite`` under
+PDF_PAGE_CACHE_DIR), so the indexer's worker processes can read and
+write it concurrently.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+PAGE_CACHE_DIR = Path(os.getenv("PDF_PAGE_CACHE_DIR", "./.page_cache"))
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Cache                                                        ║
+# ╚════════════════════════════════════════════════════════════════╝
+class PageCache:
+    """(file hash, page) → extracted layout (any JSON value), plus page counts."""
+
+    def __init__(self, cache_dir: Path = PAGE_CACHE_DIR) -> None:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(Path(cache_dir) / "pages.sqlite", isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (hash TEXT PRIMARY KEY, pages INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "hash TEXT NOT NULL, page INTEGER NOT NULL, layout TEXT NOT NULL, "
+            "PRIMARY KEY (hash, page))"
+        )
+
+    def page_count(self, digest: str) -> int | None:
+        row = self._db.execute("SELECT pages FROM files WHERE hash = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, digest: str, pages: int) -> None:
+        self._db.execute("INSERT OR REPLACE INTO files VALUES (?, ?)", (digest, pages))
+
+    def get(self, digest: str, page: int) -> Any | None:
+        row = self._db.execute(
+            "SELECT layout FROM pages WHERE hash = ? AND page = ?", (digest, page)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, digest: str, page: int, layout: Any) -> None:
+        # Two workers may extract the same page; both write the same value
+        self._db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?)",
+                         (digest, page, json.dumps(layout)))
+
+
+_cache: tuple[int, PageCache] | None = None
+
+
+def get_page_cache() -> PageCache:
+    """This process's cache (SQLite connections must not cross a fork)."""
+    global _cache
+    if _cache is None or _cache[0] != os.getpid():
+        _cache = (os.getpid(), PageCache())
+    return _cache[1]
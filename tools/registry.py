@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+registry.py
+────────────────────────────────────────────────────────────────────
+Named collections inside one Chroma database, shared by the indexers
+(index_code.py, index_pdf.py), tools/search.py and the Lab 5 RAG agent.
+
+Each corpus gets its own collection — by default ``code`` for the
+repository's *.py files and ``pdfs`` for ./data/*.pdf, or any name given
+with ``--collection`` (e.g. one per tenant).  A collection has its own
+HNSW index, so each stays small, and re-indexing one corpus (even a
+``--full`` rebuild) never touches, or blocks queries on, the others.
+
+``chroma_db/collections.json`` lists the collections:
+
+    {
+      "collections": {
+        "code": {"source": "index_code", "version": 7, "chunks": 412, "updated": 1760…},
+        "pdfs": {"source": "index_pdf",  "version": 2, "chunks": 58,  "updated": 1760…}
+      }
+    }
+
+``version`` goes up every time an indexer publishes the collection, so a
+long-running reader can tell when to reopen it.  Everything else a
+collection owns lives in its state directory,
+``chroma_db/collections/<name>/``: the incremental-indexing manifest
+(manifest.py) and the BM25 keyword index (bm25.py).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import shutil
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+REGISTRY_NAME  = "collections.json"   # in the Chroma directory
+STATE_DIR_NAME = "collections"        # per-collection manifest + BM25 index
+LOCK_TIMEOUT   = 10.0                 # seconds; an older lock is from a crashed writer
+
+# Chroma's own rule: 3–63 characters, [a-zA-Z0-9._-], alphanumeric at both ends
+NAME_RE = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]")
+
+
+def check_name(name: str) -> str:
+    """Return `name`, or raise ValueError if Chroma would reject it."""
+    if not NAME_RE.fullmatch(name) or ".." in name:
+        raise ValueError(f"invalid collection name {name!r} "
+                         "(3-63 characters: letters, digits, '.', '_', '-')")
+    return name
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Registry                                                     ║
+# ╚════════════════════════════════════════════════════════════════╝
+@dataclass
+class CollectionInfo:
+    """One registered collection."""
+
+    name: str
+    source: str              # indexer that owns it ("index_code", "index_pdf")
+    version: int = 0         # +1 per publish
+    chunks: int = 0
+    updated: float = 0.0     # time.time() of the last publish
+
+
+class CollectionRegistry:
+    """The collections of the Chroma database at `db_path` (see module docstring)."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.path = self.db_path / REGISTRY_NAME
+        self._entries: Dict[str, CollectionInfo] = {}
+        self._mtime: int | None = None
+        self.refresh()
+
+    # ── reading ─────────────────────────────────────────────────────
+    def refresh(self) -> bool:
+        """Re-read the registry file if it changed; True if it did."""
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._entries = self._read()
+        self._mtime = mtime
+        return True
+
+    def _read(self) -> Dict[str, CollectionInfo]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return {name: CollectionInfo(name=name, **entry)
+                for name, entry in data.get("collections", {}).items()}
+
+    def names(self) -> List[str]:
+        return sorted(self._entries)
+
+    def info(self, name: str) -> CollectionInfo | None:
+        return self._entries.get(name)
+
+    def resolve(self, names: Sequence[str] | None) -> List[str]:
+        """`names` (all registered collections if None); raise KeyError for unknown ones."""
+        if names is None:
+            return self.names()
+        unknown = [name for name in names if name not in self._entries]
+        if unknown:
+            raise KeyError(f"unknown collection(s) {', '.join(unknown)}; "
+                           f"indexed: {', '.join(self.names()) or 'none'}")
+        return list(dict.fromkeys(names))
+
+    def state_dir(self, name: str) -> Path:
+        """Where `name` keeps its manifest and keyword index."""
+        return self.db_path / STATE_DIR_NAME / check_name(name)
+
+    # ── writing ─────────────────────────────────────────────────────
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """
+        Cross-process lock around read-modify-write of the registry file,
+        so two indexers finishing at once don't drop each other's entry.
+        """
+        lock = self.path.with_suffix(".lock")
+        self.db_path.mkdir(parents=True, exist_ok=True)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                if time.monotonic() > deadline:
+                    lock.unlink(missing_ok=True)       # left behind by a crashed writer
+                    deadline = time.monotonic() + LOCK_TIMEOUT
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            lock.unlink(missing_ok=True)
+
+    def _write(self, entries: Dict[str, CollectionInfo]) -> None:
+        """Write atomically, so readers never see half a registry."""
+        data = {"collections": {name: {k: v for k, v in asdict(info).items() if k != "name"}
+                                for name, info in sorted(entries.items())}}
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._mtime = None                         # picked up by the next refresh()
+        self.refresh()
+
+    def publish(self, name: str, source: str, chunks: int, changed: bool = True) -> CollectionInfo:
+        """
+        Record that `source` wrote collection `name`.  The version goes up
+        if anything `changed` (or `name` is new), so readers reopen it.
+        """
+        with self._locked():
+            entries = self._read()
+            old = entries.get(check_name(name))
+            if old is not None and not changed and old.source == source:
+                return old
+            entries[name] = info = CollectionInfo(
+                name=name, source=source, version=(old.version if old else 0) + 1,
+                chunks=chunks, updated=time.time(),
+            )
+            self._write(entries)
+        return info
+
+    def reset(self, client: Any, name: str) -> None:
+        """
+        Empty collection `name` for a full rebuild: drop its Chroma
+        collection, manifest and keyword index.  Other collections and
+        its registry entry (and version) are left alone.
+        """
+        if name in {c.name for c in client.list_collections()}:
+            client.delete_collection(name)
+        shutil.rmtree(self.state_dir(name), ignore_errors=True)
+        self.state_dir(name).mkdir(parents=True, exist_ok=True)
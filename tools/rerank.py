@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+rerank.py
+────────────────────────────────────────────────────────────────────
+Second retrieval stage: re-rank a few dozen candidate chunks with a
+small CPU cross-encoder and keep only the best few.
+
+A bi-encoder (MiniLM in Chroma) embeds query and chunk separately, which
+is fast enough for the whole collection but blurs fine distinctions.  A
+cross-encoder reads query and chunk *together* and scores relevance much
+more precisely, but only affords a handful of pairs per query.  So the
+retriever over-fetches RERANK_CANDIDATES chunks and the cross-encoder
+scores them all in one batched forward pass.  Fewer, better chunks in
+the agent prompt mean less prompt-eval time for llama3.2.
+
+Latency guard rails
+-------------------
+* **Budget** — scoring runs on a worker thread and gets
+  RERANK_BUDGET_MS.  If it is not done by then (or the model is still
+  loading, or the previous batch is still running) the candidates are
+  returned in their incoming order.  A late batch still finishes in the
+  background and fills the cache, so a repeated query is re-ranked.
+* **Score cache** — (query, chunk) scores are kept in an in-memory LRU;
+  only uncached pairs go through the model.
+* **Lazy load** — the model is loaded on a background thread by
+  :meth:`Reranker.warm` (or the first call), never on the query path.
+  If it cannot be loaded (e.g. offline and not pre-downloaded — see
+  .devcontainer/Dockerfile and warmup_models.py), a warning is printed
+  once and every query keeps its retrieval order.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Sequence
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+RERANK_MODEL      = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))     # chunks fetched for stage 2
+RERANK_BUDGET_MS  = float(os.getenv("RERANK_BUDGET_MS", "250"))   # then fall back to input order
+SCORE_CACHE_SIZE  = 4096                                          # (query, chunk) scores kept
+
+
+def _pair_key(query: str, doc: str) -> bytes:
+    return hashlib.blake2b(f"{query.strip().lower()}\x00{doc}".encode("utf-8"), digest_size=16).digest()
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Re-ranker                                                    ║
+# ╚════════════════════════════════════════════════════════════════╝
+class Reranker:
+    """
+    Cross-encoder re-ranking with a time budget and a score cache.
+
+    Parameters
+    ----------
+    model_name : str
+        A sentence-transformers ``CrossEncoder`` model.
+    budget_ms : float
+        Time allowed per :meth:`rerank` call for model scoring.
+    cache_size : int
+        Number of (query, chunk) scores kept in memory.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, budget_ms: float = RERANK_BUDGET_MS,
+                 cache_size: int = SCORE_CACHE_SIZE) -> None:
+        self.model_name = model_name
+        self.budget_ms = budget_ms
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._model: Future | None = None
+        self._running: Future | None = None
+        self.reranked = self.fallbacks = self.cache_hits = 0
+
+    # ── model ───────────────────────────────────────────────────────
+    def _load(self) -> Any:
+        try:
+            from sentence_transformers import CrossEncoder     # heavy import, off the query path
+            return CrossEncoder(self.model_name, device="cpu")
+        except Exception as err:     # runs once per Reranker, so this is logged once
+            print(f"[WARN] Re-ranker model '{self.model_name}' unavailable "
+                  f"({type(err).__name__}: {err}) — results keep their retrieval order")
+            raise
+
+    def warm(self) -> None:
+        """Start loading the model in the background (idempotent)."""
+        with self._lock:
+            if self._model is None:
+                self._model = self._pool.submit(self._load)
+
+    # ── scoring ─────────────────────────────────────────────────────
+    def _score(self, query: str, docs: List[str], keys: List[bytes]) -> List[float]:
+        """Worker thread: one batched forward pass; results go into the cache."""
+        scores = [float(s) for s in self._model.result().predict([(query, d) for d in docs])]
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: Sequence[str], top_n: int) -> List[int]:
+        """
+        Indices of the best `top_n` of `docs` for `query`, best first.
+
+        Falls back to ``0 … top_n-1`` (the incoming order) when the model
+        is not loaded yet, is busy, fails, or misses the time budget.
+        """
+        if len(docs) <= 1:
+            return list(range(len(docs)))[:top_n]
+        started = time.perf_counter()
+        self.warm()
+
+        keys = [_pair_key(query, d) for d in docs]
+        with self._lock:
+            scores: Dict[int, float] = {i: self._cache[k] for i, k in enumerate(keys) if k in self._cache}
+            for key in (keys[i] for i in scores):
+                self._cache.move_to_end(key)
+        self.cache_hits += len(scores)
+
+        todo = [i for i in range(len(docs)) if i not in scores]
+        if todo:
+            ready = self._model.done() and self._model.exception() is None
+            if not ready or (self._running is not None and not self._running.done()):
+                self.fallbacks += 1
+                return list(range(len(docs)))[:top_n]
+            self._running = self._pool.submit(self._score, query, [docs[i] for i in todo],
+                                              [keys[i] for i in todo])
+            remaining = self.budget_ms / 1000 - (time.perf_counter() - started)
+            try:
+                scores.update(zip(todo, self._running.result(timeout=max(remaining, 0.0))))
+            except FutureTimeout:
+                self.fallbacks += 1            # keeps running and fills the cache
+                return list(range(len(docs)))[:top_n]
+            except Exception:
+                self.fallbacks += 1
+                return list(range(len(docs)))[:top_n]
+
+        self.reranked += 1
+        # Stable sort: equal scores keep the retriever's order
+        return sorted(range(len(docs)), key=lambda i: -scores[i])[:top_n]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "cache_hits": self.cache_hits,
+        }
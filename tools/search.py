@@ -1,11 +1,52 @@
 #!/usr/bin/env python3
 # search.py — colourised, similarity-aware search with numbered, clearly-
 #             separated results and explicit cosine-similarity labels.
+#
+# `SearchService` opens the collection once and answers any number of
+# queries (one or a batch per call).  Similarities come from the
+# distances Chroma already returns; the stored vectors are only fetched
+# when exact re-scoring is asked for (`exact=True`).
+#
+# When the indexers built a BM25 keyword index for a collection, each
+# query also runs a keyword search in parallel with the vector search,
+# and the two rankings are fused with reciprocal rank fusion (bm25.py).
+#
+# Searches go to every collection in chroma_db/collections.json, or only
+# the ones given (`--collection code`, see registry.py).  The query is
+# embedded once, the collections are searched concurrently and their
+# hits merged by cosine similarity — comparable across collections, as
+# they all share the same embedding model.  Hybrid results are merged on
+# their RRF score instead (it only depends on ranks, so it is comparable
+# too), with a vector-only collection scored by its vector ranking alone;
+# re-sorting them by similarity would undo the keyword fusion.  A
+# collection re-indexed while the service runs is reopened at its new
+# version on the next query.
+#
+# A collection indexed with `--compact int8|pq` is searched through its
+# compact store (compact_store.py): quantized codes in memory, exact
+# re-scoring from float vectors on disk.  Chroma then only serves the
+# documents of the hits.
+#
+# A collection exported with `--snapshot` (snapshot.py) is served from
+# its memory-mapped snapshot while that matches the registry version:
+# no Chroma client, and the embedding model is only loaded for a query
+# the embedding cache has never seen — so a search worker starts in
+# milliseconds and all workers share one copy of the index.
+
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 import numpy as np
-from chromadb import PersistentClient
-from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+from bm25 import FUSION_CANDIDATES, RRF_K, BM25Index, rrf_fuse
+from compact_store import CompactStore
+from embed_cache import EmbeddingCache
+from registry import CollectionRegistry
+from snapshot import Snapshot
 
 
 # ── ANSI colours (works on most POSIX terminals) ─────────────────────────
@@ -17,66 +58,327 @@ RESET = "\033[0m"
 # Same SBERT model used by the indexing scripts — queries must be embedded
 # in the same vector space as the stored chunks.
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-embed_fn = SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_NAME)
-
-# ── Connect to on-disk Chroma database ───────────────────────────────────
-db_client = PersistentClient(
-    path="./chroma_db",
-    settings=Settings(),
-    tenant=DEFAULT_TENANT,
-    database=DEFAULT_DATABASE,
-)
-
-# ── Utility: exact cosine similarity ─────────────────────────────────────
-def cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
-
-# ── Core search routine ──────────────────────────────────────────────────
-def search(query: str, top_k: int = 3) -> None:
-    coll = db_client.get_or_create_collection(
-        name="codebase",
-        embedding_function=embed_fn,
-    )
-
-    total_chunks = coll.count()
-    if total_chunks == 0:
-        print("Collection is empty — nothing to search.")
-        return
-    print(f"Collection contains {total_chunks} chunks.\n")
+CHROMA_PATH      = "./chroma_db"
+FANOUT_WORKERS   = 4                 # collections searched at the same time
+
+# ── Utility: distances → cosine similarity ───────────────────────────────
+def distance_to_similarity(distances: np.ndarray, space: str) -> np.ndarray:
+    """
+    Cosine similarity from Chroma distances.  MiniLM vectors are unit
+    length (the model ends in a Normalize layer), so for the default
+    squared-L2 space  ‖a − b‖² = 2 − 2·cos(a, b).
+    """
+    if space in ("cosine", "ip"):
+        return 1.0 - distances
+    return 1.0 - distances / 2.0
+
+def cosine_similarities(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Exact cosine similarity of every row of `vectors` with `query`."""
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-10
+    return vectors @ query / norms
+
+# ── Search service ───────────────────────────────────────────────────────
+@dataclass
+class Hit:
+    id: str
+    document: str
+    metadata: Dict[str, Any]
+    similarity: float
+    fused: Optional[float] = None        # RRF score, for hybrid results
+    collection: str = ""
+
+@dataclass
+class _Target:
+    """One open collection and its keyword index, at a registry version."""
+    name: str
+    collection: Any                      # None when served from `snapshot`
+    space: str
+    bm25: Optional[BM25Index]
+    compact: Optional[CompactStore]
+    snapshot: Optional[Snapshot]
+    version: int
+
+class SearchService:
+    """
+    Open collections + query-embedding cache, reused for every search.
+
+    `collections` names the collections to search (default: all that
+    are registered, including ones indexed after the service started).
+    """
+
+    def __init__(self, path: str = CHROMA_PATH,
+                 collections: Optional[Sequence[str]] = None) -> None:
+        self.path = path
+        self._embed_fn: Any = None
+        self._client: Any = None
+        self._open_lock = threading.Lock()
+        # Repeat queries (and text the indexers already embedded) skip the encoder
+        self.embed_cache = EmbeddingCache(EMBED_MODEL_NAME, lambda texts: self.embed_fn(texts))
+        self.registry = CollectionRegistry(Path(path))
+        self.names = None if collections is None else self.registry.resolve(collections)
+        self._targets: Dict[str, _Target] = {}
+
+        # Collections are searched side by side; keyword searches run on
+        # their own threads while Chroma answers the vector queries
+        self._fanout = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="search")
+        self._lexical = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="bm25")
+
+    # Chroma and the model are only loaded when first needed (snapshots
+    # and cached queries need neither)
+    @property
+    def embed_fn(self) -> Any:
+        with self._open_lock:
+            if self._embed_fn is None:
+                from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+                self._embed_fn = SentenceTransformerEmbeddingFunction(model_name=EMBED_MODEL_NAME)
+            return self._embed_fn
+
+    @property
+    def client(self) -> Any:
+        with self._open_lock:
+            if self._client is None:
+                from chromadb import PersistentClient
+                from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+                self._client = PersistentClient(
+                    path=self.path,
+                    settings=Settings(),
+                    tenant=DEFAULT_TENANT,
+                    database=DEFAULT_DATABASE,
+                )
+            return self._client
+
+    def targets(self) -> List[_Target]:
+        """The collections to search, (re)opened if the registry changed."""
+        self.registry.refresh()
+        targets: List[_Target] = []
+        for name in self.names if self.names is not None else self.registry.names():
+            info = self.registry.info(name)
+            if info is None:                     # dropped from the registry
+                continue
+            target = self._targets.get(name)
+            if target is None or target.version != info.version:
+                state_dir = self.registry.state_dir(name)
+                snapshot = Snapshot.load(state_dir, info.version)           # None if stale
+                collection = None if snapshot is not None else \
+                    self.client.get_collection(name=name, embedding_function=self.embed_fn)
+                target = self._targets[name] = _Target(
+                    name=name,
+                    collection=collection,
+                    space=((collection.metadata if collection else None) or {}).get("hnsw:space", "l2"),
+                    bm25=BM25Index.load(state_dir),                         # None → vectors only
+                    compact=CompactStore.load(state_dir),
+                    snapshot=snapshot,
+                    version=info.version,
+                )
+            targets.append(target)
+        return targets
+
+    def counts(self) -> Dict[str, int]:
+        return {target.name: target.snapshot.n if target.snapshot is not None
+                else target.collection.count() for target in self.targets()}
 
-    query_vec = np.array(embed_fn([query])[0])
+    def count(self) -> int:
+        return sum(self.counts().values())
 
-    results = coll.query(
-        query_embeddings=[query_vec.tolist()],
-        n_results=top_k,
-        include=["documents", "metadatas", "embeddings"],
-    )
+    def query(self, queries: Sequence[str], top_k: int = 3, exact: bool = False,
+              hybrid: bool = True) -> List[List[Hit]]:
+        """
+        Top `top_k` hits for each of `queries`, best first.  Queries are
+        embedded in one call; each collection is searched in one Chroma
+        round-trip, concurrently, and the per-collection hits are merged
+        by similarity.  With `exact`, the stored vectors are fetched and
+        similarities recomputed from them.  With `hybrid`, a collection
+        with a BM25 index fuses its vector and keyword rankings; hits
+        found only by keyword are fetched in one extra round-trip, and
+        the collections' hits are merged on their RRF scores.
+        """
+        targets = self.targets()
+        if not queries or not targets:
+            return [[] for _ in queries]
+        if len(queries) == 1:
+            query_vecs = self.embed_cache.embed_query(queries[0])[None, :]
+        else:
+            query_vecs = self.embed_cache.embed_documents(list(queries))
+
+        def one(target: _Target) -> List[List[Hit]]:
+            try:
+                return self._query_one(target, queries, query_vecs, top_k, exact, hybrid)
+            except Exception as err:             # e.g. being rebuilt — the others still answer
+                print(f"[WARN] Collection '{target.name}' unavailable: {err}")
+                self._targets.pop(target.name, None)
+                return [[] for _ in queries]
+
+        if len(targets) == 1:
+            return one(targets[0])
+        per_collection = list(self._fanout.map(one, targets))
+        if not (hybrid and any(target.bm25 is not None for target in targets)):
+            return [sorted((hit for rows in per_collection for hit in rows[i]),
+                           key=lambda hit: -hit.similarity)[:top_k]
+                    for i in range(len(queries))]
+        return [self._merge_fused([rows[i] for rows in per_collection], top_k)
+                for i in range(len(queries))]
+
+    @staticmethod
+    def _merge_fused(rankings: List[List[Hit]], top_k: int) -> List[Hit]:
+        """
+        Merge per-collection rankings on their RRF scores.  A collection
+        without a keyword index has no `fused` score; its vector ranking
+        is scored on its own, as ``rrf_fuse`` would score a single list.
+        Ties go to the more similar hit.
+        """
+        scored = [(hit.fused if hit.fused is not None else 1.0 / (RRF_K + rank), hit)
+                  for ranking in rankings for rank, hit in enumerate(ranking, start=1)]
+        scored.sort(key=lambda item: (-item[0], -item[1].similarity))
+        return [hit for _, hit in scored[:top_k]]
+
+    def _query_one(self, target: _Target, queries: Sequence[str], query_vecs: np.ndarray,
+                   top_k: int, exact: bool, hybrid: bool) -> List[List[Hit]]:
+        """`query` against a single collection."""
+        hybrid = hybrid and target.bm25 is not None
+        if hybrid:
+            lexical = self._lexical.submit(
+                lambda: [[cid for cid, _ in target.bm25.search(q, FUSION_CANDIDATES)] for q in queries]
+            )
+        n_results = max(top_k, FUSION_CANDIDATES) if hybrid else top_k
+        if target.compact is not None:           # always exact: re-scored from float vectors
+            results = self._ranked_results(target, target.compact.search(query_vecs, n_results))
+        elif target.snapshot is not None:        # exact scan of the mmap'd vectors
+            snap = target.snapshot
+            results = self._ranked_results(target, [[(snap.id(row), sim) for row, sim in ranking]
+                                                    for ranking in snap.search(query_vecs, n_results)])
+        else:
+            results = target.collection.query(
+                query_embeddings=[vec.tolist() for vec in query_vecs],
+                n_results=n_results,
+                include=["documents", "metadatas", "embeddings" if exact else "distances"],
+            )
+
+        hits: List[List[Hit]] = []
+        for i, query_vec in enumerate(query_vecs):
+            ids, docs, metas = results["ids"][i], results["documents"][i], results["metadatas"][i]
+            if not docs:
+                hits.append([])
+                continue
+            if "similarities" in results:
+                sims = np.asarray(results["similarities"][i])
+            elif exact:
+                sims = cosine_similarities(np.asarray(results["embeddings"][i], dtype=np.float32), query_vec)
+            else:
+                sims = distance_to_similarity(np.asarray(results["distances"][i]), target.space)
+            ranked = sorted(zip(ids, docs, metas, sims.tolist()), key=lambda hit: -hit[3])
+            hits.append([Hit(*hit, collection=target.name) for hit in ranked])
+        if not hybrid:
+            return hits
+        return self._fuse(target, query_vecs, hits, lexical.result(), top_k)
+
+    def _fetch(self, target: _Target, ids: List[str],
+               vectors: bool = False) -> Dict[str, Tuple[str, Dict[str, Any], Any]]:
+        """``ID → (document, metadata, vector or None)``, from the snapshot or Chroma."""
+        if not ids:
+            return {}
+        if target.snapshot is not None:
+            snap = target.snapshot
+            return {cid: (snap.document(row), snap.metadata(row),
+                          np.asarray(snap.vectors[row]) if vectors else None)
+                    for cid, row in zip(ids, snap.rows(ids)) if row >= 0}
+        got = target.collection.get(ids=ids, include=["documents", "metadatas"]
+                                    + (["embeddings"] if vectors else []))
+        vecs = got["embeddings"] if vectors else [None] * len(got["ids"])
+        return {cid: (doc, meta, None if vec is None else np.asarray(vec, dtype=np.float32))
+                for cid, doc, meta, vec in zip(got["ids"], got["documents"], got["metadatas"], vecs)}
 
-    docs   = results["documents"][0]
-    metas  = results["metadatas"][0]
-    embeds = results["embeddings"][0]
+    def _ranked_results(self, target: _Target,
+                        ranked: List[List[Tuple[str, float]]]) -> Dict[str, List[List[Any]]]:
+        """``(ID, similarity)`` rankings with their documents, shaped like a Chroma query result."""
+        found = self._fetch(target, sorted({cid for row in ranked for cid, _ in row}))
+        rows = [[(cid, sim) for cid, sim in row if cid in found] for row in ranked]
+        return {
+            "ids": [[cid for cid, _ in row] for row in rows],
+            "documents": [[found[cid][0] for cid, _ in row] for row in rows],
+            "metadatas": [[found[cid][1] for cid, _ in row] for row in rows],
+            "similarities": [[sim for _, sim in row] for row in rows],
+        }
 
-    if not docs:
+    def _fuse(self, target: _Target, query_vecs: np.ndarray, vector_hits: List[List[Hit]],
+              lexical_ids: List[List[str]], top_k: int) -> List[List[Hit]]:
+        """RRF-fuse each query's vector and keyword rankings, keeping `top_k`."""
+        by_id = [{hit.id: hit for hit in row} for row in vector_hits]
+        fused = [rrf_fuse([[hit.id for hit in row], lex])[:top_k]
+                 for row, lex in zip(vector_hits, lexical_ids)]
+
+        # Keyword-only hits: one get() for all queries, similarity from their vectors
+        missing = sorted({cid for ranking, known in zip(fused, by_id) for cid, _ in ranking
+                          if cid not in known})
+        extra = self._fetch(target, missing, vectors=True)
+
+        hits: List[List[Hit]] = []
+        for query_vec, ranking, known in zip(query_vecs, fused, by_id):
+            row: List[Hit] = []
+            for cid, score in ranking:
+                if cid in known:
+                    hit = known[cid]
+                    row.append(Hit(cid, hit.document, hit.metadata, hit.similarity, score, target.name))
+                elif cid in extra:                # gone from the collection → skipped
+                    doc, meta, vec = extra[cid]
+                    sim = float(cosine_similarities(vec[None, :], query_vec)[0])
+                    row.append(Hit(cid, doc, meta, sim, score, target.name))
+            hits.append(row)
+        return hits
+
+    def search(self, query: str, top_k: int = 3, exact: bool = False,
+               hybrid: bool = True) -> List[Hit]:
+        return self.query([query], top_k=top_k, exact=exact, hybrid=hybrid)[0]
+
+# ── Utility: where a chunk came from ─────────────────────────────────────
+def source_label(meta: dict) -> str:
+    details = [f"chunk {meta['chunk_index']}"]
+    if "page" in meta:                                   # PDFs
+        details.append(f"page {meta['page']}")
+    if "symbol" in meta:                                 # code
+        details.append(f"{meta['symbol']}, lines {meta['start_line']}-{meta['end_line']}")
+    return f"{meta['path']}  ({', '.join(details)})"
+
+# ── Output ───────────────────────────────────────────────────────────────
+def print_hits(hits: List[Hit]) -> None:
+    if not hits:
         print("No matches found.")
         return
 
-    sims = [cosine_sim(query_vec, np.array(e)) for e in embeds]
-    best_idx = int(np.argmax(sims))
-
-    for i, (doc, meta, sim) in enumerate(zip(docs, metas, sims), start=1):
-        colour = GREEN if i-1 == best_idx else BLUE
+    for i, hit in enumerate(hits, start=1):
+        colour = GREEN if i == 1 else BLUE               # hits are sorted best-first
         separator = "-" * 80
         print(
             f"{colour}{separator}\n"
-            f"Result {i}/{len(sims)}\n"
+            f"Result {i}/{len(hits)}\n"
             f"{separator}{RESET}\n"
-            f"{doc}\n\n"
-            f"{RED}Cosine similarity: {sim:.4f}{RESET}\n"
-            f"Source: {meta['path']}  (chunk {meta['chunk_index']})\n"
+            f"{hit.document}\n\n"
+            f"{RED}Cosine similarity: {hit.similarity:.4f}{RESET}"
+            f"{f'   (RRF score {hit.fused:.4f})' if hit.fused is not None else ''}\n"
+            f"Source: {f'[{hit.collection}] ' if hit.collection else ''}{source_label(hit.metadata)}\n"
         )
 
 # ── Simple REPL ──────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the collections in ./chroma_db")
+    parser.add_argument("--collection", action="append", dest="collections",
+                        help="collection to search (repeatable; default: all indexed ones)")
+    args = parser.parse_args()
+    try:
+        service = SearchService(collections=args.collections)
+    except KeyError as err:
+        print(err.args[0])
+        raise SystemExit(1)
+    counts = service.counts()
+    if not sum(counts.values()):
+        print("No indexed chunks — run tools/index_code.py or tools/index_pdf.py first.")
+        raise SystemExit(0)
+    for target in service.targets():
+        print(f"Collection '{target.name}' v{target.version}: {counts[target.name]} chunks"
+              f"{' (hybrid: vectors + BM25)' if target.bm25 is not None else ''}"
+              f"{f' ({target.compact.mode} compact store)' if target.compact is not None else ''}"
+              f"{' (snapshot)' if target.snapshot is not None else ''}")
+    print()
+
     print("Enter your search query (type 'exit' to quit):")
     while True:
         user_input = input("Search: ").strip()
@@ -84,6 +386,6 @@ if __name__ == "__main__":
             print("Exiting search.")
             break
         if user_input:
-            search(user_input)
+            print_hits(service.search(user_input))
         else:
             print("Please enter a valid query.")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+snapshot.py
+────────────────────────────────────────────────────────────────────
+Immutable, memory-mapped snapshot of one collection, for search
+processes that should start in milliseconds.
+
+Opening Chroma means a ``PersistentClient``, its SQLite and HNSW
+segments and, per process, a private copy of the vectors in RAM.  A
+snapshot is exported once (``--snapshot`` on the indexers, or
+``python tools/snapshot.py --collection NAME``) into the collection's
+state directory, ``chroma_db/collections/<name>/snapshot/``:
+
+* ``vectors.npy``    — unit-length float32 vectors, one row per chunk
+* ``ids.npy``        — row → chunk ID
+* ``id_order.npy``   — rows sorted by chunk ID (ID look-ups by bisection)
+* ``offsets.npy``    — (rows + 1, 2) byte offsets into the two blobs
+* ``documents.bin``  — every chunk's text, UTF-8, back to back
+* ``metadatas.bin``  — every chunk's metadata, JSON, back to back
+* ``snapshot.json``  — collection, registry version, shape
+
+Readers ``mmap`` every file read-only: opening a snapshot reads only
+the small headers, and all processes on a host share one physical copy
+of the pages through the OS page cache.  Files are never modified —
+a new export is written aside and swapped in, and a process that still
+maps the old one keeps a consistent view until it reopens.
+
+A snapshot records the registry version it was taken at; readers
+(tools/search.py, the Lab 5 agent) only use it while that is still the
+collection's current version, and fall back to Chroma otherwise.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 1.  Configuration                                                ║
+# ╚════════════════════════════════════════════════════════════════╝
+SNAPSHOT_DIR_NAME = "snapshot"       # sub-folder of a collection's state directory
+SCAN_BLOCK        = 65_536           # rows scored per step
+READ_PAGE         = 5000             # chunks per collection.get() while exporting
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 2.  Reader                                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+def _map(path: Path) -> mmap.mmap | bytes:
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+
+class Snapshot:
+    """Read-only view of one exported collection (see module docstring)."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        info = json.loads((self.directory / "snapshot.json").read_text(encoding="utf-8"))
+        self.collection: str = info["collection"]
+        self.version: int = info["version"]
+        self.n: int = info["n"]
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")[:self.n]
+        self.ids = np.load(self.directory / "ids.npy", mmap_mode="r")
+        self.id_order = np.load(self.directory / "id_order.npy", mmap_mode="r")
+        self.offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+        self._documents = _map(self.directory / "documents.bin")
+        self._metadatas = _map(self.directory / "metadatas.bin")
+
+    @classmethod
+    def load(cls, db_path: Path, version: int | None = None) -> "Snapshot | None":
+        """
+        The snapshot under `db_path` (a state directory), or None if there
+        is none — or, with `version`, if it was taken at another version.
+        """
+        directory = Path(db_path) / SNAPSHOT_DIR_NAME
+        if not (directory / "snapshot.json").exists():
+            return None
+        snapshot = cls(directory)
+        return snapshot if version is None or snapshot.version == version else None
+
+    # ── records ─────────────────────────────────────────────────────
+    def id(self, row: int) -> str:
+        return str(self.ids[row])
+
+    def document(self, row: int) -> str:
+        start, end = int(self.offsets[row, 0]), int(self.offsets[row + 1, 0])
+        return self._documents[start:end].decode("utf-8")
+
+    def metadata(self, row: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[row, 1]), int(self.offsets[row + 1, 1])
+        return json.loads(self._metadatas[start:end])
+
+    def rows(self, ids: Sequence[str]) -> List[int]:
+        """Row of each chunk ID, -1 for IDs not in the snapshot."""
+        found: List[int] = []
+        for cid in ids:
+            lo, hi = 0, self.n                     # bisect over the mmap'd ID order
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if str(self.ids[self.id_order[mid]]) < cid:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            row = int(self.id_order[lo]) if lo < self.n else -1
+            found.append(row if row >= 0 and str(self.ids[row]) == cid else -1)
+        return found
+
+    # ── search ──────────────────────────────────────────────────────
+    def search(self, query_vecs: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """Exact top `k` ``(row, cosine similarity)`` per query, best first."""
+        queries = np.atleast_2d(np.asarray(query_vecs, dtype=np.float32))
+        queries = queries / (np.linalg.norm(queries, axis=1, keepdims=True) + 1e-10)
+        k = min(k, self.n)
+        if k <= 0:
+            return [[] for _ in queries]
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_sims = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.n, SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, self.n)
+            sims = np.concatenate([best_sims, queries @ self.vectors[start:stop].T], axis=1)
+            rows = np.concatenate([best_rows, np.arange(start, stop)[None, :].repeat(len(queries), 0)],
+                                  axis=1)
+            if sims.shape[1] > k:
+                keep = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+                sims = np.take_along_axis(sims, keep, 1)
+                rows = np.take_along_axis(rows, keep, 1)
+            best_sims, best_rows = sims, rows
+        order = np.argsort(-best_sims, axis=1, kind="stable")
+        return [[(int(best_rows[q, i]), float(best_sims[q, i])) for i in order[q]]
+                for q in range(len(queries))]
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 3.  Export                                                       ║
+# ╚════════════════════════════════════════════════════════════════╝
+def export_collection(collection: Any, db_path: Path, version: int) -> Snapshot | None:
+    """
+    Write a snapshot of every chunk in `collection`, taken at registry
+    `version`, under `db_path` (None, and no snapshot, if it is empty).
+    """
+    total = collection.count()
+    if not total:
+        remove(db_path)
+        return None
+    directory = Path(db_path) / SNAPSHOT_DIR_NAME
+    tmp = directory.with_name(SNAPSHOT_DIR_NAME + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    ids: List[str] = []
+    offsets = np.zeros((total + 1, 2), dtype=np.int64)
+    vectors: np.memmap | None = None
+    with open(tmp / "documents.bin", "wb") as docs_fh, open(tmp / "metadatas.bin", "wb") as meta_fh:
+        while len(ids) < total:
+            page = collection.get(include=["embeddings", "documents", "metadatas"],
+                                  limit=READ_PAGE, offset=len(ids))
+            if not page["ids"]:
+                break
+            block = np.asarray(page["embeddings"], dtype=np.float32)[:total - len(ids)]
+            if vectors is None:
+                vectors = open_memmap(tmp / "vectors.npy", mode="w+", dtype=np.float32,
+                                      shape=(total, block.shape[1]))
+            vectors[len(ids):len(ids) + len(block)] = (
+                block / (np.linalg.norm(block, axis=1, keepdims=True) + 1e-10)
+            )
+            for i, (doc, meta) in enumerate(zip(page["documents"][:len(block)],
+                                                page["metadatas"][:len(block)])):
+                docs_fh.write((doc or "").encode("utf-8"))
+                meta_fh.write(json.dumps(meta or {}, separators=(",", ":")).encode("utf-8"))
+                offsets[len(ids) + i + 1] = docs_fh.tell(), meta_fh.tell()
+            ids.extend(page["ids"][:len(block)])
+    n = len(ids)
+    if vectors is None:                          # emptied before the first page
+        shutil.rmtree(tmp, ignore_errors=True)
+        remove(db_path)
+        return None
+    vectors.flush()
+    dim = int(vectors.shape[1])
+    if n < total:                                # collection shrank while exporting
+        trimmed = tmp / "vectors.trim.npy"       # vectors.npy itself still holds `total` rows
+        np.save(trimmed, vectors[:n])
+        del vectors
+        os.replace(trimmed, tmp / "vectors.npy")
+        offsets = offsets[:n + 1]
+    else:
+        del vectors                              # close the memmap before the rename
+
+    id_array = np.array(ids, dtype=str)
+    np.save(tmp / "ids.npy", id_array)
+    np.save(tmp / "id_order.npy", np.argsort(id_array, kind="stable"))
+    np.save(tmp / "offsets.npy", offsets)
+    (tmp / "snapshot.json").write_text(json.dumps({
+        "collection": collection.name, "version": version, "n": n, "dim": dim,
+    }), encoding="utf-8")
+
+    # Swap in; readers of the old snapshot keep their (unlinked) mapping
+    old = directory.with_name(SNAPSHOT_DIR_NAME + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if directory.exists():
+        os.replace(directory, old)
+    os.replace(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    return Snapshot(directory)
+
+
+def ensure(collection: Any, db_path: Path, version: int) -> Snapshot | None:
+    """The snapshot of `collection` at `version` — exported unless it already exists."""
+    return Snapshot.load(db_path, version) or export_collection(collection, db_path, version)
+
+
+def remove(db_path: Path) -> None:
+    """Delete the snapshot (e.g. when an indexer ran without ``--snapshot``)."""
+    shutil.rmtree(Path(db_path) / SNAPSHOT_DIR_NAME, ignore_errors=True)
+
+
+# ╔════════════════════════════════════════════════════════════════╗
+# 4.  Entry point                                                  ║
+# ╚════════════════════════════════════════════════════════════════╝
+if __name__ == "__main__":
+    import sys
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from registry import CollectionRegistry
+
+    parser = argparse.ArgumentParser(description="Export a collection of ./chroma_db as a snapshot")
+    parser.add_argument("--collection", action="append", dest="collections",
+                        help="collection to export (repeatable; default: all indexed ones)")
+    args = parser.parse_args()
+
+    from chromadb import PersistentClient
+
+    registry = CollectionRegistry(Path("./chroma_db"))
+    client = PersistentClient(path="./chroma_db")
+    for name in registry.resolve(args.collections):
+        snapshot = export_collection(client.get_collection(name), registry.state_dir(name),
+                                     registry.info(name).version)
+        if snapshot is None:
+            print(f"Collection '{name}' is empty — no snapshot")
+        else:
+            print(f"Snapshot of '{name}' v{snapshot.version}: {snapshot.n} chunks "
+                  f"→ {snapshot.directory}")
@@ -16,149 +16,265 @@ This significantly reduces the first-run latency for labs 3, 5, 7, etc.
    • Before starting Labs 3, 5, 7, or any agent-based labs
 
 ⚡ WHAT IT DOES:
-   1. Loads llama3.2 LLM into Ollama's memory
-   2. Downloads and loads the sentence transformer embedding model
-   3. Verifies ChromaDB is available for vector storage
-   4. Pre-populates MCP server's vector database (for Labs 6-7)
+   1. llm       — loads llama3.2 into Ollama's memory
+   2. embedder  — downloads and loads the sentence transformer embedding model
+   3. reranker  — downloads the Lab 5 cross-encoder re-ranker (tools/rerank.py)
+   4. chroma    — verifies ChromaDB is available for vector storage
+   5. vectordb  — pre-populates MCP server's vector database (for Labs 6-7)
+   6. mcp       — checks whether the MCP server is already running
+
+   The stages form a small task graph: each one starts as soon as the
+   stages it needs are done (only `vectordb` waits, for `embedder` and
+   `chroma`), so the LLM load, the model downloads and the MCP probe
+   all run at the same time and the whole warmup takes about as long as
+   its slowest stage.  Each stage has a timeout; a stage that fails or
+   times out only skips the stages that depend on it.
 
 💡 TIP: Run this once at the start of your session, then all labs will be fast!
 
 Usage:
-    python warmup_models.py
+    python warmup_models.py                      # everything
+    python warmup_models.py --only llm           # just the LLM
+    python warmup_models.py --skip vectordb mcp  # everything else
+    python warmup_models.py --report warmup.json # + JSON timing report
+    python warmup_models.py --report - | jq .    # report alone on stdout, progress on stderr
 """
 
+import argparse
+import json
 import os
+import queue
 import sys
+import threading
 import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-print("=" * 60)
-print("Model Warmup Script")
-print("=" * 60)
-print("\nThis script will load models into memory to reduce first-run latency.")
-print("Please wait while models are warmed up...\n")
 
 # ═══════════════════════════════════════════════════════════════════
-# 1. Warm up Ollama LLM (llama3.2)
+# 0. Task graph
 # ═══════════════════════════════════════════════════════════════════
-print("[1/3] Warming up Ollama LLM (llama3.2)...")
-start = time.time()
+class SkipStage(Exception):
+    """Raised by a stage that has nothing to do here (e.g. optional dependency missing)."""
+
+
+@dataclass
+class Stage:
+    name: str
+    title: str
+    run: Callable[[Dict[str, Any], Callable[[str], None]], Any]   # (dependency results, log)
+    deps: Tuple[str, ...] = ()
+    timeout: float = 300.0                  # seconds
+    required: bool = False                  # failure → exit code 1
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str                             # ok | failed | timeout | skipped
+    seconds: float = 0.0
+    start_offset: float = 0.0               # seconds after the warmup started
+    detail: str = ""
+    log: List[str] = field(default_factory=list)
+    value: Any = None
+
+    def to_json(self, stage: Stage) -> Dict[str, Any]:
+        return {
+            "name": self.name, "status": self.status,
+            "seconds": round(self.seconds, 3), "start_offset": round(self.start_offset, 3),
+            "deps": list(stage.deps), "timeout": stage.timeout,
+            "required": stage.required, "detail": self.detail,
+        }
+
+
+STATUS_ICON = {"ok": "✓", "failed": "✗", "timeout": "⏱️", "skipped": "⏭️"}
+
+
+def print_result(stage: Stage, result: StageResult) -> None:
+    """Print a finished stage as one block, so concurrent stages don't interleave."""
+    detail = f" — {result.detail}" if result.detail else ""
+    print(f"\n[{stage.name}] {stage.title}: {STATUS_ICON[result.status]} "
+          f"{result.status} ({result.seconds:.1f}s){detail}")
+    for line in result.log:
+        print(line)
+
+
+def run_graph(stages: List[Stage]) -> Tuple[List[StageResult], float]:
+    """
+    Run `stages`, each on its own daemon thread as soon as all of its
+    dependencies succeeded.  A stage still running at its timeout is
+    recorded as ``timeout`` and abandoned (its thread dies with the
+    process).  Returns the results in `stages` order and the wall time.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    results: Dict[str, StageResult] = {}
+    running: Dict[str, Tuple[float, float, List[str]]] = {}   # name → (start, deadline, log)
+    finished: "queue.Queue[Tuple[str, str, Any, str]]" = queue.Queue()
+    t0 = time.perf_counter()
+
+    def worker(stage: Stage, inputs: Dict[str, Any], log: List[str]) -> None:
+        try:
+            value = stage.run(inputs, log.append)
+            finished.put((stage.name, "ok", value, ""))
+        except SkipStage as e:
+            finished.put((stage.name, "skipped", None, str(e)))
+        except BaseException as e:                       # SystemExit from a stage too
+            finished.put((stage.name, "failed", None, f"{type(e).__name__}: {e}"))
+
+    def record(name: str, result: StageResult) -> None:
+        results[name] = result
+        print_result(by_name[name], result)
+
+    while len(results) < len(stages):
+        # Start every stage whose dependencies are settled
+        progress = True
+        while progress:
+            progress = False
+            for stage in stages:
+                if stage.name in results or stage.name in running:
+                    continue
+                blocked = [d for d in stage.deps if d not in results or results[d].status != "ok"]
+                failed = [d for d in blocked if d in results or d not in by_name]
+                if failed:
+                    why = ", ".join(f"{d} {results[d].status if d in results else 'not selected'}"
+                                    for d in failed)
+                    record(stage.name, StageResult(stage.name, "skipped",
+                                                   start_offset=time.perf_counter() - t0,
+                                                   detail=f"needs {why}"))
+                    progress = True
+                elif not blocked:
+                    now = time.perf_counter()
+                    log: List[str] = []
+                    running[stage.name] = (now, now + stage.timeout, log)
+                    inputs = {d: results[d].value for d in stage.deps}
+                    threading.Thread(target=worker, args=(stage, inputs, log),
+                                     name=f"warmup-{stage.name}", daemon=True).start()
+        if not running:
+            break
+
+        # Wait for the next stage to finish, or the earliest deadline
+        wait = max(0.0, min(deadline for _, deadline, _ in running.values()) - time.perf_counter())
+        try:
+            name, status, value, detail = finished.get(timeout=wait)
+        except queue.Empty:
+            now = time.perf_counter()
+            for name, (start, deadline, log) in list(running.items()):
+                if now >= deadline:
+                    del running[name]
+                    record(name, StageResult(name, "timeout", now - start, start - t0,
+                                             f"gave up after {by_name[name].timeout:g}s", list(log)))
+            continue
+        if name not in running:                          # finished after its timeout
+            continue
+        start, _, log = running.pop(name)
+        record(name, StageResult(name, status, time.perf_counter() - start, start - t0,
+                                 detail, log, value))
+
+    return [results[stage.name] for stage in stages], time.perf_counter() - t0
 
-try:
-    from langchain_ollama import ChatOllama
+
+# ═══════════════════════════════════════════════════════════════════
+# 1. Warm up Ollama LLM (llama3.2)
+# ═══════════════════════════════════════════════════════════════════
+def warm_llm(inputs: Dict[str, Any], log: Callable[[str], None]) -> str:
+    start = time.time()
+    try:
+        from langchain_ollama import ChatOllama
+    except ImportError:
+        log(f"   ✗ Error: langchain_ollama not installed")
+        log(f"   • Install with: pip install langchain-ollama")
+        raise
 
     # Get model name from environment or use default
     model_name = os.getenv("OLLAMA_MODEL", "llama3.2")
 
-    # Initialize the LLM (this loads the model into memory)
-    llm = ChatOllama(model=model_name, temperature=0.0)
-
-    # Make a simple test call to fully load the model
-    print(f"   • Loading {model_name} into memory...")
-    response = llm.invoke("Hello")
-    print(f"   ✓ Model loaded ({time.time() - start:.1f}s)")
-
-    # Pre-warm with actual business query to cache reasoning patterns
-    print(f"   • Pre-warming with business query...")
-    warmup_start = time.time()
-    test_response = llm.invoke("Which office has the highest revenue? Analyze: New York has $5.2M, Chicago has $4.8M, Boston has $3.1M")
-    warmup_elapsed = time.time() - warmup_start
-    print(f"   ✓ Query warmup complete ({warmup_elapsed:.1f}s)")
-
-    elapsed = time.time() - start
-    print(f"   ✓ Ollama LLM fully warmed ({elapsed:.1f}s total)")
-    print(f"   • Model: {model_name}")
-    print(f"   • First query latency reduced by pre-warming")
-
-except ImportError as e:
-    print(f"   ✗ Error: langchain_ollama not installed")
-    print(f"   • Install with: pip install langchain-ollama")
-    sys.exit(1)
-
-except Exception as e:
-    print(f"   ✗ Error loading Ollama LLM: {e}")
-    print(f"\n   Troubleshooting:")
-    print(f"   • Is Ollama running? Try: ollama serve &")
-    print(f"   • Is llama3.2 downloaded? Try: ollama pull llama3.2")
-    print(f"   • Check Ollama status: ollama list")
-    sys.exit(1)
+    try:
+        # Initialize the LLM (this loads the model into memory)
+        llm = ChatOllama(model=model_name, temperature=0.0)
+
+        # Make a simple test call to fully load the model
+        llm.invoke("Hello")
+        log(f"   ✓ {model_name} loaded into memory ({time.time() - start:.1f}s)")
+
+        # Pre-warm with actual business query to cache reasoning patterns
+        warmup_start = time.time()
+        llm.invoke("Which office has the highest revenue? Analyze: New York has $5.2M, Chicago has $4.8M, Boston has $3.1M")
+        log(f"   ✓ Query warmup complete ({time.time() - warmup_start:.1f}s)")
+    except Exception:
+        log(f"   Troubleshooting:")
+        log(f"   • Is Ollama running? Try: ollama serve &")
+        log(f"   • Is llama3.2 downloaded? Try: ollama pull llama3.2")
+        log(f"   • Check Ollama status: ollama list")
+        raise
+
+    log(f"   • Model: {model_name}")
+    log(f"   • First query latency reduced by pre-warming")
+    return model_name
+
 
 # ═══════════════════════════════════════════════════════════════════
 # 2. Warm up Sentence Transformer (all-MiniLM-L6-v2)
 # ═══════════════════════════════════════════════════════════════════
-print("\n[2/3] Warming up Sentence Transformer (all-MiniLM-L6-v2)...")
-start = time.time()
-
-try:
-    from sentence_transformers import SentenceTransformer
+def warm_embedder(inputs: Dict[str, Any], log: Callable[[str], None]) -> Any:
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        log(f"   ✗ Error: sentence-transformers not installed")
+        log(f"   • Install with: pip install sentence-transformers")
+        raise
 
     # Initialize the embedding model (this downloads and loads it)
-    print("   • Loading embedding model into memory...")
     embed_model = SentenceTransformer("all-MiniLM-L6-v2")
 
     # Make a test encoding to fully load the model
     test_embedding = embed_model.encode("test")
 
-    elapsed = time.time() - start
-    print(f"   ✓ Sentence Transformer loaded successfully ({elapsed:.1f}s)")
-    print(f"   • Model: all-MiniLM-L6-v2")
-    print(f"   • Embedding dimension: {len(test_embedding)}")
-
-except ImportError:
-    print(f"   ✗ Error: sentence-transformers not installed")
-    print(f"   • Install with: pip install sentence-transformers")
-    sys.exit(1)
+    log(f"   • Model: all-MiniLM-L6-v2")
+    log(f"   • Embedding dimension: {len(test_embedding)}")
+    return embed_model
 
-except Exception as e:
-    print(f"   ✗ Error loading Sentence Transformer: {e}")
-    sys.exit(1)
 
 # ═══════════════════════════════════════════════════════════════════
 # 3. Verify ChromaDB (optional - doesn't need warmup)
 # ═══════════════════════════════════════════════════════════════════
-print("\n[3/4] Verifying ChromaDB installation...")
-start = time.time()
-
-try:
-    import chromadb
-    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+def check_chroma(inputs: Dict[str, Any], log: Callable[[str], None]) -> None:
+    try:
+        import chromadb                                              # noqa: F401
+    except ImportError:
+        log(f"   ✗ Warning: chromadb not installed (needed for Labs 5, 7)")
+        log(f"   • Install with: pip install chromadb")
+        raise
 
     # Just verify import works - no need to create a client
-    elapsed = time.time() - start
-    print(f"   ✓ ChromaDB available ({elapsed:.3f}s)")
-
-    # Check if chroma_db directory exists
     chroma_path = Path("./chroma_db")
     if chroma_path.exists():
-        print(f"   • Found existing ChromaDB at {chroma_path}")
+        log(f"   • Found existing ChromaDB at {chroma_path}")
     else:
-        print(f"   • ChromaDB will be created when first used")
+        log(f"   • ChromaDB will be created when first used")
 
-except ImportError:
-    print(f"   ✗ Warning: chromadb not installed (needed for Labs 5, 7)")
-    print(f"   • Install with: pip install chromadb")
 
 # ═══════════════════════════════════════════════════════════════════
 # 4. Pre-populate MCP Server Vector Database (for Labs 6-7)
 # ═══════════════════════════════════════════════════════════════════
-print("\n[4/4] Pre-populating MCP server vector database...")
-start = time.time()
-
-try:
-    import pandas as pd
-    import chromadb
-    from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
-    from sentence_transformers import SentenceTransformer
+def populate_vector_db(inputs: Dict[str, Any], log: Callable[[str], None]) -> str:
+    embed_model = inputs["embedder"]
+    try:
+        import pandas as pd
+        import chromadb
+        from chromadb.config import Settings, DEFAULT_TENANT, DEFAULT_DATABASE
+    except ImportError:
+        log(f"   • This is OK for Labs 3-5, needed for Labs 6-7")
+        raise SkipStage("missing dependencies")
 
     try:
         import pdfplumber
         pdf_available = True
     except ImportError:
         pdf_available = False
-        print("   ⚠️  pdfplumber not installed - skipping PDF data")
+        log("   ⚠️  pdfplumber not installed - skipping PDF data")
 
     # Paths - use environment variable or /tmp if current directory not writable
-    import os
     import tempfile
 
     # Check for environment variable first (set by Docker)
@@ -166,7 +282,7 @@ try:
     if chroma_path_env:
         MCP_CHROMA_PATH = Path(chroma_path_env)
         MCP_CHROMA_PATH.mkdir(parents=True, exist_ok=True)
-        print(f"   ℹ️  Using ChromaDB path from env: {MCP_CHROMA_PATH}")
+        log(f"   ℹ️  Using ChromaDB path from env: {MCP_CHROMA_PATH}")
     else:
         # Try to use local directory first, fall back to /tmp if not writable
         try:
@@ -180,170 +296,247 @@ try:
             # Fall back to /tmp for Docker/HF Spaces
             MCP_CHROMA_PATH = Path(tempfile.gettempdir()) / "mcp_chroma_db"
             MCP_CHROMA_PATH.mkdir(parents=True, exist_ok=True)
-            print(f"   ⚠️  Using temp directory for ChromaDB: {MCP_CHROMA_PATH}")
+            log(f"   ⚠️  Using temp directory for ChromaDB: {MCP_CHROMA_PATH}")
 
     OFFICE_CSV = Path("./data/offices.csv")
     OFFICE_PDF = Path("./data/offices.pdf")
 
+    client = chromadb.PersistentClient(
+        path=str(MCP_CHROMA_PATH),
+        settings=Settings(),
+        tenant=DEFAULT_TENANT,
+        database=DEFAULT_DATABASE,
+    )
+
     # Check if vector DB already populated
-    populate_needed = False
-    if MCP_CHROMA_PATH.exists():
-        try:
-            client = chromadb.PersistentClient(
-                path=str(MCP_CHROMA_PATH),
-                settings=Settings(),
-                tenant=DEFAULT_TENANT,
-                database=DEFAULT_DATABASE,
-            )
+    try:
+        locations = client.get_collection("office_locations")
+        analytics = client.get_collection("office_analytics")
+        if locations.count() > 0 and analytics.count() > 0:
+            log(f"   • Locations: {locations.count()} documents")
+            log(f"   • Analytics: {analytics.count()} documents")
+            log(f"   • Path: {MCP_CHROMA_PATH}")
+            return "already populated"
+        log(f"   • MCP vector DB exists but is empty, repopulating...")
+    except Exception as e:
+        # Collections don't exist or are empty, populate them
+        log(f"   • Creating MCP vector database... ({str(e)[:50]})")
+
+    locations_coll = client.get_or_create_collection("office_locations")
+    analytics_coll = client.get_or_create_collection("office_analytics")
+
+    # Use already-loaded embedding model, behind the shared
+    # on-disk embedding cache (a re-run encodes nothing).  Cache
+    # misses are encoded in one batched call per collection.
+    from tools.embed_cache import EMBED_CACHE_DIR, EmbeddingCache
+    EMBED_BATCH_SIZE = int(os.getenv("WARMUP_EMBED_BATCH", "64"))
+
+    def encode_batch(texts):
+        return embed_model.encode(texts, batch_size=EMBED_BATCH_SIZE)
 
-            locations = client.get_collection("office_locations")
-            analytics = client.get_collection("office_analytics")
-
-            if locations.count() > 0 and analytics.count() > 0:
-                print(f"   ✓ MCP vector DB already populated ({elapsed:.3f}s)")
-                print(f"   • Locations: {locations.count()} documents")
-                print(f"   • Analytics: {analytics.count()} documents")
-                print(f"   • Path: {MCP_CHROMA_PATH}")
-            else:
-                print(f"   • MCP vector DB exists but is empty, repopulating...")
-                populate_needed = True
-
-        except Exception as e:
-            # Collections don't exist or are empty, populate them
-            print(f"   • Creating MCP vector database... ({str(e)[:50]})")
-            populate_needed = True
+    try:
+        embed_cache = EmbeddingCache("all-MiniLM-L6-v2", encode_batch)
+    except OSError:
+        embed_cache = EmbeddingCache(
+            "all-MiniLM-L6-v2", encode_batch,
+            cache_dir=Path(tempfile.gettempdir()) / EMBED_CACHE_DIR.name,
+        )
+
+    # Populate locations from PDF
+    if pdf_available and OFFICE_PDF.exists():
+        with pdfplumber.open(OFFICE_PDF) as pdf:
+            lines = []
+            for page in pdf.pages:
+                text = page.extract_text() or ""
+                for line in text.split('\n'):
+                    line = line.strip()
+                    if line:
+                        lines.append(line)
+
+        if lines:
+            # One batched encode and one bulk write for all lines
+            locations_coll.upsert(
+                ids=[f"pdf-{idx}" for idx in range(len(lines))],
+                embeddings=embed_cache.embed_documents(lines).tolist(),
+                documents=lines,
+                metadatas=[{"source": "offices.pdf", "line": idx} for idx in range(len(lines))],
+            )
+        log(f"   ✓ Populated {len(lines)} location documents from {OFFICE_PDF.name}")
+    elif not pdf_available:
+        log(f"   ⚠️  Skipping PDF (pdfplumber not installed)")
     else:
-        print(f"   • Creating MCP vector database...")
-        populate_needed = True
-
-    # Populate if needed
-    if populate_needed:
-        # Initialize
-        try:
-            client = chromadb.PersistentClient(
-                path=str(MCP_CHROMA_PATH),
-                settings=Settings(),
-                tenant=DEFAULT_TENANT,
-                database=DEFAULT_DATABASE,
+        log(f"   ⚠️  Skipping PDF ({OFFICE_PDF} not found)")
+
+    # Populate analytics from CSV
+    if OFFICE_CSV.exists():
+        df = pd.read_csv(OFFICE_CSV)
+        if len(df):
+            # Documents and metadata built column-wise, not row by row
+            texts = (df["city"].astype(str) + " office with "
+                     + df["employees"].astype(str) + " employees and $"
+                     + df["revenue_million"].astype(str) + "M revenue, opened in "
+                     + df["opened_year"].astype(str)).tolist()
+            metadatas = (
+                df[["city", "employees", "revenue_million", "opened_year"]]
+                .astype({"city": str, "employees": int,
+                         "revenue_million": float, "opened_year": int})
+                .assign(source="offices.csv")
+                .to_dict("records")
             )
-            locations_coll = client.get_or_create_collection("office_locations")
-            analytics_coll = client.get_or_create_collection("office_analytics")
-        except Exception as e:
-            print(f"   ❌ Failed to create ChromaDB client: {e}")
-            print(f"   ⚠️  Skipping vector DB warmup")
-            populate_needed = False  # Skip population if client creation fails
-
-        # Only continue if client was created successfully
-        if populate_needed:
-            # Use already-loaded embedding model
-            print(f"   • Using pre-loaded embedding model...")
-
-            # Populate locations from PDF
-            if pdf_available and OFFICE_PDF.exists():
-                print(f"   • Reading {OFFICE_PDF.name}...")
-                with pdfplumber.open(OFFICE_PDF) as pdf:
-                    lines = []
-                    for page in pdf.pages:
-                        text = page.extract_text() or ""
-                        for line in text.split('\n'):
-                            line = line.strip()
-                            if line:
-                                lines.append(line)
-    
-                print(f"   • Embedding {len(lines)} location documents...")
-                for idx, line in enumerate(lines):
-                    vector = embed_model.encode(line).tolist()
-                    locations_coll.add(
-                        ids=[f"pdf-{idx}"],
-                        embeddings=[vector],
-                        documents=[line],
-                        metadatas=[{"source": "offices.pdf", "line": idx}],
-                    )
-                print(f"   ✓ Populated {len(lines)} location documents")
-            else:
-                if not pdf_available:
-                    print(f"   ⚠️  Skipping PDF (pdfplumber not installed)")
-                elif not OFFICE_PDF.exists():
-                    print(f"   ⚠️  Skipping PDF ({OFFICE_PDF} not found)")
-    
-            # Populate analytics from CSV
-            if OFFICE_CSV.exists():
-                print(f"   • Reading {OFFICE_CSV.name}...")
-                df = pd.read_csv(OFFICE_CSV)
-    
-                print(f"   • Embedding {len(df)} analytics documents...")
-                for idx, row in df.iterrows():
-                    text = (f"{row['city']} office with {row['employees']} employees "
-                           f"and ${row['revenue_million']}M revenue, opened in {row['opened_year']}")
-                    vector = embed_model.encode(text).tolist()
-                    analytics_coll.add(
-                        ids=[f"csv-{idx}"],
-                        embeddings=[vector],
-                        documents=[text],
-                        metadatas={
-                            "source": "offices.csv",
-                            "city": row['city'],
-                            "employees": int(row['employees']),
-                            "revenue_million": float(row['revenue_million']),
-                            "opened_year": int(row['opened_year'])
-                        },
-                    )
-                print(f"   ✓ Populated {len(df)} analytics documents")
-            else:
-                print(f"   ⚠️  Skipping CSV ({OFFICE_CSV} not found)")
-    
-            elapsed = time.time() - start
-            print(f"   ✓ MCP vector DB populated successfully ({elapsed:.1f}s)")
-            print(f"   • Path: {MCP_CHROMA_PATH}")
-
-except ImportError as e:
-    print(f"   ⚠️  Skipping MCP vector DB (missing dependencies)")
-    print(f"   • This is OK for Labs 3-5, needed for Labs 6-7")
-
-except Exception as e:
-    print(f"   ⚠️  Could not populate MCP vector DB: {e}")
-    print(f"   • MCP server will populate it on first startup")
+            analytics_coll.upsert(
+                ids=[f"csv-{idx}" for idx in df.index],
+                embeddings=embed_cache.embed_documents(texts).tolist(),
+                documents=texts,
+                metadatas=metadatas,
+            )
+        log(f"   ✓ Populated {len(df)} analytics documents from {OFFICE_CSV.name}")
+    else:
+        log(f"   ⚠️  Skipping CSV ({OFFICE_CSV} not found)")
+
+    log(f"   • Path: {MCP_CHROMA_PATH}")
+    return "populated"
+
 
 # ═══════════════════════════════════════════════════════════════════
 # 5. Optional: Test MCP Server Connection (for Streamlit)
 # ═══════════════════════════════════════════════════════════════════
-print("\n[Optional] Testing MCP server connection...")
-
-try:
-    import requests
+def probe_mcp(inputs: Dict[str, Any], log: Callable[[str], None]) -> bool:
+    try:
+        import requests
+    except ImportError:
+        raise SkipStage("requests not installed")
 
     MCP_ENDPOINT = "http://127.0.0.1:8000/mcp/"
 
     # Try to connect to MCP server
-    response = requests.post(
-        MCP_ENDPOINT,
-        json={"jsonrpc": "2.0", "method": "tools/list", "id": 1},
-        timeout=2
-    )
+    try:
+        response = requests.post(
+            MCP_ENDPOINT,
+            json={"jsonrpc": "2.0", "method": "tools/list", "id": 1},
+            timeout=2
+        )
+    except requests.exceptions.ConnectionError:
+        log(f"   ℹ️  MCP server not running (this is OK)")
+        log(f"   • Start it before running Streamlit app:")
+        log(f"     python labs/common/lab6_mcp_server_solution.txt")
+        return False
 
     if response.status_code == 200:
-        print(f"   ✓ MCP server is running at {MCP_ENDPOINT}")
-        print(f"   • Streamlit app will connect instantly")
-    else:
-        print(f"   ⚠️  MCP server responded with status {response.status_code}")
+        log(f"   ✓ MCP server is running at {MCP_ENDPOINT}")
+        log(f"   • Streamlit app will connect instantly")
+        return True
+    log(f"   ⚠️  MCP server responded with status {response.status_code}")
+    return False
 
-except requests.exceptions.ConnectionError:
-    print(f"   ℹ️  MCP server not running (this is OK)")
-    print(f"   • Start it before running Streamlit app:")
-    print(f"     python labs/common/lab6_mcp_server_solution.txt")
 
-except ImportError:
-    print(f"   ⚠️  requests not installed (skipping MCP check)")
+# ═══════════════════════════════════════════════════════════════════
+# 6. Optional: Cross-encoder re-ranker (Lab 5)
+# ═══════════════════════════════════════════════════════════════════
+def warm_reranker(inputs: Dict[str, Any], log: Callable[[str], None]) -> None:
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        raise SkipStage("sentence-transformers not installed")
+    from tools.rerank import RERANK_MODEL
+
+    # Downloads the model into the Hugging Face cache, so the Lab 5 agent
+    # can load it offline; without it, results keep their retrieval order
+    model = CrossEncoder(RERANK_MODEL, device="cpu")
+    model.predict([("test query", "test passage")])
+    log(f"   • Model: {RERANK_MODEL}")
+
+
+STAGES = [
+    Stage("llm",      "Ollama LLM (llama3.2)",                 warm_llm,           timeout=300, required=True),
+    Stage("embedder", "Sentence Transformer (all-MiniLM-L6-v2)", warm_embedder,    timeout=300, required=True),
+    Stage("reranker", "Cross-encoder re-ranker (Lab 5)",       warm_reranker,      timeout=300),
+    Stage("chroma",   "ChromaDB installation",                 check_chroma,       timeout=60),
+    Stage("vectordb", "MCP server vector database",            populate_vector_db,
+          deps=("embedder", "chroma"), timeout=600),
+    Stage("mcp",      "MCP server connection",                 probe_mcp,          timeout=10),
+]
+
+
+def select(stages: List[Stage], only: Optional[List[str]], skip: List[str]) -> List[Stage]:
+    """`only` (plus what those stages depend on) minus `skip`, in graph order."""
+    by_name = {stage.name: stage for stage in stages}
+    wanted = set(by_name) if not only else set()
+    todo = list(only or [])
+    while todo:                                          # dependencies of --only stages
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(by_name[name].deps)
+    return [stage for stage in stages if stage.name in wanted and stage.name not in skip]
 
-except Exception as e:
-    print(f"   ⚠️  Could not check MCP server: {type(e).__name__}")
 
 # ═══════════════════════════════════════════════════════════════════
-# Summary
+# Main
 # ═══════════════════════════════════════════════════════════════════
-print("\n" + "=" * 60)
-print("✓ Warmup Complete!")
-print("=" * 60)
-print("\nModels are now loaded in memory. Your labs should start faster!")
-print("\nNote: Models will remain in memory until Ollama is restarted.")
-print("=" * 60)
+if __name__ == "__main__":
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(description="Warm up the models and vector DB used by the labs")
+    parser.add_argument("--only", nargs="+", choices=names, metavar="STAGE",
+                        help=f"run only these stages and what they need ({', '.join(names)})")
+    parser.add_argument("--skip", nargs="+", choices=names, default=[], metavar="STAGE",
+                        help="do not run these stages (nor the stages that need them)")
+    parser.add_argument("--timeout", type=float,
+                        help="override every stage's timeout (seconds)")
+    parser.add_argument("--report", metavar="FILE",
+                        help="write a JSON timing report to FILE ('-' for stdout)")
+    args = parser.parse_args()
+
+    # With the report on stdout, everything else goes to stderr so the
+    # output can be piped straight into a JSON parser
+    report_out = sys.stdout
+    if args.report == "-":
+        sys.stdout = sys.stderr
+
+    stages = select(STAGES, args.only, args.skip)
+    if args.timeout:
+        for stage in stages:
+            stage.timeout = args.timeout
+
+    print("=" * 60)
+    print("Model Warmup Script")
+    print("=" * 60)
+    print("\nThis script will load models into memory to reduce first-run latency.")
+    print(f"Warming up in parallel: {', '.join(stage.name for stage in stages) or 'nothing'}")
+
+    results, wall = run_graph(stages)
+
+    # ═══════════════════════════════════════════════════════════════
+    # Summary
+    # ═══════════════════════════════════════════════════════════════
+    print("\n" + "=" * 60)
+    for stage, result in zip(stages, results):
+        print(f"  {STATUS_ICON[result.status]} {stage.name:<9} {result.status:<8} "
+              f"{result.seconds:6.1f}s")
+    stage_sum = sum(result.seconds for result in results)
+    print(f"  Total: {wall:.1f}s wall clock ({stage_sum:.1f}s of stage time)")
+
+    failed = [s.name for s, r in zip(stages, results) if s.required and r.status != "ok"]
+    print("=" * 60)
+    if failed:
+        print(f"✗ Warmup failed: {', '.join(failed)}")
+    else:
+        print("✓ Warmup Complete!")
+        print("=" * 60)
+        print("\nModels are now loaded in memory. Your labs should start faster!")
+        print("\nNote: Models will remain in memory until Ollama is restarted.")
+    print("=" * 60)
+
+    if args.report:
+        report = json.dumps({
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - wall)),
+            "wall_seconds": round(wall, 3),
+            "stage_seconds": round(stage_sum, 3),
+            "ok": not failed,
+            "stages": [result.to_json(stage) for stage, result in zip(stages, results)],
+        }, indent=2)
+        if args.report == "-":
+            print(report, file=report_out)
+        else:
+            Path(args.report).write_text(report + "\n", encoding="utf-8")
+            print(f"Report: {args.report}")
+    sys.exit(1 if failed else 0)